@@ -1,44 +1,108 @@
-# Purpose: This file is the main file for the surreylm package. It is used to create the flask app and the database.
-import sqlalchemy
+# Purpose: This file is the main file for the surreylm package. It is used to create the flask app. The database schema
+# is created and upgraded separately with 'flask migrate', so creating the app does no database I/O.
+import time
+IMPORT_STARTED = time.perf_counter()  # Used to report how long importing flask and its extensions took.
 # Importing the required modules.
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 import os
 from flask_login import LoginManager
-import logging
-from sqlalchemy import create_engine
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 db = SQLAlchemy()
 db_connection_string = os.environ["db_connection_string"]
+DEPENDENCY_IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
 
 
 def create_app(database_uri=f'{db_connection_string}'):
     """
-    This function is used to create the flask app and the database.
+    This function is used to create the flask app. It does not touch the database; run 'flask migrate' to create or
+    upgrade the schema.
     :return: Returns the flask app.
     """
-    logging.basicConfig(filename='record.log',
-                        level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+    from .startup import StartupReport, init_startup_report
+    startup = StartupReport(DEPENDENCY_IMPORT_SECONDS)
     app = Flask(__name__)
     app.config['SECRET_KEY'] = os.environ["secret_key"]
     app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    from .db_pool import load_pool_config, init_db_pool
+    load_pool_config(app, os.environ)
+    app.config['AUDIT_LOG_FILE'] = os.environ.get("audit_log_file", "record.log")
+    app.config['AUDIT_BATCH_SIZE'] = int(os.environ.get("audit_batch_size", 50))
+    app.config['AUDIT_FLUSH_SECONDS'] = int(os.environ.get("audit_flush_seconds", 5))
+    app.config['CACHE_MAX_ENTRIES'] = int(os.environ.get("cache_max_entries", 1024))
+    app.config['CACHE_TTL'] = int(os.environ.get("cache_ttl", 300))
+    app.config['QUERY_BUDGET'] = int(os.environ.get("query_budget", 20))  # SQL statements per request.
+    app.config['USER_CACHE_TTL'] = int(os.environ.get("user_cache_ttl", 60))
+    app.config['LOGIN_MAX_FAILURES'] = int(os.environ.get("login_max_failures", 3))
+    app.config['LOGIN_IP_MAX_FAILURES'] = int(os.environ.get("login_ip_max_failures", 20))
+    app.config['LOGIN_WINDOW_SECONDS'] = int(os.environ.get("login_window_seconds", 900))
+    # The number of proxies, such as a load balancer, in front of the app that add to X-Forwarded-For.
+    app.config['TRUSTED_PROXY_HOPS'] = int(os.environ.get("trusted_proxy_hops", 0))
+    app.config['LOCKOUT_COOLDOWN_MINUTES'] = int(os.environ.get("lockout_cooldown_minutes", 30))
+    app.config['NOTIFY_THRESHOLDS'] = [int(days) for days in os.environ.get("notify_thresholds", "60,30,7").split(',')]
+    app.config['NOTIFY_INTERVAL_MINUTES'] = int(os.environ.get("notify_interval_minutes", 0))  # 0 turns it off.
+    app.config['NOTIFY_SENDER'] = os.environ.get("notify_sender", "file")
+    app.config['NOTIFY_FILE_DIR'] = os.environ.get("notify_file_dir", "notifications")
+    app.config['NOTIFY_FROM'] = os.environ.get("notify_from", "surreylm@surrey.ac.uk")
+    app.config['SMTP_HOST'] = os.environ.get("smtp_host", "localhost")
+    app.config['SMTP_PORT'] = int(os.environ.get("smtp_port", 25))
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get("archive_after_days", 365))
+    app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get("archive_batch_size", 500))
+    app.config['ARCHIVE_INTERVAL_MINUTES'] = int(os.environ.get("archive_interval_minutes", 0))  # 0 turns it off.
+    if app.config['TRUSTED_PROXY_HOPS']:
+        # request.remote_addr is then the client address the trusted proxies saw, used for the login throttle.
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_HOPS'])
+    startup.checkpoint('config')
     db.init_app(app)
+    init_db_pool(app)
+
+    from .audit import init_audit_logging, init_audit_writer
+    init_audit_logging(app)  # Sets up the process-wide audit logger once.
+    init_audit_writer(app)
+
+    from .cache import init_cache
+    init_cache(app)
+
+    from .user_cache import init_user_cache, load_session_user
+    init_user_cache(app)
+
+    from .throttle import init_login_throttle
+    init_login_throttle(app)
+
+    from .metrics import init_metrics
+    init_metrics(app)
+
+    from .query_budget import init_query_budget
+    init_query_budget(app)
+    startup.checkpoint('extensions')
 
     from .views import views
     from .auth import auth
     from .error_handlers import errors
+    from .api import api
+    startup.checkpoint('blueprint_imports')
 
     app.register_blueprint(views, url_prefix='/')
     app.register_blueprint(auth, url_prefix='/')
     app.register_blueprint(errors)
+    app.register_blueprint(api, url_prefix='/api/v1')
+    startup.checkpoint('blueprint_registration')
 
-    from .database_models import User, Software_owner, Vendor, Software
+    from .commands import register_commands
+    register_commands(app)
 
-    with app.app_context():
-        db.create_all()
+    if app.config['NOTIFY_INTERVAL_MINUTES']:
+        from .notifications import start_scheduler
+        start_scheduler(app)
+
+    if app.config['ARCHIVE_INTERVAL_MINUTES']:
+        from .archive import start_archiver
+        start_archiver(app)
 
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
+    login_manager.blueprint_login_views = {'api': None}  # API requests get a 401 rather than a login redirect.
     login_manager.init_app(app)
 
     @login_manager.user_loader
@@ -46,20 +110,10 @@ def create_app(database_uri=f'{db_connection_string}'):
         """
         This function is used to reload the user object from the user ID stored in the session.
         :param id: The user ID.
-        :return: Returns the user object.
+        :return: Returns a snapshot of the user, read through the user cache.
         """
-        return User.query.get(int(id))
+        return load_session_user(int(id))
 
+    startup.checkpoint('commands_and_login')
+    init_startup_report(app, startup)
     return app
-
-
-def create_database(app):
-    """
-    This function is used to create the database if it doesn't exist.
-    :param app: The flask app.
-    """
-    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
-    if not sqlalchemy.inspect(engine).has_table('users'):
-        with app.app_context():
-            db.create_all(app=app)
-            print('Created Database!')
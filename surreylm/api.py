@@ -0,0 +1,223 @@
+# Purpose of this file: This file contains the versioned JSON API for software, vendors and owners. Responses carry a
+# strong ETag built from the request URL and the cache generations of the tables the data is read from, so clients
+# that poll with If-None-Match get a 304 Not Modified, without any query being run, when nothing has changed.
+
+# Importing the required modules.
+from flask import Blueprint, jsonify, make_response, request, abort
+from flask_login import login_required
+from werkzeug.http import generate_etag
+from surreylm.cache import table_versions
+from surreylm.database_models import Vendor, Software_owner, Software
+from surreylm.pagination import keyset_paginate, page_size
+from surreylm.queries import software_query, software_page, vendor_lookup, owner_lookup
+
+api = Blueprint('api', __name__)  # Creating a blueprint for the API routes, registered under /api/v1.
+LOOKUP_LIMIT = 20  # The most results a typeahead lookup returns.
+
+
+def software_json(software):
+    """
+    This function is used to turn a software record into a JSON-serialisable dictionary.
+    :param software: The software record, with its vendor and owner loaded.
+    :return: Returns the dictionary.
+    """
+    return {'id': software.id, 'name': software.name, 'version': software.version,
+            'license_expiry': software.license_expiry.date().isoformat(), 'status': software.status,
+            'vendor_id': software.vendor_id, 'vendor': software.vendor.name, 'owner_id': software.owner_id,
+            'owner': f'{software.owner.first_name} {software.owner.last_name}'}
+
+
+def vendor_json(vendor):
+    """
+    This function is used to turn a vendor record into a JSON-serialisable dictionary.
+    :param vendor: The vendor record.
+    :return: Returns the dictionary.
+    """
+    return {'id': vendor.id, 'name': vendor.name, 'phone': vendor.phone, 'email': vendor.email}
+
+
+def owner_json(owner):
+    """
+    This function is used to turn an owner record into a JSON-serialisable dictionary.
+    :param owner: The owner record.
+    :return: Returns the dictionary.
+    """
+    return {'id': owner.id, 'email': owner.email, 'first_name': owner.first_name, 'last_name': owner.last_name,
+            'phone_extension': owner.phone_extension}
+
+
+def select_fields(item):
+    """
+    This function is used to apply the 'fields' request argument, a comma separated list of the fields to return.
+    :param item: The record dictionary.
+    :return: Returns the dictionary with only the requested fields, or all fields if none were requested.
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return item
+    wanted = {field.strip() for field in fields.split(',')}
+    return {key: value for key, value in item.items() if key in wanted}
+
+
+# The tables the data of each kind of record is read from, whose generations make up the ETag.
+SOFTWARE_TABLES = ('software', 'vendors', 'software_owners')
+VENDOR_TABLES = ('vendors',)
+OWNER_TABLES = ('software_owners',)
+
+
+def conditional_json(tables, load):
+    """
+    This function is used to build a JSON response with a strong ETag. The ETag is worked out before the data is
+    loaded, from the request URL and the generations of the tables the data is read from, so if the request's
+    If-None-Match header matches it a 304 Not Modified is returned without loading the data.
+    :param tables: The names of the tables the data is read from.
+    :param load: A function that loads the data to return.
+    :return: Returns the response.
+    """
+    etag = generate_etag(repr((request.full_path, table_versions(tables))).encode())
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = jsonify(load())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'  # Clients must revalidate, which is cheap with the ETag.
+    return response
+
+
+def page_json(tables, load_page, to_json):
+    """
+    This function is used to build the JSON response for one page of a list.
+    :param tables: The names of the tables the page is read from.
+    :param load_page: A function that fetches the Page of records.
+    :param to_json: The function used to turn a record into a dictionary.
+    :return: Returns the response.
+    """
+    def load():
+        page = load_page()
+        return {'items': [select_fields(to_json(item)) for item in page.items],
+                'next': page.next_cursor, 'prev': page.prev_cursor}
+    return conditional_json(tables, load)
+
+
+def list_page(model, sort_column):
+    """
+    This function is used to fetch one page of vendors or owners, sorted by the given column and then by id.
+    :param model: The model to list.
+    :param sort_column: The column to sort on.
+    :return: Returns the Page of records.
+    """
+    cursor = request.args.get('before') or request.args.get('after')
+    return keyset_paginate(model.query, sort_column, lambda record: getattr(record, sort_column.key), model.id,
+                           cursor=cursor, before=bool(request.args.get('before')),
+                           limit=page_size(request.args.get('per_page')))
+
+
+def lookup_limit():
+    """
+    This function is used to read the 'limit' request argument of the typeahead lookups.
+    :return: Returns the limit, between 1 and LOOKUP_LIMIT.
+    """
+    return max(1, min(request.args.get('limit', LOOKUP_LIMIT, type=int), LOOKUP_LIMIT))
+
+
+@api.errorhandler(401)
+@api.errorhandler(404)
+def api_error(error):
+    """
+    This function is used to return API errors as JSON rather than as HTML pages.
+    :param error: The error that occurred.
+    :return: Returns the error as JSON and its status code.
+    """
+    return jsonify({'error': error.name}), error.code
+
+
+@api.route('/software')
+@login_required
+def software_list():
+    """
+    This function is used to list software records. It accepts the same sort, filter and cursor arguments as the home
+    page.
+    :return: Returns one page of software records as JSON.
+    """
+    return page_json(SOFTWARE_TABLES, lambda: software_page(request.args)[0], software_json)
+
+
+@api.route('/software/<int:id>')
+@login_required
+def software_detail(id):
+    """
+    This function is used to get a software record.
+    :param id: The id of the software record.
+    :return: Returns the software record as JSON.
+    """
+    def load():
+        software = software_query().filter(Software.id == id).first() or abort(404)
+        return select_fields(software_json(software))
+    return conditional_json(SOFTWARE_TABLES, load)
+
+
+@api.route('/vendors')
+@login_required
+def vendor_list():
+    """
+    This function is used to list vendor records, sorted by name.
+    :return: Returns one page of vendor records as JSON.
+    """
+    return page_json(VENDOR_TABLES, lambda: list_page(Vendor, Vendor.name), vendor_json)
+
+
+@api.route('/vendors/lookup')
+@login_required
+def vendor_typeahead():
+    """
+    This function is used to look up vendors by the start of their name, for the software forms. The 'q' argument is
+    the prefix and 'limit' the most results to return, up to LOOKUP_LIMIT.
+    :return: Returns the id and name of the matching vendors as JSON.
+    """
+    return conditional_json(VENDOR_TABLES,
+                            lambda: {'items': vendor_lookup(request.args.get('q', ''), lookup_limit())})
+
+
+@api.route('/vendors/<int:id>')
+@login_required
+def vendor_detail(id):
+    """
+    This function is used to get a vendor record.
+    :param id: The id of the vendor record.
+    :return: Returns the vendor record as JSON.
+    """
+    return conditional_json(VENDOR_TABLES, lambda: select_fields(vendor_json(Vendor.query.get_or_404(id))))
+
+
+@api.route('/owners')
+@login_required
+def owner_list():
+    """
+    This function is used to list owner records, sorted by email.
+    :return: Returns one page of owner records as JSON.
+    """
+    return page_json(OWNER_TABLES, lambda: list_page(Software_owner, Software_owner.email), owner_json)
+
+
+@api.route('/owners/lookup')
+@login_required
+def owner_typeahead():
+    """
+    This function is used to look up owners by the start of their surname, full name surname first, or email, for the
+    software forms. The 'q' argument is the prefix and 'limit' the most results to return, up to LOOKUP_LIMIT.
+    :return: Returns the id and display name of the matching owners as JSON.
+    """
+    return conditional_json(OWNER_TABLES,
+                            lambda: {'items': owner_lookup(request.args.get('q', ''), lookup_limit())})
+
+
+@api.route('/owners/<int:id>')
+@login_required
+def owner_detail(id):
+    """
+    This function is used to get an owner record.
+    :param id: The id of the owner record.
+    :return: Returns the owner record as JSON.
+    """
+    return conditional_json(OWNER_TABLES,
+                            lambda: select_fields(owner_json(Software_owner.query.get_or_404(id))))
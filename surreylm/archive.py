@@ -0,0 +1,137 @@
+# Purpose of this file: This file contains the license archive for the License Management System. Licenses that expired
+# more than ARCHIVE_AFTER_DAYS ago are moved out of the software table into the software_archive table in batches, each
+# batch being one INSERT ... SELECT and one DELETE in its own transaction, so the software table and its indexes only
+# hold the licenses still being managed. Archived licenses can be browsed on the history page and restored.
+
+# Importing the required modules.
+import datetime
+import threading
+from sqlalchemy import DateTime, delete, insert, literal, select
+from sqlalchemy.orm import contains_eager
+from . import db
+from surreylm.audit import audit
+from surreylm.database_models import Software, Archived_software, Expiry_notification
+from surreylm.leases import acquire_lease
+from surreylm.pagination import keyset_paginate, page_size
+
+# The columns copied between the software and software_archive tables, apart from the id.
+COPIED_COLUMNS = ('name', 'version', 'license_expiry', 'vendor_id', 'owner_id')
+
+
+def archive_expired(older_than_days, batch_size=500, now=None):
+    """
+    This function is used to move the licenses that expired more than older_than_days ago into the archive. Each
+    batch is committed on its own, so a large backlog does not hold locks on the software table for long.
+    :param older_than_days: How long ago, in days, a license must have expired to be archived.
+    :param batch_size: The number of licenses moved per transaction.
+    :param now: The current date and time, defaults to now.
+    :return: Returns the number of licenses archived.
+    """
+    now = now or datetime.datetime.today()
+    cutoff = now - datetime.timedelta(days=older_than_days)
+    archived = 0
+    while True:
+        ids = [id for id, in (db.session.query(Software.id)
+                              .filter(Software.license_expiry < cutoff)
+                              .order_by(Software.license_expiry, Software.id)
+                              .limit(batch_size)
+                              .with_for_update())]
+        if not ids:
+            break
+        copied = select(Software.id, *(getattr(Software, name) for name in COPIED_COLUMNS),
+                        literal(now, DateTime)).where(Software.id.in_(ids))
+        db.session.execute(insert(Archived_software).from_select(('software_id',) + COPIED_COLUMNS +
+                                                                 ('archived_at',), copied))
+        db.session.execute(delete(Expiry_notification).where(Expiry_notification.software_id.in_(ids)),
+                           execution_options={'synchronize_session': False})
+        db.session.execute(delete(Software).where(Software.id.in_(ids)),
+                           execution_options={'synchronize_session': False})
+        db.session.commit()
+        archived += len(ids)
+        if len(ids) < batch_size:
+            break
+    return archived
+
+
+def restore_software(archive_id):
+    """
+    This function is used to move an archived license back into the software table. It keeps its old id unless a
+    new record has since been given that id.
+    :param archive_id: The id of the archived record.
+    :return: Returns the id of the restored software record, or None if the archived record does not exist.
+    """
+    record = db.session.get(Archived_software, archive_id)
+    if record is None:
+        return None
+    values = {name: getattr(record, name) for name in COPIED_COLUMNS}
+    if db.session.get(Software, record.software_id) is None:
+        values['id'] = record.software_id
+    software = Software(**values)
+    db.session.add(software)
+    db.session.delete(record)
+    db.session.commit()
+    return software.id
+
+
+def archive_page(args):
+    """
+    This function is used to fetch one page of the archived licenses, most recently expired first, filtered by the
+    name prefix, vendor and owner request arguments.
+    :param args: The request arguments.
+    :return: Returns the Page.
+    """
+    query = (Archived_software.query
+             .join(Archived_software.vendor)
+             .join(Archived_software.owner)
+             .options(contains_eager(Archived_software.vendor), contains_eager(Archived_software.owner)))
+    name = args.get('name', '').strip()
+    vendor_id = args.get('vendor_id', type=int)
+    owner_id = args.get('owner_id', type=int)
+    if name:
+        query = query.filter(Archived_software.name.startswith(name, autoescape=True))
+    if vendor_id:
+        query = query.filter(Archived_software.vendor_id == vendor_id)
+    if owner_id:
+        query = query.filter(Archived_software.owner_id == owner_id)
+    cursor = args.get('before') or args.get('after')
+    return keyset_paginate(query, Archived_software.license_expiry, lambda record: record.license_expiry,
+                           Archived_software.id, cursor=cursor, before=bool(args.get('before')), descending=True,
+                           limit=page_size(args.get('per_page')))
+
+
+def archive_from_config(app):
+    """
+    This function is used to archive the expired licenses using the app's archive settings.
+    :param app: The flask app.
+    :return: Returns the number of licenses archived.
+    """
+    with app.app_context():
+        archived = archive_expired(app.config['ARCHIVE_AFTER_DAYS'], app.config['ARCHIVE_BATCH_SIZE'])
+        if archived:
+            audit('archive', f'{archived} licenses expired more than {app.config["ARCHIVE_AFTER_DAYS"]} days ago '
+                             f'have been archived.', 'software', actor='scheduler')
+        return archived
+
+
+def start_archiver(app):
+    """
+    This function is used to start the background thread that archives the expired licenses every
+    ARCHIVE_INTERVAL_MINUTES. Each run first takes the 'license-archiver' lease, so only one worker archives.
+    :param app: The flask app.
+    :return: Returns the event that stops the archiver when set.
+    """
+    stop = threading.Event()
+    interval = app.config['ARCHIVE_INTERVAL_MINUTES'] * 60
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                with app.app_context():
+                    if not acquire_lease('license-archiver', 2 * interval):
+                        continue
+                archive_from_config(app)
+            except Exception:  # The archiver must keep running if one run fails.
+                app.logger.exception('License archive run failed.')
+
+    threading.Thread(target=run, name='license-archiver', daemon=True).start()
+    return stop
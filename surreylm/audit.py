@@ -0,0 +1,204 @@
+# Purpose of this file: This file contains the audit logging for the License Management System. A single process-wide
+# logger is configured once by create_app. Records are handed to a queue and written to disk on a background thread, so
+# logging an action from a request handler does not block on file I/O. Each event is also buffered per app and written
+# to the audit_events table in batches, so the history of a record can be queried on the admin audit page.
+
+# Importing the required modules.
+import atexit
+import datetime
+import json
+import logging
+import queue
+import threading
+import weakref
+from logging.handlers import QueueHandler, QueueListener
+from flask import current_app, has_app_context, has_request_context
+from flask_login import current_user
+from sqlalchemy import exc, inspect, insert
+from . import db
+from surreylm.database_models import Audit_event
+from surreylm.pagination import keyset_paginate
+
+AUDIT_FORMAT = ('%(asctime)s %(levelname)s %(name)s %(threadName)s : '
+                '[actor=%(actor)s action=%(action)s record=%(record_type)s:%(record_id)s] %(message)s')
+AUDIT_DEFAULTS = {'actor': '-', 'action': '-', 'record_type': '-', 'record_id': '-'}
+
+logger = logging.getLogger('surreylm')  # The package logger, shared with app.logger.
+audit_logger = logging.getLogger('surreylm.audit')  # The logger used for audit events.
+
+_listener = None  # The background listener that writes queued records to disk.
+_writers = weakref.WeakSet()  # The audit writers of the live apps, flushed when the process exits.
+
+
+def init_audit_logging(app):
+    """
+    This function is used to set up the process-wide audit logger. It only does any work the first time it is called,
+    so creating further apps (for example in tests) does not add duplicate handlers.
+    :param app: The flask app, used to read the AUDIT_LOG_FILE setting.
+    :return: Returns the background queue listener.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    file_handler = logging.FileHandler(app.config['AUDIT_LOG_FILE'])
+    file_handler.setFormatter(logging.Formatter(AUDIT_FORMAT, defaults=AUDIT_DEFAULTS))
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # Flushes any queued records when the process exits.
+    atexit.register(flush_audit_writers)  # Runs first, while the listener can still log any failure.
+    return _listener
+
+
+class AuditWriter:
+    """
+    This class is used to buffer the audit events for one flask app and write them to the audit_events table in
+    batches. A batch is written, in one INSERT on its own connection, once batch_size events are buffered, by a timer
+    flush_seconds after the first event of the batch was buffered, before the audit page is read, and when the process
+    exits.
+    """
+    def __init__(self, app, batch_size=50, flush_seconds=5):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.events = []
+        self.timer = None  # The timer that writes the buffer if it does not fill up first.
+        self.lock = threading.Lock()
+
+    def add(self, event):
+        """
+        This function is used to buffer an event, writing the buffer if it is full.
+        :param event: The dictionary of Audit_event column values.
+        :return: Returns nothing.
+        """
+        with self.lock:
+            self.events.append(event)
+            full = len(self.events) >= self.batch_size
+            if not full and self.timer is None:
+                self.timer = threading.Timer(self.flush_seconds, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        This function is used to write the buffered events to the database. Events that cannot be written are dropped
+        with a warning, as they are still in the log file.
+        :return: Returns the number of events written.
+        """
+        with self.lock:
+            events, self.events = self.events, []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not events:
+            return 0
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                connection.execute(insert(Audit_event.__table__), events)
+        except exc.SQLAlchemyError:
+            logger.exception('%d audit events could not be saved to the database.', len(events))
+            return 0
+        return len(events)
+
+
+def flush_audit_writers():
+    """
+    This function is used to write the events buffered by every app's audit writer, when the process exits.
+    :return: Returns nothing.
+    """
+    for writer in list(_writers):
+        writer.flush()
+
+
+def init_audit_writer(app):
+    """
+    This function is used to set up the buffered audit event writer for the flask app.
+    :param app: The flask app, used to read the AUDIT_BATCH_SIZE and AUDIT_FLUSH_SECONDS settings.
+    :return: Returns the audit writer.
+    """
+    writer = app.extensions['surreylm_audit_writer'] = AuditWriter(app, app.config['AUDIT_BATCH_SIZE'],
+                                                                   app.config['AUDIT_FLUSH_SECONDS'])
+    _writers.add(writer)  # Held weakly, so apps that are no longer used can be freed.
+    return writer
+
+
+def changed_fields(record, fields):
+    """
+    This function is used to find which fields of a record have been changed but not yet flushed, for the audit event.
+    :param record: The database record.
+    :param fields: The names of the fields to check.
+    :return: Returns a dictionary of field name to [old value, new value] for the fields whose value changed.
+    """
+    changes = {}
+    state = inspect(record)
+    for name in fields:
+        history = state.attrs[name].history
+        if history.has_changes():
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+            if str(old) != str(new):  # Form values arrive as strings, so '1' does not count as a change from 1.
+                changes[name] = [old, new]
+    return changes
+
+
+def audit(action, message, record_type=None, record_id=None, actor=None, level=logging.INFO, changes=None):
+    """
+    This function is used to record an audit event.
+    :param action: A short name for the action, e.g. 'add', 'update', 'delete' or 'login'.
+    :param message: The human-readable log message.
+    :param record_type: The type of record the action applies to, e.g. 'software', 'vendor', 'owner' or 'user'.
+    :param record_id: The id of the record the action applies to.
+    :param actor: The email of the user performing the action, defaults to the currently logged-in user.
+    :param level: The logging level of the event.
+    :param changes: A dictionary of field name to [old value, new value] for the fields the action changed.
+    :return: Returns nothing.
+    """
+    if actor is None and has_request_context() and current_user.is_authenticated:
+        actor = current_user.email
+    audit_logger.log(level, message, extra={'actor': actor or '-', 'action': action,
+                                            'record_type': record_type or '-',
+                                            'record_id': '-' if record_id is None else record_id})
+    if has_app_context() and 'surreylm_audit_writer' in current_app.extensions:
+        current_app.extensions['surreylm_audit_writer'].add({
+            'occurred_at': datetime.datetime.utcnow(), 'level': logging.getLevelName(level), 'actor': actor,
+            'action': action, 'record_type': record_type, 'record_id': record_id, 'message': message,
+            'changes': json.dumps(changes, default=str) if changes else None})
+
+
+def audit_page(record_type=None, record_id=None, actor=None, start=None, end=None, cursor=None, before=False,
+               limit=50):
+    """
+    This function is used to fetch one page of audit events, newest first. Buffered events are written first, so the
+    page includes them.
+    :param record_type: Only include events for this type of record.
+    :param record_id: Only include events for the record with this id.
+    :param actor: Only include events by this user email.
+    :param start: Only include events at or after this date and time (UTC).
+    :param end: Only include events before this date and time (UTC).
+    :param cursor: The cursor to continue from, or None for the first page.
+    :param before: True to fetch the page before the cursor rather than the page after it.
+    :param limit: The number of events per page.
+    :return: Returns the Page.
+    """
+    current_app.extensions['surreylm_audit_writer'].flush()
+    query = Audit_event.query
+    if record_type:
+        query = query.filter(Audit_event.record_type == record_type)
+    if record_id is not None:
+        query = query.filter(Audit_event.record_id == record_id)
+    if actor:
+        query = query.filter(Audit_event.actor == actor)
+    if start:
+        query = query.filter(Audit_event.occurred_at >= start)
+    if end:
+        query = query.filter(Audit_event.occurred_at < end)
+    return keyset_paginate(query, Audit_event.occurred_at, lambda event: event.occurred_at, Audit_event.id,
+                           cursor=cursor, before=before, descending=True, limit=limit)
@@ -1,13 +1,16 @@
 # Purpose: This file contains the routes for the login and register pages.
 
 # Importing the required modules.
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+import logging
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app
 from .database_models import User
 from werkzeug.security import generate_password_hash, check_password_hash
 from . import db
 from flask_login import login_user, login_required, logout_user, current_user
 from .validations import Validate
-from . import create_app
+from .audit import audit
+from .unlock_users import cooldown_passed
+from .throttle import login_throttle, lock_user
 
 auth = Blueprint('auth', __name__)  # Creating a blueprint for the auth routes.
 
@@ -21,36 +24,47 @@ def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
+        throttle = login_throttle()
+        if throttle.ip_blocked(request.remote_addr):  # Rejected before the user is read or the password checked.
+            audit('login_throttled', f'{email} - Too many failed logins from {request.remote_addr}.', actor=email,
+                  level=logging.WARNING)
+            flash('Too many failed login attempts, please try again later.', category='error')
+            return render_template("login.html", user=current_user), 429
 
         user = User.query.filter_by(email=email).first()
+        if user and user.locked and cooldown_passed(user, current_app.config['LOCKOUT_COOLDOWN_MINUTES']):
+            user.locked = False
+            user.failed_login_attempts = 0
+            user.locked_at = None
+            db.session.commit()
+            throttle.succeeded(user.email)
+            audit('unlock', f'{user.email} - Lockout cooldown passed, account unlocked.', 'user', user.id,
+                  actor=user.email)
         if user and not user.locked:
             if check_password_hash(user.password, password):
                 flash('Welcome to the License Management System!', category='success')
                 login_user(user, remember=True)
-                create_app().logger.info(f'{user.email} - Logged in successfully.')
-                user.failed_login_attempts = 0
-                db.session.commit()
+                throttle.succeeded(user.email)
+                audit('login', f'{user.email} - Logged in successfully.', 'user', user.id, actor=user.email)
                 return redirect(url_for('views.home'))
             else:
                 flash('Incorrect login details, please try again or contact your system administrator.',
                       category='error')
-                create_app().logger.info(f'{user.email} - Invalid password entered.')
-                user.failed_login_attempts += 1
-                db.session.commit()
-                if user.failed_login_attempts >= 3:
-                    create_app().logger.info(f'{user.email} - Incorrect password attempts exceeded 3.'
-                                             f'Account has been locked.')
-                    user.locked = True
-                    db.session.commit()
-                    flash('Incorrect login details, please try again or contact your system administrator.',
-                          category='error')
+                audit('login_failed', f'{user.email} - Invalid password entered.', 'user', user.id,
+                      actor=user.email)
+                if throttle.failed(user.email, request.remote_addr) and lock_user(user.email,
+                                                                                  throttle.max_failures):
+                    audit('lock', f'{user.email} - Incorrect password attempts exceeded {throttle.max_failures}. '
+                                  f'Account has been locked.', 'user', user.id, actor=user.email)
         else:
+            throttle.failed(email or '', request.remote_addr)
             if user and user.locked:
-                create_app().logger.info(f'{email} - Account locked login attempt failed.')
+                audit('login_failed', f'{email} - Account locked login attempt failed.', 'user', user.id,
+                      actor=email)
                 flash('Account has been locked, please contact your system administrator.',
                       category='error')
             else:
-                create_app().logger.info(f'{email} - Invalid email login attempt failed.')
+                audit('login_failed', f'{email} - Invalid email login attempt failed.', actor=email)
                 flash('Incorrect login details, please try again or contact your system administrator.',
                       category='error')
 
@@ -85,7 +99,7 @@ def sign_up():
                             password=generate_password_hash(password1, method='sha256'))
             db.session.add(new_user)
             db.session.commit()
-            create_app().logger.info(f'{email} - Account created.')
+            audit('register', f'{email} - Account created.', 'user', new_user.id, actor=email)
             login_user(new_user, remember=True)
             flash('Account created!', category='success')
             return redirect(url_for('views.home'))
@@ -99,6 +113,6 @@ def logout():
     This function is used to logout the user.
     :return: Returns a redirect to the login page.
     """
-    create_app().logger.info(f'{current_user.email} - Logged out.')
+    audit('logout', f'{current_user.email} - Logged out.', 'user', current_user.id)
     logout_user()
     return redirect(url_for('auth.login'))
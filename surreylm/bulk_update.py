@@ -0,0 +1,86 @@
+# Purpose of this file: This file contains the bulk license actions for the License Management System: extending the
+# expiry date by a number of months, setting a new expiry date, and reassigning the owner or vendor. The records are
+# chosen by id or by the software list filters, and each action runs as one UPDATE statement.
+
+# Importing the required modules.
+from sqlalchemy import DateTime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from . import db
+from surreylm.database_models import Software
+from surreylm.queries import filter_software
+
+BULK_ACTIONS = ('extend', 'set_expiry', 'reassign_owner', 'reassign_vendor')
+
+
+class add_months(FunctionElement):
+    """
+    This class is used to add a number of months to a date in SQL, using each database's own date arithmetic.
+    """
+    type = DateTime()
+    name = 'add_months'
+    inherit_cache = True
+
+
+@compiles(add_months)
+def compile_add_months(element, compiler, **kw):
+    """
+    This function is used to write add_months for MySQL, which keeps the day within the new month.
+    """
+    column, months = element.clauses
+    return f'DATE_ADD({compiler.process(column, **kw)}, INTERVAL {compiler.process(months, **kw)} MONTH)'
+
+
+@compiles(add_months, 'sqlite')
+def compile_add_months_sqlite(element, compiler, **kw):
+    """
+    This function is used to write add_months for SQLite, in the same text format SQLAlchemy stores dates in. SQLite
+    rolls a day past the end of the new month over into the month after, so the result is capped at the last day of
+    the new month, as MySQL does: 31 January plus 1 month is 29 February in a leap year.
+    """
+    column, months = (compiler.process(clause, **kw) for clause in element.clauses)
+    return (f"min(strftime('%Y-%m-%d %H:%M:%f000', {column}, '+' || {months} || ' months'), "
+            f"strftime('%Y-%m-%d', {column}, 'start of month', '+' || ({months} + 1) || ' months', '-1 day') || "
+            f"strftime(' %H:%M:%f000', {column}))")
+
+
+def summarize_ids(ids, limit=50):
+    """
+    This function is used to write a list of record ids compactly for the audit log, with runs of consecutive ids
+    written as ranges.
+    :param ids: The sorted ids.
+    :param limit: The most ranges to write before the rest are only counted.
+    :return: Returns the summary, for example '1-4, 7, 9-12'.
+    """
+    ranges = []
+    for id in ids:
+        if ranges and id == ranges[-1][1] + 1:
+            ranges[-1][1] = id
+        else:
+            ranges.append([id, id])
+    parts = [f'{start}-{end}' if start != end else str(start) for start, end in ranges[:limit]]
+    if len(ranges) > limit:
+        parts.append(f'and {sum(end - start + 1 for start, end in ranges[limit:])} more')
+    return ', '.join(parts)
+
+
+def bulk_update_software(values, ids=None, filters=None):
+    """
+    This function is used to apply one change to a set of software records in a single UPDATE. The ids of the records
+    are read first, locking them on databases that support it, so the audit entry lists exactly the records changed.
+    :param values: The dictionary of Software columns to new values or SQL expressions.
+    :param ids: The ids of the records to change.
+    :param filters: The software list filters choosing the records to change, used when ids is None.
+    :return: Returns the sorted list of ids changed.
+    """
+    query = Software.query
+    if ids is not None:
+        query = query.filter(Software.id.in_(ids))
+    else:
+        query = filter_software(query, filters)
+    changed = sorted(id for id, in query.with_entities(Software.id).with_for_update())
+    if changed:
+        # The row version is moved on too, so edit forms loaded before the change report a conflict.
+        query.update({**values, Software.row_version: Software.row_version + 1}, synchronize_session=False)
+    db.session.commit()
+    return changed
@@ -0,0 +1,238 @@
+# Purpose of this file: This file contains the read-through cache used for the list pages. Cached values are tagged
+# with the tables they were read from, and a commit that changes one of those tables invalidates them, so a read never
+# serves data from before a write. The invalidation state is kept in the cache backend with the values, so a backend
+# shared between processes invalidates across all of them.
+
+# Importing the required modules.
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from . import db
+
+MISSING = object()  # Returned by backends when a key is not cached.
+
+
+class LRUCache:
+    """
+    This class is used to hold cached values in process memory. The least recently used entry is evicted once
+    max_entries is reached, and entries expire ttl seconds after they were set.
+
+    Any object with the same get, set, incr and clear methods can be used as a cache backend instead, for example one
+    backed by a server shared between processes.
+    """
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        This function is used to get a cached value.
+        :param key: The cache key.
+        :return: Returns the value, or MISSING if it is not cached or has expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        This function is used to cache a value.
+        :param key: The cache key.
+        :param value: The value to cache.
+        :param ttl: The number of seconds to keep the value for, defaults to the cache's ttl.
+        :return: Returns nothing.
+        """
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        This function is used to remove a cached value.
+        :param key: The cache key.
+        :return: Returns nothing.
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def incr(self, key):
+        """
+        This function is used to add 1 to a counter that does not expire. A missing counter, for example one that has
+        been evicted, starts again from the current time in nanoseconds, so it never goes back to an earlier value.
+        :param key: The cache key of the counter.
+        :return: Returns the new value of the counter.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            value = entry[0] + 1 if entry is not None else time.time_ns()
+            self.entries[key] = (value, float('inf'))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            return value
+
+    def clear(self):
+        """
+        This function is used to remove all cached values.
+        :return: Returns nothing.
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+class Cache:
+    """
+    This class is used to read through a cache backend. Each table has a generation counter, held in the backend, that
+    is part of the key of every value read from it. Invalidating a table bumps its generation, so older values are
+    never looked up again, by this process or any other sharing the backend, and age out of the backend.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def generation(self, table):
+        """
+        This function is used to get the current generation of a table.
+        :param table: The name of the table.
+        :return: Returns the generation number.
+        """
+        value = self.backend.get(('generation', table))
+        if value is MISSING:
+            value = self.backend.incr(('generation', table))
+        return value
+
+    def key(self, name, tables):
+        """
+        This function is used to build the cache key for a value read from the given tables.
+        :param name: The name of the value.
+        :param tables: The names of the tables the value is read from.
+        :return: Returns the cache key.
+        """
+        return (name,) + tuple(self.generation(table) for table in tables)
+
+    def get_or_load(self, name, tables, loader, ttl=None):
+        """
+        This function is used to get a cached value, loading and caching it if it is not cached.
+        :param name: The name of the value.
+        :param tables: The names of the tables the value is read from.
+        :param loader: A function that loads the value from the database.
+        :param ttl: The number of seconds to keep the value for, defaults to the backend's ttl.
+        :return: Returns the value.
+        """
+        key = self.key(name, tables)
+        value = self.backend.get(key)
+        if value is MISSING:
+            value = loader()
+            self.backend.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *tables):
+        """
+        This function is used to invalidate every cached value read from the given tables.
+        :param tables: The names of the tables that have changed.
+        :return: Returns nothing.
+        """
+        for table in tables:
+            self.backend.incr(('generation', table))
+
+
+def init_cache(app, backend=None):
+    """
+    This function is used to set up the cache for the flask app.
+    :param app: The flask app, used to read the CACHE_MAX_ENTRIES and CACHE_TTL settings.
+    :param backend: The cache backend, defaults to an in-process LRUCache.
+    :return: Returns the cache.
+    """
+    if backend is None:
+        backend = LRUCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_TTL'])
+    app.extensions['surreylm_cache'] = Cache(backend)
+    if not event.contains(db.session, 'after_flush', track_changes):
+        event.listen(db.session, 'after_flush', track_changes)
+        event.listen(db.session, 'do_orm_execute', track_bulk_changes)
+        event.listen(db.session, 'after_commit', invalidate_changes)
+        event.listen(db.session, 'after_soft_rollback', discard_changes)
+    return app.extensions['surreylm_cache']
+
+
+def cached(name, tables, loader, ttl=None):
+    """
+    This function is used to read a value through the current app's cache.
+    :param name: The name of the value, including anything it depends on such as request arguments.
+    :param tables: The names of the tables the value is read from.
+    :param loader: A function that loads the value from the database.
+    :param ttl: The number of seconds to keep the value for.
+    :return: Returns the value.
+    """
+    return current_app.extensions['surreylm_cache'].get_or_load(name, tables, loader, ttl)
+
+
+def table_versions(tables):
+    """
+    This function is used to get a value that changes whenever the given tables may have changed, without reading them:
+    the tables' current generations, and the current ttl-long window. The window is needed because a backend that is
+    not shared between processes does not see the other processes' writes, which the cached values already allow for
+    by expiring after the ttl.
+    :param tables: The names of the tables.
+    :return: Returns the tuple of generations and the window number.
+    """
+    cache = current_app.extensions['surreylm_cache']
+    window = int(time.time() // max(current_app.config['CACHE_TTL'], 1))
+    return tuple(cache.generation(table) for table in tables) + (window,)
+
+
+def track_changes(session, flush_context):
+    """
+    This function is used to record which tables a flush wrote to, so they can be invalidated when the transaction
+    commits.
+    :param session: The database session.
+    :param flush_context: The flush context, not used.
+    :return: Returns nothing.
+    """
+    changed = session.info.setdefault('changed_tables', set())
+    for instance in session.new | session.dirty | session.deleted:
+        changed.add(instance.__table__.name)
+
+
+def track_bulk_changes(orm_execute_state):
+    """
+    This function is used to record which table a bulk INSERT, UPDATE or DELETE statement wrote to.
+    :param orm_execute_state: The ORM execution state.
+    :return: Returns nothing.
+    """
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            orm_execute_state.session.info.setdefault('changed_tables', set()).add(mapper.local_table.name)
+
+
+def invalidate_changes(session):
+    """
+    This function is used to invalidate the cached values read from the tables changed by a committed transaction.
+    :param session: The database session.
+    :return: Returns nothing.
+    """
+    changed = session.info.pop('changed_tables', None)
+    if changed and has_app_context() and 'surreylm_cache' in current_app.extensions:
+        current_app.extensions['surreylm_cache'].invalidate(*changed)
+
+
+def discard_changes(session, previous_transaction):
+    """
+    This function is used to forget the recorded changes when a transaction is rolled back.
+    :param session: The database session.
+    :param previous_transaction: The transaction that was rolled back, not used.
+    :return: Returns nothing.
+    """
+    session.info.pop('changed_tables', None)
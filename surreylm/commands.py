@@ -0,0 +1,133 @@
+# Purpose of this file: This file contains the flask command line commands for the License Management System. They are
+# run with 'flask --app main <command>'.
+
+# Importing the required modules.
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from surreylm import db
+from surreylm.audit import audit
+from surreylm.importer import import_software, iter_rows
+from surreylm.exporter import export_lines, EXPORT_FORMATS
+from surreylm.unlock_users import unlock_users
+from surreylm.notifications import notify_from_config
+from surreylm.search import rebuild_search_index
+from surreylm.archive import archive_expired
+from surreylm.migrations import MIGRATIONS, applied_migrations, migrate
+
+
+@click.command('import-licenses')
+@click.argument('file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'json', 'jsonl']),
+              help='The file format, defaults to the file extension.')
+@with_appcontext
+def import_licenses_command(file, file_format):
+    """
+    This function is used to import software licenses from a CSV or JSON file. Each row needs name, version,
+    license_expiry (YYYY-MM-DD), vendor (name) and owner (email or full name).
+    """
+    file_format = file_format or file.name.rsplit('.', 1)[-1].lower()
+    result = import_software(iter_rows(file, file_format))
+    for row_number, errors in result.errors:
+        click.echo(f'Row {row_number}: {" ".join(errors)}', err=True)
+    audit('import', f'{result.imported} software records imported from {file.name} with {len(result.errors)} rows '
+                    f'rejected.', 'software', actor='cli')
+    click.echo(f'Imported {result.imported} software records, {len(result.errors)} rows rejected.')
+
+
+@click.command('export-licenses')
+@click.argument('output', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'file_format', type=click.Choice(sorted(EXPORT_FORMATS)), default='csv',
+              help='The file format, defaults to csv.')
+@with_appcontext
+def export_licenses_command(output, file_format):
+    """
+    This function is used to export the software licenses, with their vendor and owner, to a CSV or JSON Lines file,
+    or to standard output if no file is given.
+    """
+    for line in export_lines(file_format):
+        output.write(line)
+
+
+@click.command('unlock-users')
+@click.option('--email', help='Only unlock the user with this email.')
+@with_appcontext
+def unlock_users_command(email):
+    """
+    This function is used to unlock users who have been locked out of their account.
+    """
+    unlocked = unlock_users(email)
+    audit('unlock', f'{unlocked} locked accounts unlocked from the command line.', 'user', actor='cli')
+    click.echo(f'Unlocked {unlocked} users.')
+
+
+@click.command('send-expiry-notices')
+@with_appcontext
+def send_expiry_notices_command():
+    """
+    This function is used to send the license expiry digests once, for running from cron instead of the background
+    scheduler.
+    """
+    sent = notify_from_config(current_app._get_current_object())
+    click.echo(f'Sent {sent} expiry digests.')
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """
+    This function is used to create the search index and fill it from the existing software, vendor and owner records.
+    """
+    rebuild_search_index()
+    click.echo('Search index rebuilt.')
+
+
+@click.command('archive-licenses')
+@click.option('--days', type=int, help='Archive licenses that expired more than this many days ago, defaults to the '
+                                       'ARCHIVE_AFTER_DAYS setting.')
+@with_appcontext
+def archive_licenses_command(days):
+    """
+    This function is used to move the licenses that expired long ago into the archive once, for running from cron
+    instead of the background archiver.
+    """
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    archived = archive_expired(days, current_app.config['ARCHIVE_BATCH_SIZE'])
+    audit('archive', f'{archived} licenses expired more than {days} days ago have been archived from the command '
+                     f'line.', 'software', actor='cli')
+    click.echo(f'Archived {archived} licenses.')
+
+
+@click.command('migrate')
+@click.option('--status', is_flag=True, help='List the migrations and whether they have been applied.')
+@with_appcontext
+def migrate_command(status):
+    """
+    This function is used to create or upgrade the database schema by applying the migrations that have not been
+    applied yet.
+    """
+    if status:
+        applied = applied_migrations(db.engine)
+        for version, name, upgrade in MIGRATIONS:
+            state = f'applied {applied[version]:%Y-%m-%d %H:%M}' if version in applied else 'pending'
+            click.echo(f'{version:>4}  {name:<45} {state}')
+        return
+    ran = migrate(db.engine)
+    for version, name in ran:
+        click.echo(f'Applied migration {version}: {name}.')
+    click.echo(f'Database is up to date ({len(ran)} migrations applied).')
+
+
+def register_commands(app):
+    """
+    This function is used to register the command line commands with the flask app.
+    :param app: The flask app.
+    :return: Returns nothing.
+    """
+    app.cli.add_command(import_licenses_command)
+    app.cli.add_command(export_licenses_command)
+    app.cli.add_command(unlock_users_command)
+    app.cli.add_command(send_expiry_notices_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(archive_licenses_command)
+    app.cli.add_command(migrate_command)
@@ -1,9 +1,68 @@
 # Purpose of this file: This file contains the database models for the License Management System.
 
 # Importing the required modules.
+import datetime
+import json
+from dateutil import relativedelta
+from sqlalchemy import case
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import validates
 from . import db
 from flask_login import UserMixin
 
+LICENSE_STATUSES = ('expired', 'expiring', 'ok')  # The license statuses, in order of urgency.
+
+
+def expiry_thresholds():
+    """
+    This function is used to work out the dates that separate the license statuses.
+    :return: Returns the current date and time, and the date and time 1 month from now.
+    """
+    today = datetime.datetime.today()
+    return today, today + relativedelta.relativedelta(months=+1)
+
+
+def normalize(value):
+    """
+    This function is used to normalize a vendor name or owner email for the case-insensitive uniqueness checks.
+    :param value: The name or email.
+    :return: Returns the value trimmed and in lower case.
+    """
+    return value.strip().lower() if value is not None else None
+
+
+def version_conflict(record, form_version):
+    """
+    This function is used to check whether a record has been changed since an edit form for it was loaded.
+    :param record: The record being edited.
+    :param form_version: The row_version the edit form was loaded with, or None if the form did not send one.
+    :return: Returns True if the record has changed since, else returns False.
+    """
+    return form_version is not None and form_version != record.row_version
+
+
+def normalized_default(*columns):
+    """
+    This function is used to fill a normalized column from its source columns on inserts that bypass the models, such
+    as bulk inserts.
+    :param columns: The names of the source columns, joined with a space.
+    :return: Returns the column default function.
+    """
+    def default(context):
+        values = [context.get_current_parameters().get(column) for column in columns]
+        return None if None in values else normalize(' '.join(values))
+    return default
+
+
+def owner_name_key(first_name, last_name):
+    """
+    This function is used to build the normalized owner name matched by the owner typeahead, surname first.
+    :param first_name: The owner's first name.
+    :param last_name: The owner's last name.
+    :return: Returns the name in lower case, or None if either part is missing.
+    """
+    return None if first_name is None or last_name is None else normalize(f'{last_name} {first_name}')
+
 
 class User(db.Model, UserMixin):
     """
@@ -18,6 +77,7 @@ class User(db.Model, UserMixin):
     admin = db.Column(db.Boolean, default=False)
     failed_login_attempts = db.Column(db.Integer, default=0)
     locked = db.Column(db.Boolean, default=False)
+    locked_at = db.Column(db.DateTime, nullable=True)  # When the account was locked, used for the cooldown unlock.
 
 class Software_owner(db.Model):
     """
@@ -29,6 +89,25 @@ class Software_owner(db.Model):
     first_name = db.Column(db.VARCHAR(50), nullable=False)
     last_name = db.Column(db.VARCHAR(50), nullable=False)
     phone_extension = db.Column(db.VARCHAR(50), nullable=False)
+    # The lower-case email, so duplicates are found with the unique index rather than by scanning lower(email).
+    email_normalized = db.Column(db.VARCHAR(50), unique=True, nullable=False, default=normalized_default('email'))
+    # The lower-case surname and first name, so the owner typeahead can match a name prefix from an index.
+    name_normalized = db.Column(db.VARCHAR(101), index=True, nullable=False,
+                                default=normalized_default('last_name', 'first_name'))
+    # Incremented by every UPDATE, which only matches the version it read, so concurrent edits are detected.
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': row_version}
+
+    @validates('email')
+    def normalize_email(self, key, email):
+        self.email_normalized = normalize(email)
+        return email
+
+    @validates('first_name', 'last_name')
+    def normalize_name(self, key, name):
+        names = {'first_name': self.first_name, 'last_name': self.last_name, key: name}
+        self.name_normalized = owner_name_key(names['first_name'], names['last_name'])
+        return name
 
 
 class Vendor(db.Model):
@@ -40,6 +119,15 @@ class Vendor(db.Model):
     name = db.Column(db.VARCHAR(50), unique=True, nullable=False)
     phone = db.Column(db.VARCHAR(50), nullable=False)
     email = db.Column(db.VARCHAR(50), nullable=False)
+    # The lower-case name, so duplicates are found with the unique index rather than by scanning lower(name).
+    name_normalized = db.Column(db.VARCHAR(50), unique=True, nullable=False, default=normalized_default('name'))
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': row_version}
+
+    @validates('name')
+    def normalize_name(self, key, name):
+        self.name_normalized = normalize(name)
+        return name
 
 
 class Software(db.Model):
@@ -48,10 +136,133 @@ class Software(db.Model):
     """
     __tablename__ = 'software'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.VARCHAR(50), nullable=False)
+    name = db.Column(db.VARCHAR(50), nullable=False, index=True)
     version = db.Column(db.VARCHAR(50), nullable=False)
-    license_expiry = db.Column(db.DateTime, nullable=False)
-    vendor_id = db.Column(db.Integer, db.ForeignKey('vendors.id'), nullable=False)
+    license_expiry = db.Column(db.DateTime, nullable=False, index=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendors.id'), nullable=False, index=True)
     vendor = db.relationship('Vendor', backref='software')
-    owner_id = db.Column(db.Integer, db.ForeignKey('software_owners.id'), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('software_owners.id'), nullable=False, index=True)
     owner = db.relationship('Software_owner', backref='software')
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': row_version}
+
+    @hybrid_property
+    def status(self):
+        """
+        This function is used to work out the status of the license: 'expired', 'expiring' (within 1 month) or 'ok'.
+        :return: Returns the license status.
+        """
+        today, add_month = expiry_thresholds()
+        if self.license_expiry < today:
+            return 'expired'
+        elif self.license_expiry < add_month:
+            return 'expiring'
+        return 'ok'
+
+    @status.expression
+    def status(cls):
+        """
+        This function is used to work out the license status in SQL, so it can be selected and grouped on.
+        :return: Returns the SQL status expression.
+        """
+        today, add_month = expiry_thresholds()
+        return case((cls.license_expiry < today, 'expired'), (cls.license_expiry < add_month, 'expiring'),
+                    else_='ok')
+
+    @classmethod
+    def status_filter(cls, status):
+        """
+        This function is used to filter on a license status. The status is turned into a range on license_expiry,
+        so the filter can use the license_expiry index.
+        :param status: The license status.
+        :return: Returns the SQL filter condition.
+        """
+        today, add_month = expiry_thresholds()
+        if status == 'expired':
+            return cls.license_expiry < today
+        elif status == 'expiring':
+            return (cls.license_expiry >= today) & (cls.license_expiry < add_month)
+        return cls.license_expiry >= add_month
+
+
+class Expiry_notification(db.Model):
+    """
+    This class is used to create the Expiry_notification table in the database. Each row records that an owner has
+    been sent a notice for a license crossing an expiry threshold, so it is never sent twice.
+    """
+    __tablename__ = 'expiry_notifications'
+    __table_args__ = (db.UniqueConstraint('software_id', 'threshold_days', 'license_expiry'),)
+    id = db.Column(db.Integer, primary_key=True)
+    software_id = db.Column(db.Integer, db.ForeignKey('software.id', ondelete='CASCADE'), nullable=False)
+    threshold_days = db.Column(db.Integer, nullable=False)
+    license_expiry = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=False)
+
+
+class Scheduler_lease(db.Model):
+    """
+    This class is used to create the Scheduler_lease table in the database. Each row names the process currently
+    running a background job, such as the expiry notifier, and when its claim runs out, so only one worker runs the job
+    however many workers start it.
+    """
+    __tablename__ = 'scheduler_leases'
+    name = db.Column(db.VARCHAR(50), primary_key=True)
+    holder = db.Column(db.VARCHAR(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class Schema_migration(db.Model):
+    """
+    This class is used to create the Schema_migration table in the database. Each row records a schema migration that
+    has been applied, so 'flask migrate' only runs the new ones.
+    """
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.VARCHAR(100), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False)
+
+
+class Archived_software(db.Model):
+    """
+    This class is used to create the Archived_software table in the database. Licenses that expired long ago are moved
+    here from the Software table by the archiver, so the Software table only holds the licenses still being managed.
+    software_id keeps the id the record had, so it can be restored under the same id.
+    """
+    __tablename__ = 'software_archive'
+    id = db.Column(db.Integer, primary_key=True)
+    software_id = db.Column(db.Integer, nullable=False, index=True)
+    name = db.Column(db.VARCHAR(50), nullable=False, index=True)
+    version = db.Column(db.VARCHAR(50), nullable=False)
+    license_expiry = db.Column(db.DateTime, nullable=False, index=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendors.id'), nullable=False, index=True)
+    vendor = db.relationship('Vendor')
+    owner_id = db.Column(db.Integer, db.ForeignKey('software_owners.id'), nullable=False, index=True)
+    owner = db.relationship('Software_owner')
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+
+class Audit_event(db.Model):
+    """
+    This class is used to create the Audit_event table in the database. Each row is one audited action, with who did
+    it, the record it applied to and the fields it changed, so the history of a record can be queried by index.
+    """
+    __tablename__ = 'audit_events'
+    __table_args__ = (db.Index('ix_audit_events_record', 'record_type', 'record_id', 'occurred_at'),
+                      db.Index('ix_audit_events_actor', 'actor', 'occurred_at'))
+    id = db.Column(db.Integer, primary_key=True)
+    occurred_at = db.Column(db.DateTime, nullable=False, index=True)
+    level = db.Column(db.VARCHAR(10), nullable=False)
+    actor = db.Column(db.VARCHAR(150))
+    action = db.Column(db.VARCHAR(50), nullable=False)
+    record_type = db.Column(db.VARCHAR(20))
+    record_id = db.Column(db.Integer)
+    message = db.Column(db.Text, nullable=False)
+    changes = db.Column(db.Text)  # A JSON object of field name to [old value, new value].
+
+    @property
+    def changed_fields(self):
+        """
+        This function is used to read the fields the action changed.
+        :return: Returns a dictionary of field name to [old value, new value], empty if no fields were recorded.
+        """
+        return json.loads(self.changes) if self.changes else {}
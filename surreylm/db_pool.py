@@ -0,0 +1,167 @@
+# Purpose of this file: This file contains the database engine tuning for the License Management System: connection pool
+# settings read from the app config, a statement timeout for MySQL, and pool metrics (checkout wait time and
+# connections in use) used to size workers against the database.
+
+# Importing the required modules.
+import threading
+import time
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import Pool, QueuePool
+from . import db
+
+
+class PoolStats:
+    """
+    This class is used to count connection pool checkouts, connections in use and the time spent waiting for a
+    connection, across every pool in the process.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def checked_out(self):
+        """
+        This function is used to record a connection being checked out of the pool.
+        :return: Returns nothing.
+        """
+        with self.lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def checked_in(self):
+        """
+        This function is used to record a connection being returned to the pool.
+        :return: Returns nothing.
+        """
+        with self.lock:
+            self.in_use -= 1
+
+    def waited(self, seconds):
+        """
+        This function is used to record the time spent waiting for a connection from the pool.
+        :param seconds: The time spent waiting.
+        :return: Returns nothing.
+        """
+        with self.lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+        if has_request_context():
+            g.db_wait = g.get('db_wait', 0.0) + seconds
+
+    def as_dict(self):
+        """
+        This function is used to get a snapshot of the pool metrics.
+        :return: Returns the metrics as a dictionary.
+        """
+        with self.lock:
+            return {'checkouts': self.checkouts, 'in_use': self.in_use, 'max_in_use': self.max_in_use,
+                    'waits': self.waits, 'wait_seconds': round(self.wait_seconds, 6),
+                    'average_wait_seconds': round(self.wait_seconds / self.waits, 6) if self.waits else 0.0,
+                    'max_wait_seconds': round(self.max_wait_seconds, 6)}
+
+
+pool_stats = PoolStats()  # The process-wide pool metrics.
+
+
+class TimedQueuePool(QueuePool):
+    """
+    This class is used as the connection pool for server databases. It records how long each checkout waits for a
+    connection to become free.
+    """
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.waited(time.perf_counter() - start)
+
+
+def load_pool_config(app, environ):
+    """
+    This function is used to read the connection pool settings into the app config.
+    :param app: The flask app.
+    :param environ: The environment variables to read the settings from.
+    :return: Returns nothing.
+    """
+    app.config['DB_POOL_SIZE'] = int(environ.get("db_pool_size", 5))
+    app.config['DB_MAX_OVERFLOW'] = int(environ.get("db_max_overflow", 10))
+    app.config['DB_POOL_TIMEOUT'] = int(environ.get("db_pool_timeout", 30))
+    # Azure drops idle connections after 4 minutes, so connections are recycled before then.
+    app.config['DB_POOL_RECYCLE'] = int(environ.get("db_pool_recycle", 230))
+    app.config['DB_POOL_PRE_PING'] = environ.get("db_pool_pre_ping", "true").lower() == "true"
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = int(environ.get("db_statement_timeout_ms", 30000))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+
+def engine_options(config):
+    """
+    This function is used to build the SQLAlchemy engine options from the app config. SQLite uses its own pooling, so
+    the pool settings only apply to server databases such as MySQL.
+    :param config: The app config.
+    :return: Returns the engine options.
+    """
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite':
+        return {}
+    return {'poolclass': TimedQueuePool, 'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'], 'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'], 'pool_pre_ping': config['DB_POOL_PRE_PING']}
+
+
+def init_db_pool(app):
+    """
+    This function is used to set up the pool metrics and the statement timeout for the flask app. It must be called
+    after db.init_app, once the engine exists.
+    :param app: The flask app.
+    :return: Returns nothing.
+    """
+    if not event.contains(Pool, 'checkout', on_checkout):
+        event.listen(Pool, 'checkout', on_checkout)
+        event.listen(Pool, 'checkin', on_checkin)
+
+    with app.app_context():
+        engine = db.engine
+    timeout = app.config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout and engine.dialect.name == 'mysql':
+        @event.listens_for(engine, 'connect')
+        def set_statement_timeout(dbapi_connection, connection_record):
+            """
+            This function is used to limit how long a SELECT can run on each new MySQL connection.
+            """
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f'SET SESSION max_execution_time = {int(timeout)}')
+            cursor.close()
+
+    @app.after_request
+    def add_server_timing(response):
+        """
+        This function is used to report the time the request spent waiting for a database connection in the
+        Server-Timing header.
+        :param response: The response.
+        :return: Returns the response.
+        """
+        if 'db_wait' in g:
+            response.headers.add('Server-Timing', f'db-wait;dur={g.db_wait * 1000:.2f}')
+        return response
+
+
+def on_checkout(dbapi_connection, connection_record, connection_proxy):
+    """
+    This function is used to count a connection checkout.
+    """
+    pool_stats.checked_out()
+
+
+def on_checkin(dbapi_connection, connection_record):
+    """
+    This function is used to count a connection being returned to the pool.
+    """
+    pool_stats.checked_in()
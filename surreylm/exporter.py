@@ -0,0 +1,82 @@
+# Purpose of this file: This file contains the license inventory export. Rows are fetched from the database in chunks
+# and written out one at a time, so memory use stays flat however many licenses are exported.
+
+# Importing the required modules.
+import csv
+import io
+import json
+from . import db
+from surreylm.database_models import Vendor, Software_owner, Software
+from surreylm.queries import filter_software
+
+CHUNK_SIZE = 1000  # The number of rows fetched from the database at a time.
+EXPORT_COLUMNS = ('id', 'name', 'version', 'license_expiry', 'vendor', 'owner', 'owner_name')
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def export_rows(args=None, chunk_size=CHUNK_SIZE):
+    """
+    This function is used to read the software records, with their vendor and owner, in chunks ordered by id. Each
+    chunk continues from the last id of the previous one, so no chunk re-reads earlier rows, and only plain column
+    values are loaded so nothing is held in the session between chunks.
+    :param args: Optional request arguments used to filter the records, as on the home page.
+    :param chunk_size: The number of rows fetched at a time.
+    :return: Yields a dictionary per software record, with the EXPORT_COLUMNS keys.
+    """
+    query = (db.session.query(Software.id, Software.name, Software.version, Software.license_expiry,
+                              Vendor.name, Software_owner.email, Software_owner.first_name,
+                              Software_owner.last_name)
+             .join(Vendor, Software.vendor_id == Vendor.id)
+             .join(Software_owner, Software.owner_id == Software_owner.id))
+    if args is not None:
+        query = filter_software(query, args)
+
+    last_id = 0
+    while True:
+        rows = query.filter(Software.id > last_id).order_by(Software.id).limit(chunk_size).all()
+        for id, name, version, license_expiry, vendor, email, first_name, last_name in rows:
+            yield {'id': id, 'name': name, 'version': version, 'license_expiry': license_expiry.date().isoformat(),
+                   'vendor': vendor, 'owner': email, 'owner_name': f'{first_name} {last_name}'}
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def iter_csv_lines(rows):
+    """
+    This function is used to turn export rows into CSV text, one line at a time.
+    :param rows: An iterator of export row dictionaries.
+    :return: Yields the header line and then one line per row.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_jsonl_lines(rows):
+    """
+    This function is used to turn export rows into JSON Lines text, one line at a time.
+    :param rows: An iterator of export row dictionaries.
+    :return: Yields one line per row.
+    """
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def export_lines(file_format, args=None):
+    """
+    This function is used to stream the license inventory in the given format.
+    :param file_format: 'csv' or 'jsonl'.
+    :param args: Optional request arguments used to filter the records.
+    :return: Returns an iterator of text lines.
+    """
+    rows = export_rows(args)
+    if file_format == 'csv':
+        return iter_csv_lines(rows)
+    return iter_jsonl_lines(rows)
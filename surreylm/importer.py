@@ -0,0 +1,192 @@
+# Purpose of this file: This file contains the bulk license import. Rows are stream-parsed from CSV or JSON, checked
+# with the same Validate rules as the add software form and inserted in large batches with one commit per batch.
+
+# Importing the required modules.
+import csv
+import datetime
+import json
+from sqlalchemy import exc, insert
+from . import db
+from surreylm.database_models import Vendor, Software_owner, Software
+from surreylm.validations import Validate
+
+BATCH_SIZE = 1000  # The number of rows inserted per commit.
+CHUNK_SIZE = 64 * 1024  # The number of characters read from a JSON file at a time.
+
+
+class ImportResult:
+    """
+    This class is used to hold the result of an import: the number of rows imported and the errors for each rejected
+    row, as (row number, [messages]) tuples.
+    """
+    def __init__(self):
+        self.imported = 0
+        self.errors = []
+
+
+def row_validator():
+    """
+    This function is used to create a Validate class that collects error messages instead of flashing them, so the
+    same rules can be used outside a request and reported per row.
+    :return: Returns the Validate subclass.
+    """
+    class RowValidate(Validate):
+        errors = []
+
+        @classmethod
+        def error(cls, message):
+            cls.errors.append(message)
+
+    return RowValidate
+
+
+def iter_csv(stream):
+    """
+    This function is used to read rows from a CSV file one at a time. The first line holds the column names.
+    :param stream: The text stream to read.
+    :return: Yields a dictionary per row.
+    """
+    yield from csv.DictReader(stream)
+
+
+def iter_json(stream, chunk_size=CHUNK_SIZE):
+    """
+    This function is used to read objects from a JSON array or a JSON Lines file one at a time, without loading the
+    whole file into memory.
+    :param stream: The text stream to read.
+    :param chunk_size: The number of characters read at a time.
+    :return: Yields each object in the file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,[]')  # Skips the array brackets and separators between objects.
+        if buffer:
+            try:
+                row, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield row
+                buffer = buffer[end:]
+                continue
+        elif eof:
+            return
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_rows(stream, file_format):
+    """
+    This function is used to read rows from a CSV or JSON file.
+    :param stream: The text stream to read.
+    :param file_format: 'csv' or 'json'.
+    :return: Returns an iterator of row dictionaries.
+    """
+    if file_format == 'csv':
+        return iter_csv(stream)
+    elif file_format in ('json', 'jsonl'):
+        return iter_json(stream)
+    raise ValueError(f'Unsupported import format: {file_format}')
+
+
+def lookup_cache():
+    """
+    This function is used to build the vendor and owner lookups used to resolve names in the import. Only the ids and
+    names are loaded, once per import.
+    :return: Returns a (vendors, owners) tuple of dictionaries from lower-case name or email to id.
+    """
+    vendors = {name.lower(): id for id, name in db.session.query(Vendor.id, Vendor.name)}
+    owners = {}
+    for id, email, first_name, last_name in db.session.query(Software_owner.id, Software_owner.email,
+                                                             Software_owner.first_name, Software_owner.last_name):
+        owners[f'{first_name} {last_name}'.lower()] = id
+        owners[email.lower()] = id
+    return vendors, owners
+
+
+def check_row(row, vendors, owners, validate):
+    """
+    This function is used to validate an import row and turn it into the values for a software record.
+    :param row: The row dictionary, with name, version, license_expiry, vendor and owner keys.
+    :param vendors: The vendor lookup from lookup_cache.
+    :param owners: The owner lookup from lookup_cache.
+    :param validate: The Validate class from row_validator.
+    :return: Returns a (values, errors) tuple. values is None if the row is not valid.
+    """
+    validate.errors = []
+    if not isinstance(row, dict):
+        return None, ['Row must be an object with name, version, license_expiry, vendor and owner.']
+    name = str(row.get('name') or '').strip()
+    version = str(row.get('version') or '').strip()
+    license_expiry = str(row.get('license_expiry') or '').strip()
+    vendor = str(row.get('vendor') or '').strip()
+    owner = str(row.get('owner') or '').strip()
+
+    validate.generic_entry(name)
+    validate.generic_entry(version)
+    converted_date = None
+    try:
+        converted_date = datetime.date.fromisoformat(license_expiry)
+    except ValueError:
+        validate.errors.append('Please enter a license expiry date as YYYY-MM-DD.')
+    vendor_id = vendors.get(vendor.lower())
+    owner_id = owners.get(owner.lower())
+    if vendor_id is None:
+        validate.errors.append(f'Vendor "{vendor}" does not exist.')
+    if owner_id is None:
+        validate.errors.append(f'Owner "{owner}" does not exist.')
+
+    if validate.errors:
+        return None, validate.errors
+    return {'name': name, 'version': version, 'license_expiry': converted_date, 'vendor_id': vendor_id,
+            'owner_id': owner_id}, []
+
+
+def insert_batch(batch, result):
+    """
+    This function is used to insert a batch of software records in a single statement and commit.
+    :param batch: A list of (row number, values) tuples.
+    :param result: The ImportResult to update.
+    :return: Returns nothing.
+    """
+    try:
+        db.session.execute(insert(Software), [values for _, values in batch])
+        db.session.commit()
+        result.imported += len(batch)
+    except exc.SQLAlchemyError as error:
+        db.session.rollback()
+        result.errors.extend((row_number, [f'Batch insert failed: {error.__class__.__name__}.'])
+                             for row_number, _ in batch)
+
+
+def import_software(rows, batch_size=BATCH_SIZE):
+    """
+    This function is used to import software records from an iterator of rows.
+    :param rows: An iterator of row dictionaries, from iter_rows.
+    :param batch_size: The number of rows inserted per commit.
+    :return: Returns an ImportResult.
+    """
+    result = ImportResult()
+    vendors, owners = lookup_cache()
+    validate = row_validator()
+    batch = []
+    row_number = 0
+    try:
+        for row_number, row in enumerate(rows, start=1):
+            values, errors = check_row(row, vendors, owners, validate)
+            if errors:
+                result.errors.append((row_number, errors))
+                continue
+            batch.append((row_number, values))
+            if len(batch) >= batch_size:
+                insert_batch(batch, result)
+                batch = []
+    except (ValueError, csv.Error) as error:  # The rest of the file could not be parsed.
+        result.errors.append((row_number + 1, [f'File could not be read: {error}']))
+    if batch:
+        insert_batch(batch, result)
+    return result
@@ -0,0 +1,40 @@
+# Purpose of this file: This file contains the leases used to run a background job in only one worker. Each worker that
+# starts a job's thread tries to take the job's lease before every run with a single conditional UPDATE, which only
+# succeeds for the worker already holding it or once the lease has run out.
+
+# Importing the required modules.
+import datetime
+import os
+import socket
+import uuid
+from sqlalchemy import exc, or_
+from . import db
+from surreylm.database_models import Scheduler_lease
+
+HOLDER = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'  # Identifies this process as a lease holder.
+
+
+def acquire_lease(name, seconds, holder=HOLDER, now=None):
+    """
+    This function is used to take or renew the lease on a background job.
+    :param name: The name of the job.
+    :param seconds: How long the lease lasts if it is not renewed.
+    :param holder: The process taking the lease, defaults to this process.
+    :param now: The current date and time (UTC), defaults to now.
+    :return: Returns True if the holder has the lease and should run the job, else returns False.
+    """
+    now = now or datetime.datetime.utcnow()
+    expires_at = now + datetime.timedelta(seconds=seconds)
+    taken = (Scheduler_lease.query
+             .filter(Scheduler_lease.name == name,
+                     or_(Scheduler_lease.holder == holder, Scheduler_lease.expires_at <= now))
+             .update({Scheduler_lease.holder: holder, Scheduler_lease.expires_at: expires_at},
+                     synchronize_session=False))
+    if not taken:
+        db.session.add(Scheduler_lease(name=name, holder=holder, expires_at=expires_at))
+    try:
+        db.session.commit()
+    except exc.IntegrityError:  # Another worker holds the lease.
+        db.session.rollback()
+        return False
+    return True
@@ -0,0 +1,100 @@
+# Purpose of this file: This file contains the log reader used by the admin logs page. The log file is read backwards
+# from the end in fixed-size blocks, so showing the newest entries costs the same however large the file has grown.
+
+# Importing the required modules.
+import datetime
+import os
+
+BLOCK_SIZE = 64 * 1024  # The number of bytes read from the file at a time.
+SCAN_LIMIT = 4 * 1024 * 1024  # The most bytes scanned for one page when filters match few lines.
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class LogEntry:
+    """
+    This class is used to hold one line of the log file.
+    """
+    def __init__(self, offset, text):
+        self.offset = offset
+        self.text = text
+        self.timestamp = None
+        self.level = None
+        parts = text.split(' ', 3)
+        if len(parts) >= 3:
+            try:
+                self.timestamp = datetime.datetime.strptime(f'{parts[0]} {parts[1].split(",")[0]}', TIME_FORMAT)
+                self.level = parts[2]
+            except ValueError:
+                pass  # Continuation lines, such as tracebacks, have no timestamp or level.
+
+
+class LogPage:
+    """
+    This class is used to hold one page of log entries, newest first.
+    """
+    def __init__(self, entries, next_offset):
+        self.entries = entries
+        self.next_offset = next_offset
+
+
+def reverse_lines(path, end=None, block_size=BLOCK_SIZE):
+    """
+    This function is used to read the lines of a file backwards, starting from the end.
+    :param path: The path of the file.
+    :param end: The byte offset to start reading backwards from, defaults to the end of the file.
+    :param block_size: The number of bytes read at a time.
+    :return: Yields (offset, line) tuples, where offset is the byte offset the line starts at.
+    """
+    with open(path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell() if end is None else max(0, min(end, file.tell()))
+        remainder = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            file.seek(position)
+            data = file.read(read_size) + remainder
+            lines = data.split(b'\n')
+            remainder = lines.pop(0)  # The first piece may be the end of a line that started in an earlier block.
+            line_end = position + len(data)
+            for line in reversed(lines):
+                line_start = line_end - len(line)
+                if line:
+                    yield line_start, line.decode('utf-8', errors='replace')
+                line_end = line_start - 1  # Skips the newline before this line.
+        if remainder:
+            yield 0, remainder.decode('utf-8', errors='replace')
+
+
+def read_log_page(path, before=None, limit=100, level=None, email=None, start=None, end=None,
+                  scan_limit=SCAN_LIMIT):
+    """
+    This function is used to read one page of log entries, newest first, that match the given filters.
+    :param path: The path of the log file.
+    :param before: The byte offset to continue from, as returned in the previous page's next_offset.
+    :param limit: The number of entries per page.
+    :param level: Only include entries with this log level.
+    :param email: Only include entries that mention this user email.
+    :param start: Only include entries logged at or after this datetime.
+    :param end: Only include entries logged before this datetime.
+    :param scan_limit: The most bytes to scan before returning a partial page.
+    :return: Returns a LogPage. next_offset is None when the start of the file has been reached.
+    """
+    if not os.path.exists(path):
+        return LogPage([], None)
+
+    entries = []
+    top = os.path.getsize(path) if before is None else min(before, os.path.getsize(path))
+    email = email.lower() if email else None
+    for offset, text in reverse_lines(path, end=before):
+        scanned = top - offset  # The bytes read back from where this page started, not the decoded characters.
+        entry = LogEntry(offset, text)
+        if start and entry.timestamp and entry.timestamp < start:
+            return LogPage(entries, None)  # The log is in time order, so nothing older can match.
+        if ((not level or entry.level == level) and (not email or email in text.lower())
+                and (not start or entry.timestamp) and (not end or (entry.timestamp and entry.timestamp < end))):
+            entries.append(entry)
+        if len(entries) == limit or scanned >= scan_limit:
+            return LogPage(entries, offset if offset > 0 else None)
+    return LogPage(entries, None)
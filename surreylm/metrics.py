@@ -0,0 +1,178 @@
+# Purpose of this file: This file contains the request metrics for the License Management System. Each request's
+# latency, status code, SQL query count and database time are added to in-process counters and histograms per
+# endpoint, which the admin-only /metrics route serves in the Prometheus text format. Recording a request only updates
+# a few numbers under a lock, so the metrics can stay on in production.
+
+# Importing the required modules.
+import bisect
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# The latency histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    This class is used to count observations into cumulative buckets, as a Prometheus histogram does.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last count is for observations above every bucket.
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        This function is used to add an observation.
+        :param value: The observed value.
+        :return: Returns nothing.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        This function is used to get the cumulative count for each bucket.
+        :return: Returns a list of (upper bound, count) tuples, ending with '+Inf'.
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class RequestMetrics:
+    """
+    This class is used to hold the request metrics for one flask app.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}  # (endpoint, method) to Histogram.
+        self.responses = {}  # (endpoint, method, status) to count.
+        self.queries = {}  # endpoint to the number of SQL statements run.
+        self.db_seconds = {}  # endpoint to the time spent running SQL statements.
+
+    def record(self, endpoint, method, status, seconds, queries, db_seconds):
+        """
+        This function is used to record a finished request.
+        :param endpoint: The endpoint that handled the request.
+        :param method: The HTTP method.
+        :param status: The response status code.
+        :param seconds: The time taken to handle the request.
+        :param queries: The number of SQL statements run.
+        :param db_seconds: The time spent running SQL statements.
+        :return: Returns nothing.
+        """
+        with self.lock:
+            histogram = self.latency.get((endpoint, method))
+            if histogram is None:
+                histogram = self.latency[(endpoint, method)] = Histogram()
+            histogram.observe(seconds)
+            key = (endpoint, method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+            self.queries[endpoint] = self.queries.get(endpoint, 0) + queries
+            self.db_seconds[endpoint] = self.db_seconds.get(endpoint, 0.0) + db_seconds
+
+    def render(self, gauges=None):
+        """
+        This function is used to write the metrics in the Prometheus text format.
+        :param gauges: Extra gauges to include, as a dictionary of metric name to (help text, value).
+        :return: Returns the metrics text.
+        """
+        lines = ['# HELP surreylm_request_duration_seconds Time taken to handle a request.',
+                 '# TYPE surreylm_request_duration_seconds histogram']
+        with self.lock:
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                for bound, count in histogram.cumulative():
+                    lines.append(f'surreylm_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'surreylm_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'surreylm_request_duration_seconds_count{{{labels}}} {histogram.count}')
+            lines += ['# HELP surreylm_requests_total Responses sent, by status code.',
+                      '# TYPE surreylm_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.responses.items()):
+                lines.append(f'surreylm_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} '
+                             f'{count}')
+            lines += ['# HELP surreylm_db_queries_total SQL statements run while handling requests.',
+                      '# TYPE surreylm_db_queries_total counter']
+            lines += [f'surreylm_db_queries_total{{endpoint="{endpoint}"}} {count}'
+                      for endpoint, count in sorted(self.queries.items())]
+            lines += ['# HELP surreylm_db_seconds_total Time spent running SQL statements while handling requests.',
+                      '# TYPE surreylm_db_seconds_total counter']
+            lines += [f'surreylm_db_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}'
+                      for endpoint, seconds in sorted(self.db_seconds.items())]
+        for name, (help_text, value) in (gauges or {}).items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    """
+    This function is used to set up the request metrics for the flask app.
+    :param app: The flask app.
+    :return: Returns the request metrics.
+    """
+    metrics = app.extensions['surreylm_metrics'] = RequestMetrics()
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', discard_failed_statement)
+
+    @app.before_request
+    def start_request_metrics():
+        """
+        This function is used to start timing the request and counting its SQL statements.
+        """
+        g.request_started = time.perf_counter()
+        g.query_count = 0
+        g.db_seconds = 0.0
+        g.query_statements = {}  # Statement text to the number of times it ran, used by the query budget.
+
+    @app.after_request
+    def record_request_metrics(response):
+        """
+        This function is used to record the request in the metrics once its response is ready.
+        :param response: The response.
+        :return: Returns the response.
+        """
+        if 'request_started' in g:
+            metrics.record(request.endpoint or 'unmatched', request.method, response.status_code,
+                           time.perf_counter() - g.request_started, g.query_count, g.db_seconds)
+        return response
+
+    return metrics
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    This function is used to note when a SQL statement starts.
+    """
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    This function is used to add a finished SQL statement to the current request's query count and database time.
+    """
+    started = conn.info['query_started'].pop()
+    if has_request_context() and 'query_count' in g:
+        g.query_count += 1
+        g.db_seconds += time.perf_counter() - started
+        g.query_statements[statement] = g.query_statements.get(statement, 0) + 1
+
+
+def discard_failed_statement(exception_context):
+    """
+    This function is used to forget the start time of a SQL statement that failed, as after_cursor_execute is not
+    called for it.
+    """
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_started'):
+        connection.info['query_started'].pop()
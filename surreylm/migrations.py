@@ -0,0 +1,216 @@
+# Purpose of this file: This file contains the versioned schema migrations for the License Management System. The schema
+# is created and upgraded by 'flask migrate' rather than when the app starts, and each migration is recorded in the
+# schema_migrations table so it only runs once. Migrations check the schema before changing it, so a database created
+# with the current models can be brought under migration without errors.
+
+# Importing the required modules.
+import datetime
+from sqlalchemy import func, inspect, insert, select, text, update
+from . import db
+from surreylm.database_models import (Software, Software_owner, Archived_software, Audit_event, Scheduler_lease,
+                                      Schema_migration)
+from surreylm.search import create_search_index
+
+
+def column_missing(connection, table_name, column_name):
+    """
+    This function is used to check whether a table is missing a column.
+    :param connection: The database connection.
+    :param table_name: The name of the table.
+    :param column_name: The name of the column.
+    :return: Returns True if the column does not exist, else returns False.
+    """
+    return column_name not in {column['name'] for column in inspect(connection).get_columns(table_name)}
+
+
+def create_tables(connection):
+    """
+    This function is used to create any tables that do not exist yet, with their indexes.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    db.metadata.create_all(connection)
+
+
+def add_lockout_time(connection):
+    """
+    This function is used to add the users.locked_at column used for the lockout cooldown.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    if column_missing(connection, 'users', 'locked_at'):
+        connection.execute(text('ALTER TABLE users ADD COLUMN locked_at DATETIME'))
+
+
+def add_software_indexes(connection):
+    """
+    This function is used to add the indexes on the software columns used for sorting, filtering and joins.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    for index in Software.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def require_not_null(connection, table_name, column_name, column_type):
+    """
+    This function is used to make a column added and filled by a migration NOT NULL, as the models declare it. SQLite
+    cannot change whether an existing column allows NULL without rebuilding the table, so on SQLite the column is left
+    as it is and only the models' validators and column defaults keep it filled.
+    :param connection: The database connection.
+    :param table_name: The name of the table.
+    :param column_name: The name of the column, which must already be filled on every row.
+    :param column_type: The SQL type of the column.
+    :return: Returns nothing.
+    """
+    if connection.dialect.name != 'mysql':
+        return
+    nullable = {column['name']: column['nullable'] for column in inspect(connection).get_columns(table_name)}
+    if nullable[column_name]:
+        connection.execute(text(f'ALTER TABLE {table_name} MODIFY {column_name} {column_type} NOT NULL'))
+
+
+# The normalized vendor and owner columns added by migration 4, as (table name, source column, column name) tuples.
+NORMALIZED_COLUMNS = (('vendors', 'name', 'name_normalized'), ('software_owners', 'email', 'email_normalized'))
+
+
+def add_normalized_columns(connection):
+    """
+    This function is used to add and fill the normalized vendor name and owner email columns, with their unique
+    indexes. Duplicates differing only by case must be merged before this migration can run.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    for table_name, source, column_name in NORMALIZED_COLUMNS:
+        if column_missing(connection, table_name, column_name):
+            connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} VARCHAR(50)'))
+            connection.execute(text(f'UPDATE {table_name} SET {column_name} = LOWER(TRIM({source}))'))
+            require_not_null(connection, table_name, column_name, 'VARCHAR(50)')
+            connection.execute(text(f'CREATE UNIQUE INDEX ix_{table_name}_{column_name} '
+                                    f'ON {table_name} ({column_name})'))
+
+
+def require_normalized_columns(connection):
+    """
+    This function is used to make the normalized vendor name and owner email columns NOT NULL on databases where
+    migration 4 added them as nullable, filling any rows written since without them first.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    for table_name, source, column_name in NORMALIZED_COLUMNS:
+        connection.execute(text(f'UPDATE {table_name} SET {column_name} = LOWER(TRIM({source})) '
+                                f'WHERE {column_name} IS NULL'))
+        require_not_null(connection, table_name, column_name, 'VARCHAR(50)')
+
+
+def add_software_archive(connection):
+    """
+    This function is used to add the software_archive table that expired licenses are moved to, with its indexes.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    Archived_software.__table__.create(connection, checkfirst=True)
+
+
+def add_audit_events(connection):
+    """
+    This function is used to add the audit_events table that audit events are written to, with its indexes.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    Audit_event.__table__.create(connection, checkfirst=True)
+
+
+def add_row_versions(connection):
+    """
+    This function is used to add the row_version columns used to detect concurrent edits of software, owners and
+    vendors.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    for table_name in ('software', 'software_owners', 'vendors'):
+        if column_missing(connection, table_name, 'row_version'):
+            connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1'))
+
+
+def add_scheduler_leases(connection):
+    """
+    This function is used to add the scheduler_leases table that keeps a background job to one worker.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    Scheduler_lease.__table__.create(connection, checkfirst=True)
+
+
+def add_mysql_search_table(connection):
+    """
+    This function is used to move the MySQL search index from FULLTEXT indexes on each searched table to the single
+    software_search table, so a search can match words across fields. SQLite databases already use a search table.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    if connection.dialect.name == 'mysql':
+        create_search_index(connection)
+
+
+def add_owner_names(connection):
+    """
+    This function is used to add and fill the normalized owner name column matched by the owner typeahead, with its
+    index.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    if column_missing(connection, 'software_owners', 'name_normalized'):
+        owners = Software_owner.__table__
+        connection.execute(text('ALTER TABLE software_owners ADD COLUMN name_normalized VARCHAR(101)'))
+        connection.execute(update(owners).values(
+            name_normalized=func.lower(func.trim(owners.c.last_name + ' ' + owners.c.first_name))))
+        require_not_null(connection, 'software_owners', 'name_normalized', 'VARCHAR(101)')
+        connection.execute(text('CREATE INDEX ix_software_owners_name_normalized ON software_owners (name_normalized)'))
+
+
+# The migrations, in the order they are applied. New migrations are added to the end with the next version number.
+MIGRATIONS = [
+    (1, 'create tables', create_tables),
+    (2, 'add lockout time', add_lockout_time),
+    (3, 'add software indexes', add_software_indexes),
+    (4, 'add normalized vendor and owner columns', add_normalized_columns),
+    (5, 'add search index', create_search_index),
+    (6, 'add software archive', add_software_archive),
+    (7, 'add audit events', add_audit_events),
+    (8, 'add row versions', add_row_versions),
+    (9, 'add scheduler leases', add_scheduler_leases),
+    (10, 'add mysql search table', add_mysql_search_table),
+    (11, 'require normalized vendor and owner columns', require_normalized_columns),
+    (12, 'add owner names', add_owner_names),
+]
+
+
+def applied_migrations(engine):
+    """
+    This function is used to find the migrations that have been applied to a database.
+    :param engine: The database engine.
+    :return: Returns a dictionary of version to the date and time it was applied.
+    """
+    Schema_migration.__table__.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return dict(connection.execute(select(Schema_migration.version, Schema_migration.applied_at)).all())
+
+
+def migrate(engine):
+    """
+    This function is used to apply the migrations that have not been applied yet, each in its own transaction.
+    :param engine: The database engine.
+    :return: Returns the list of (version, name) tuples applied.
+    """
+    applied = applied_migrations(engine)
+    ran = []
+    for version, name, upgrade in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as connection:
+            upgrade(connection)
+            connection.execute(insert(Schema_migration).values(version=version, name=name,
+                                                               applied_at=datetime.datetime.utcnow()))
+        ran.append((version, name))
+    return ran
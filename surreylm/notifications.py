@@ -0,0 +1,195 @@
+# Purpose of this file: This file contains the license expiry notifications. Licenses crossing an expiry threshold (for
+# example 60, 30 and 7 days) are found with range queries on the license_expiry index, grouped into one digest per
+# owner and sent through a pluggable sender. Each run looks at the licenses expiring within each threshold and leaves
+# out those already notified for that threshold and expiry date, so licenses added, restored or renewed since the last
+# run are picked up too.
+
+# Importing the required modules.
+import datetime
+import logging
+import os
+import smtplib
+import threading
+from email.message import EmailMessage
+from sqlalchemy import and_
+from . import db
+from surreylm.audit import audit
+from surreylm.database_models import Software, Expiry_notification
+from surreylm.leases import acquire_lease
+from surreylm.queries import software_query
+
+
+class FileSender:
+    """
+    This class is used to send digests by writing each one to a .eml file in a directory, for testing and for
+    environments without a mail server.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def send(self, message):
+        """
+        This function is used to send a digest.
+        :param message: The EmailMessage to send.
+        :return: Returns nothing.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+        path = os.path.join(self.directory, f'{timestamp}-{message["To"]}.eml')
+        with open(path, 'wb') as file:
+            file.write(message.as_bytes())
+
+
+class SMTPSender:
+    """
+    This class is used to send digests through an SMTP server.
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def send(self, message):
+        """
+        This function is used to send a digest.
+        :param message: The EmailMessage to send.
+        :return: Returns nothing.
+        """
+        with smtplib.SMTP(self.host, self.port) as server:
+            server.send_message(message)
+
+
+def make_sender(config):
+    """
+    This function is used to create the sender chosen by the NOTIFY_SENDER setting.
+    :param config: The app config.
+    :return: Returns the sender.
+    """
+    if config['NOTIFY_SENDER'] == 'smtp':
+        return SMTPSender(config['SMTP_HOST'], config['SMTP_PORT'])
+    return FileSender(config['NOTIFY_FILE_DIR'])
+
+
+def due_notices(now, thresholds):
+    """
+    This function is used to find the licenses that are within an expiry threshold and have not been notified for it.
+    For each threshold the range from now to now + threshold days is queried on the license_expiry index, and licenses
+    already notified for that threshold and expiry date are left out with an anti-join on the expiry_notifications
+    unique index.
+    :param now: The current date and time.
+    :param thresholds: The thresholds, in days.
+    :return: Returns a list of (software, threshold) tuples.
+    """
+    notices = []
+    for threshold in sorted(thresholds, reverse=True):
+        window_end = now + datetime.timedelta(days=threshold)
+        already_sent = and_(Expiry_notification.software_id == Software.id,
+                            Expiry_notification.threshold_days == threshold,
+                            Expiry_notification.license_expiry == Software.license_expiry)
+        software = (software_query()
+                    .outerjoin(Expiry_notification, already_sent)
+                    .filter(Software.license_expiry >= now, Software.license_expiry < window_end,
+                            Expiry_notification.id.is_(None))
+                    .all())
+        notices.extend((record, threshold) for record in software)
+    return notices
+
+
+def build_digest(owner, notices, sender_address):
+    """
+    This function is used to write the digest email for one owner.
+    :param owner: The software owner.
+    :param notices: A list of (software, threshold) tuples for the owner.
+    :param sender_address: The address the digest is sent from.
+    :return: Returns the EmailMessage.
+    """
+    lines = [f'Dear {owner.first_name} {owner.last_name},', '',
+             'The following software licenses you own are due to expire:', '']
+    for software, threshold in sorted(notices, key=lambda notice: notice[0].license_expiry):
+        lines.append(f'- {software.name} {software.version} ({software.vendor.name}) expires on '
+                     f'{software.license_expiry:%d/%m/%Y}, within {threshold} days.')
+    lines += ['', 'Please arrange renewal with the vendor, or update the license in SurreyLM.']
+    message = EmailMessage()
+    message['Subject'] = f'SurreyLM: {len(notices)} license(s) expiring soon'
+    message['From'] = sender_address
+    message['To'] = owner.email
+    message.set_content('\n'.join(lines))
+    return message
+
+
+def send_expiry_notices(sender, thresholds, sender_address, now=None):
+    """
+    This function is used to send one digest per owner for the licenses within an expiry threshold that have not been
+    notified for it yet, and record what was sent.
+    :param sender: The sender used to deliver the digests.
+    :param thresholds: The thresholds, in days.
+    :param sender_address: The address the digests are sent from.
+    :param now: The current date and time, defaults to now.
+    :return: Returns the number of digests sent.
+    """
+    now = now or datetime.datetime.today()
+    notices = due_notices(now, thresholds)
+
+    by_owner = {}
+    for software, threshold in notices:
+        owner_notices = by_owner.setdefault(software.owner_id, {})
+        # A license crossing several thresholds at once is listed once, under the nearest one.
+        if software.id not in owner_notices or threshold < owner_notices[software.id][1]:
+            owner_notices[software.id] = (software, threshold)
+
+    sent = 0
+    failed_owners = set()
+    for owner_id, owner_notices in by_owner.items():
+        owner = next(iter(owner_notices.values()))[0].owner
+        try:
+            sender.send(build_digest(owner, list(owner_notices.values()), sender_address))
+            sent += 1
+        except (OSError, smtplib.SMTPException):
+            failed_owners.add(owner_id)
+            audit('notify_failed', f'Expiry digest to {owner.email} could not be sent.', 'owner', owner_id,
+                  actor='scheduler', level=logging.WARNING)
+
+    for software, threshold in notices:
+        if software.owner_id not in failed_owners:  # Failed digests are picked up again by the next run.
+            db.session.add(Expiry_notification(software_id=software.id, threshold_days=threshold,
+                                               license_expiry=software.license_expiry, sent_at=now))
+    db.session.commit()
+    if sent:
+        audit('notify', f'{sent} expiry digests sent for {len(notices)} license notices.', 'software',
+              actor='scheduler')
+    return sent
+
+
+def notify_from_config(app):
+    """
+    This function is used to send the expiry notices using the app's notification settings.
+    :param app: The flask app.
+    :return: Returns the number of digests sent.
+    """
+    with app.app_context():
+        return send_expiry_notices(make_sender(app.config), app.config['NOTIFY_THRESHOLDS'],
+                                   app.config['NOTIFY_FROM'])
+
+
+def start_scheduler(app):
+    """
+    This function is used to start the background thread that sends the expiry notices every
+    NOTIFY_INTERVAL_MINUTES. Every worker may start it, but each run first takes the 'expiry-notifier' lease, so only
+    one worker sends the digests. The lease lasts two intervals, so another worker takes over if that worker stops.
+    :param app: The flask app.
+    :return: Returns the event that stops the scheduler when set.
+    """
+    stop = threading.Event()
+    interval = app.config['NOTIFY_INTERVAL_MINUTES'] * 60
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                with app.app_context():
+                    if not acquire_lease('expiry-notifier', 2 * interval):
+                        continue
+                notify_from_config(app)
+            except Exception:  # The scheduler must keep running if one run fails.
+                app.logger.exception('Expiry notification run failed.')
+
+    threading.Thread(target=run, name='expiry-notifier', daemon=True).start()
+    return stop
@@ -0,0 +1,116 @@
+# Purpose of this file: This file contains the keyset (cursor) pagination used by the list pages. Rather than using
+# OFFSET, each page continues from the sort value and id of the last row on the previous page, so fetching page 1000
+# costs the same as fetching page 1.
+
+# Importing the required modules.
+import base64
+import datetime
+import json
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class Page:
+    """
+    This class is used to hold one page of keyset paginated results.
+    """
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def page_size(value):
+    """
+    This function is used to turn a page size request argument into a bounded page size.
+    :param value: The requested page size, may be None or not a number.
+    :return: Returns the page size, between 1 and MAX_PAGE_SIZE.
+    """
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(value, id):
+    """
+    This function is used to encode the sort value and id of a row into an opaque cursor string.
+    :param value: The sort value of the row.
+    :param id: The id of the row.
+    :return: Returns the cursor string.
+    """
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    data = json.dumps([value, id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor, sort_column):
+    """
+    This function is used to decode a cursor string back into a sort value and id.
+    :param cursor: The cursor string.
+    :param sort_column: The column being sorted on, used to convert the value back to the column's type.
+    :return: Returns a (value, id) tuple, or None if the cursor is not valid.
+    """
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort_column.type.python_type is datetime.datetime:
+            value = datetime.datetime.fromisoformat(value)
+        elif sort_column.type.python_type is datetime.date:
+            value = datetime.date.fromisoformat(value)
+        return value, int(id)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_paginate(query, sort_column, sort_key, id_column, cursor=None, before=False, descending=False,
+                    limit=DEFAULT_PAGE_SIZE):
+    """
+    This function is used to fetch one page of a query using keyset pagination. Rows are ordered by the sort column and
+    then by id, so rows with equal sort values still have a stable order.
+    :param query: The query to paginate.
+    :param sort_column: The column to sort on.
+    :param sort_key: A function that returns the sort value of a result row.
+    :param id_column: The primary key column, used as a tie-breaker.
+    :param cursor: The cursor to continue from, or None for the first page.
+    :param before: True to fetch the page before the cursor rather than the page after it.
+    :param descending: True to sort in descending order.
+    :param limit: The number of rows per page.
+    :return: Returns a Page with the rows and the cursors for the next and previous pages.
+    """
+    position = decode_cursor(cursor, sort_column) if cursor else None
+    if position is None:
+        before = False
+    backwards = descending != before  # The direction the index is scanned in for this page.
+
+    if position is not None:
+        value, last_id = position
+        if backwards:
+            query = query.filter(or_(sort_column < value, and_(sort_column == value, id_column < last_id)))
+        else:
+            query = query.filter(or_(sort_column > value, and_(sort_column == value, id_column > last_id)))
+    if backwards:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    rows = query.limit(limit + 1).all()  # One extra row tells us whether there is another page.
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before:
+        rows.reverse()
+
+    # Paging backwards always leaves the page we came from after this one, and paging forwards from a cursor always
+    # leaves a page before this one.
+    has_next = True if before else has_more
+    has_prev = has_more if before else position is not None
+
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(sort_key(rows[-1]), rows[-1].id)
+    if rows and has_prev:
+        prev_cursor = encode_cursor(sort_key(rows[0]), rows[0].id)
+    return Page(rows, next_cursor, prev_cursor)
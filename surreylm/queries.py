@@ -0,0 +1,251 @@
+# Purpose of this file: This file contains the shared database queries used by the License Management System pages.
+
+# Importing the required modules.
+from sqlalchemy import case, func, select, union
+from sqlalchemy.orm import contains_eager
+from . import db
+from surreylm.database_models import Vendor, Software_owner, Software, LICENSE_STATUSES, normalize
+from surreylm.pagination import Page, keyset_paginate, page_size
+from surreylm.cache import cached
+
+# The columns the software list can be sorted by, and how to read the sort value back from a loaded row.
+SOFTWARE_SORTS = {
+    'name': (Software.name, lambda software: software.name),
+    'version': (Software.version, lambda software: software.version),
+    'expiry': (Software.license_expiry, lambda software: software.license_expiry),
+    'vendor': (Vendor.name, lambda software: software.vendor.name),
+    'owner': (Software_owner.last_name, lambda software: software.owner.last_name),
+}
+
+
+def software_query():
+    """
+    This function is used to build the base software query. The vendor and owner are joined and loaded in the same
+    query, so reading software.vendor or software.owner does not issue a query per row.
+    :return: Returns the software query.
+    """
+    return (Software.query
+            .join(Software.vendor)
+            .join(Software.owner)
+            .options(contains_eager(Software.vendor), contains_eager(Software.owner)))
+
+
+def filter_software(query, args, by_status=True):
+    """
+    This function is used to apply the software list filters from the request arguments.
+    :param query: The software query to filter.
+    :param args: The request arguments.
+    :param by_status: False to ignore the status filter.
+    :return: Returns the filtered query.
+    """
+    name = args.get('name', '').strip()
+    vendor_id = args.get('vendor_id', type=int)
+    owner_id = args.get('owner_id', type=int)
+    status = args.get('status') if by_status else None
+    if name:
+        query = query.filter(Software.name.startswith(name, autoescape=True))
+    if vendor_id:
+        query = query.filter(Software.vendor_id == vendor_id)
+    if owner_id:
+        query = query.filter(Software.owner_id == owner_id)
+    if status in LICENSE_STATUSES:
+        query = query.filter(Software.status_filter(status))
+    return query
+
+
+def status_counts(args):
+    """
+    This function is used to count the software records in each license status in a single query. The name, vendor
+    and owner filters from the request arguments are applied, the status filter is not.
+    :param args: The request arguments.
+    :return: Returns a dictionary of license status to record count.
+    """
+    query = Software.query.with_entities(*[func.count(case((Software.status_filter(status), 1)))
+                                           for status in LICENSE_STATUSES])
+    return dict(zip(LICENSE_STATUSES, filter_software(query, args, by_status=False).one()))
+
+
+def software_page(args):
+    """
+    This function is used to fetch one page of the software list using the sort, filter and cursor request arguments.
+    :param args: The request arguments.
+    :return: Returns a (page, sort, order) tuple.
+    """
+    sort = args.get('sort', 'expiry')
+    if sort not in SOFTWARE_SORTS:
+        sort = 'expiry'
+    order = 'desc' if args.get('order') == 'desc' else 'asc'
+    sort_column, sort_key = SOFTWARE_SORTS[sort]
+    cursor = args.get('before') or args.get('after')
+    page = keyset_paginate(filter_software(software_query(), args), sort_column, sort_key, Software.id,
+                           cursor=cursor, before=bool(args.get('before')), descending=order == 'desc',
+                           limit=page_size(args.get('per_page')))
+    return page, sort, order
+
+
+def software_summary(software):
+    """
+    This function is used to copy the fields shown in the software list into a plain dictionary that can be cached.
+    :param software: The software record, with its vendor and owner loaded.
+    :return: Returns the dictionary.
+    """
+    return {'id': software.id, 'name': software.name, 'version': software.version,
+            'license_expiry': software.license_expiry, 'status': software.status, 'vendor_id': software.vendor_id,
+            'owner_id': software.owner_id, 'vendor': {'name': software.vendor.name},
+            'owner': {'first_name': software.owner.first_name, 'last_name': software.owner.last_name}}
+
+
+def cached_software_page(args):
+    """
+    This function is used to read one page of the software list, and the status counts, through the cache.
+    :param args: The request arguments.
+    :return: Returns a (page, sort, order, counts) tuple.
+    """
+    def load():
+        page, sort, order = software_page(args)
+        items = [software_summary(software) for software in page.items]
+        return Page(items, page.next_cursor, page.prev_cursor), sort, order, status_counts(args)
+
+    name = 'software_page:' + '&'.join(f'{key}={value}' for key, value in sorted(args.items(multi=True)))
+    return cached(name, ('software', 'vendors', 'software_owners'), load)
+
+
+def prefix_range(column, prefix):
+    """
+    This function is used to match a normalized column against a prefix with a range condition, which can be answered
+    from the column's index on every database, unlike LIKE with a case-insensitive collation.
+    :param column: The normalized column.
+    :param prefix: The normalized prefix.
+    :return: Returns the condition.
+    """
+    if not prefix:
+        return column.isnot(None)
+    return (column >= prefix) & (column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def vendor_lookup(prefix, limit):
+    """
+    This function is used to find the vendors whose name starts with the prefix, for the vendor typeahead.
+    :param prefix: The start of the vendor name, in any case.
+    :param limit: The most vendors to return.
+    :return: Returns a list of dictionaries with the id and name of each vendor, ordered by name.
+    """
+    query = (db.session.query(Vendor.id, Vendor.name)
+             .filter(prefix_range(Vendor.name_normalized, normalize(prefix)))
+             .order_by(Vendor.name_normalized)
+             .limit(limit))
+    return [{'id': id, 'name': name} for id, name in query]
+
+
+def owner_lookup(prefix, limit):
+    """
+    This function is used to find the owners whose name, surname first, or email starts with the prefix, for the owner
+    typeahead. The name and email matches are each read from their column's index and combined with a UNION.
+    :param prefix: The start of the owner's surname, full name surname first, or email, in any case.
+    :param limit: The most owners to return.
+    :return: Returns a list of dictionaries with the id and display name of each owner, ordered by surname.
+    """
+    prefix = normalize(prefix)
+    columns = (Software_owner.id, Software_owner.first_name, Software_owner.last_name, Software_owner.email,
+               Software_owner.name_normalized)
+    matches = union(*[select(select(*columns).filter(prefix_range(column, prefix)).order_by(column).limit(limit)
+                             .subquery())
+                      for column in (Software_owner.name_normalized, Software_owner.email_normalized)]).subquery()
+    query = (select(matches.c.id, matches.c.first_name, matches.c.last_name, matches.c.email)
+             .order_by(matches.c.name_normalized, matches.c.id)
+             .limit(limit))
+    return [{'id': id, 'name': f'{first_name} {last_name} ({email})'}
+            for id, first_name, last_name, email in db.session.execute(query)]
+
+
+# The license aggregates shown for each owner and vendor, in the order license_aggregates returns them.
+LICENSE_SUMMARY = ('license_count', 'expired', 'expiring', 'next_expiry')
+
+
+def license_aggregates():
+    """
+    This function is used to build the SQL aggregates over the software joined to an owner or vendor: the number of
+    licenses, how many have expired, how many are expiring within a month and the next expiry date.
+    :return: Returns the list of aggregate expressions.
+    """
+    return [func.count(Software.id),
+            func.count(case((Software.status_filter('expired'), Software.id))),
+            func.count(case((Software.status_filter('expiring'), Software.id))),
+            func.min(case((~Software.status_filter('expired'), Software.license_expiry)))]
+
+
+def summaries(model, foreign_key, fields):
+    """
+    This function is used to read every owner or vendor with its license aggregates in a single GROUP BY query.
+    :param model: Software_owner or Vendor.
+    :param foreign_key: The software column that references the model.
+    :param fields: The names of the model columns to include.
+    :return: Returns a list of dictionaries, ordered by id.
+    """
+    query = (db.session.query(*[getattr(model, field) for field in fields], *license_aggregates())
+             .outerjoin(Software, foreign_key == model.id)
+             .group_by(model.id)
+             .order_by(model.id))
+    return [dict(zip(fields + LICENSE_SUMMARY, row)) for row in query]
+
+
+def detail(model, foreign_key, other, other_key, id):
+    """
+    This function is used to read an owner or vendor, its software with the other side of each license, and its
+    license aggregates in one query. The aggregates are window functions over the joined rows, so they arrive on every
+    row alongside the software.
+    :param model: Software_owner or Vendor.
+    :param foreign_key: The software column that references the model.
+    :param other: The model on the other side of each license, Vendor or Software_owner.
+    :param other_key: The software column that references the other model.
+    :param id: The id of the owner or vendor.
+    :return: Returns a (record, summary, software) tuple, or None if the record does not exist. software is a list of
+    (software, other) tuples ordered by expiry date.
+    """
+    rows = (db.session.query(model, Software, other, *[aggregate.over() for aggregate in license_aggregates()])
+            .outerjoin(Software, foreign_key == model.id)
+            .outerjoin(other, other.id == other_key)
+            .filter(model.id == id)
+            .order_by(Software.license_expiry, Software.id)
+            .all())
+    if not rows:
+        return None
+    summary = dict(zip(LICENSE_SUMMARY, rows[0][3:]))
+    software = [(row[1], row[2]) for row in rows if row[1] is not None]
+    return rows[0][0], summary, software
+
+
+def owner_detail(id):
+    """
+    This function is used to read an owner's page: the owner, their license aggregates and their software.
+    :param id: The id of the owner.
+    :return: Returns a (owner, summary, software) tuple, or None if the owner does not exist.
+    """
+    return detail(Software_owner, Software.owner_id, Vendor, Software.vendor_id, id)
+
+
+def vendor_detail(id):
+    """
+    This function is used to read a vendor's page: the vendor, its license aggregates and its software.
+    :param id: The id of the vendor.
+    :return: Returns a (vendor, summary, software) tuple, or None if the vendor does not exist.
+    """
+    return detail(Vendor, Software.vendor_id, Software_owner, Software.owner_id, id)
+
+
+def cached_owner_summaries():
+    """
+    This function is used to read every owner with their license aggregates through the cache.
+    :return: Returns the list of owners.
+    """
+    return cached('owner_summaries', ('software_owners', 'software'), lambda: summaries(
+        Software_owner, Software.owner_id, ('id', 'email', 'first_name', 'last_name', 'phone_extension')))
+
+
+def cached_vendor_summaries():
+    """
+    This function is used to read every vendor with its license aggregates through the cache.
+    :return: Returns the list of vendors.
+    """
+    return cached('vendor_summaries', ('vendors', 'software'), lambda: summaries(
+        Vendor, Software.vendor_id, ('id', 'name', 'phone', 'email')))
@@ -0,0 +1,59 @@
+# Purpose of this file: This file contains the per-request query budget, used to catch N+1 queries such as a lazy
+# relationship read once per row in a template. A request that runs more SQL statements than its endpoint's budget logs
+# a warning naming the statement that was repeated most, with its literal values replaced so the repeats group together.
+
+# Importing the required modules.
+import re
+from flask import current_app, g, request
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r'\bIN \((?:\?|%s|:\w+)(?:, (?:\?|%s|:\w+))*\)', re.IGNORECASE)
+
+
+def fingerprint(statement):
+    """
+    This function is used to reduce a SQL statement to its shape, so statements that only differ in their values match.
+    :param statement: The SQL statement.
+    :return: Returns the statement with whitespace collapsed and literals and IN lists replaced by ?.
+    """
+    statement = ' '.join(statement.split())
+    return IN_LISTS.sub('IN (?)', LITERALS.sub('?', statement))
+
+
+def query_budget(limit):
+    """
+    This function is used to give a view its own query budget instead of the QUERY_BUDGET setting.
+    :param limit: The most SQL statements a request to the view should run, or None for no budget.
+    :return: Returns the decorator.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def init_query_budget(app):
+    """
+    This function is used to check each request against its query budget. It reads the statements counted by the
+    request metrics, so it must be set up after init_metrics.
+    :param app: The flask app, used to read the QUERY_BUDGET setting.
+    :return: Returns nothing.
+    """
+    @app.after_request
+    def check_query_budget(response):
+        """
+        This function is used to log a warning when the request ran more SQL statements than its budget.
+        :param response: The response.
+        :return: Returns the response.
+        """
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', current_app.config['QUERY_BUDGET'])
+        if budget is not None and g.get('query_count', 0) > budget:
+            repeats = {}
+            for statement, count in g.query_statements.items():
+                shape = fingerprint(statement)
+                repeats[shape] = repeats.get(shape, 0) + count
+            shape, count = max(repeats.items(), key=lambda item: item[1])
+            current_app.logger.warning('%s %s ran %d SQL statements, over its budget of %d. Most repeated (%dx): %s',
+                                       request.method, request.endpoint, g.query_count, budget, count, shape)
+        return response
@@ -0,0 +1,176 @@
+# Purpose of this file: This file contains the full-text search across software, vendors and owners. The searchable text
+# of each license (name, version, vendor name and owner name and email) is kept in one software_search table that
+# triggers update on every write: an FTS5 table on SQLite and a table with a single FULLTEXT index on MySQL. Every word
+# of a search may match any of the fields, on both databases. Results are ranked by relevance and paginated.
+
+# Importing the required modules.
+import re
+from sqlalchemy import DDL, event, inspect, text, table, column
+from sqlalchemy.dialects.mysql import match
+from . import db
+from surreylm.database_models import Software
+from surreylm.queries import software_query
+
+SEARCH_PAGE_SIZE = 25
+OWNER_TEXT = "o.first_name || ' ' || o.last_name || ' ' || o.email"
+
+# The SQLite FTS5 table, keyed by software id, and the triggers that keep it in step with the software, vendors and
+# software_owners tables.
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS software_search USING fts5(name, version, vendor, owner)",
+    f"""CREATE TRIGGER IF NOT EXISTS software_search_insert AFTER INSERT ON software BEGIN
+        INSERT INTO software_search(rowid, name, version, vendor, owner)
+        SELECT new.id, new.name, new.version, v.name, {OWNER_TEXT}
+        FROM vendors v, software_owners o WHERE v.id = new.vendor_id AND o.id = new.owner_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS software_search_update AFTER UPDATE ON software BEGIN
+        DELETE FROM software_search WHERE rowid = old.id;
+        INSERT INTO software_search(rowid, name, version, vendor, owner)
+        SELECT new.id, new.name, new.version, v.name, {OWNER_TEXT}
+        FROM vendors v, software_owners o WHERE v.id = new.vendor_id AND o.id = new.owner_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS software_search_delete AFTER DELETE ON software BEGIN
+        DELETE FROM software_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS vendor_search_update AFTER UPDATE OF name ON vendors BEGIN
+        UPDATE software_search SET vendor = new.name WHERE rowid IN (SELECT id FROM software WHERE vendor_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS owner_search_update AFTER UPDATE OF first_name, last_name, email
+        ON software_owners BEGIN
+        UPDATE software_search SET owner = new.first_name || ' ' || new.last_name || ' ' || new.email
+        WHERE rowid IN (SELECT id FROM software WHERE owner_id = new.id);
+    END""",
+]
+SQLITE_REBUILD = [
+    "DELETE FROM software_search",
+    f"""INSERT INTO software_search(rowid, name, version, vendor, owner)
+        SELECT s.id, s.name, s.version, v.name, {OWNER_TEXT}
+        FROM software s JOIN vendors v ON v.id = s.vendor_id JOIN software_owners o ON o.id = s.owner_id""",
+]
+MYSQL_OWNER_TEXT = "CONCAT_WS(' ', o.first_name, o.last_name, o.email)"
+
+# The MySQL search table, keyed by software id, with one FULLTEXT index over all the searched fields.
+MYSQL_TABLE = """CREATE TABLE IF NOT EXISTS software_search (
+        software_id INTEGER NOT NULL PRIMARY KEY,
+        name VARCHAR(50) NOT NULL,
+        version VARCHAR(50) NOT NULL,
+        vendor VARCHAR(50) NOT NULL,
+        owner VARCHAR(160) NOT NULL,
+        FULLTEXT INDEX ft_software_search_text (name, version, vendor, owner)
+    ) ENGINE=InnoDB"""
+# The MySQL triggers that keep the search table in step with the software, vendors and software_owners tables.
+MYSQL_TRIGGERS = {
+    'software_search_insert': f"""CREATE TRIGGER software_search_insert AFTER INSERT ON software FOR EACH ROW
+        REPLACE INTO software_search (software_id, name, version, vendor, owner)
+        SELECT NEW.id, NEW.name, NEW.version, v.name, {MYSQL_OWNER_TEXT}
+        FROM vendors v, software_owners o WHERE v.id = NEW.vendor_id AND o.id = NEW.owner_id""",
+    'software_search_update': f"""CREATE TRIGGER software_search_update AFTER UPDATE ON software FOR EACH ROW
+        REPLACE INTO software_search (software_id, name, version, vendor, owner)
+        SELECT NEW.id, NEW.name, NEW.version, v.name, {MYSQL_OWNER_TEXT}
+        FROM vendors v, software_owners o WHERE v.id = NEW.vendor_id AND o.id = NEW.owner_id""",
+    'software_search_delete': """CREATE TRIGGER software_search_delete AFTER DELETE ON software FOR EACH ROW
+        DELETE FROM software_search WHERE software_id = OLD.id""",
+    'vendor_search_update': """CREATE TRIGGER vendor_search_update AFTER UPDATE ON vendors FOR EACH ROW
+        UPDATE software_search s JOIN software sw ON sw.id = s.software_id SET s.vendor = NEW.name
+        WHERE sw.vendor_id = NEW.id""",
+    'owner_search_update': """CREATE TRIGGER owner_search_update AFTER UPDATE ON software_owners FOR EACH ROW
+        UPDATE software_search s JOIN software sw ON sw.id = s.software_id
+        SET s.owner = CONCAT_WS(' ', NEW.first_name, NEW.last_name, NEW.email) WHERE sw.owner_id = NEW.id""",
+}
+MYSQL_REBUILD = [
+    "DELETE FROM software_search",
+    f"""INSERT INTO software_search (software_id, name, version, vendor, owner)
+        SELECT s.id, s.name, s.version, v.name, {MYSQL_OWNER_TEXT}
+        FROM software s JOIN vendors v ON v.id = s.vendor_id JOIN software_owners o ON o.id = s.owner_id""",
+]
+# The per-table FULLTEXT indexes used before the search table, dropped when the search index is rebuilt.
+MYSQL_LEGACY_INDEXES = {'software': 'ft_software_search', 'vendors': 'ft_vendor_search',
+                        'software_owners': 'ft_owner_search'}
+
+for statement in SQLITE_DDL:
+    event.listen(Software.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in [MYSQL_TABLE] + list(MYSQL_TRIGGERS.values()):
+    event.listen(Software.__table__, 'after_create', DDL(statement).execute_if(dialect='mysql'))
+
+sqlite_search = table('software_search', column('rowid'), column('rank'))
+mysql_search = table('software_search', column('software_id'), column('name'), column('version'), column('vendor'),
+                     column('owner'))
+
+
+def search_terms(query):
+    """
+    This function is used to split a search box entry into words, dropping any search operators.
+    :param query: The search box entry.
+    :return: Returns the list of words.
+    """
+    return re.findall(r'\w+', query or '')
+
+
+def create_search_index(connection):
+    """
+    This function is used to create the search index if it does not exist and fill it from the existing records, for
+    databases created before search was added.
+    :param connection: The database connection.
+    :return: Returns nothing.
+    """
+    if connection.dialect.name == 'sqlite':
+        for statement in SQLITE_DDL + SQLITE_REBUILD:
+            connection.execute(text(statement))
+    elif connection.dialect.name == 'mysql':
+        inspector = inspect(connection)
+        for table_name, index_name in MYSQL_LEGACY_INDEXES.items():
+            if index_name in {index['name'] for index in inspector.get_indexes(table_name)}:
+                connection.execute(text(f'DROP INDEX {index_name} ON {table_name}'))
+        connection.execute(text(MYSQL_TABLE))
+        existing = {name.lower() for name in connection.execute(text(
+            'SELECT trigger_name FROM information_schema.triggers WHERE trigger_schema = DATABASE()')).scalars()}
+        for name, statement in MYSQL_TRIGGERS.items():
+            if name not in existing:
+                connection.execute(text(statement))
+        for statement in MYSQL_REBUILD:
+            connection.execute(text(statement))
+
+
+def rebuild_search_index():
+    """
+    This function is used to create and fill the search index in its own transaction.
+    :return: Returns nothing.
+    """
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+
+
+def search_query(terms, dialect_name):
+    """
+    This function is used to build the query for software matching every search word, in any of the searched fields.
+    The last word may be the start of a word, so results appear while typing.
+    :param terms: The search words.
+    :param dialect_name: The name of the database dialect, 'sqlite' or 'mysql'.
+    :return: Returns the software query, ordered by relevance.
+    """
+    results = software_query()
+    if dialect_name == 'mysql':
+        relevance = match(mysql_search.c.name, mysql_search.c.version, mysql_search.c.vendor, mysql_search.c.owner,
+                          against=' '.join(f'+{term}*' for term in terms)).in_boolean_mode()
+        return (results.join(mysql_search, mysql_search.c.software_id == Software.id)
+                .filter(relevance)
+                .order_by(relevance.desc(), Software.id))
+    fts_query = ' '.join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+    return (results.join(sqlite_search, sqlite_search.c.rowid == Software.id)
+            .filter(text('software_search MATCH :search').bindparams(search=fts_query.strip()))
+            .order_by(sqlite_search.c.rank, Software.id))
+
+
+def search_software(query, page=1, per_page=SEARCH_PAGE_SIZE):
+    """
+    This function is used to search software by name, version, vendor name and owner name or email.
+    :param query: The search box entry.
+    :param page: The page number, starting from 1.
+    :param per_page: The number of results per page.
+    :return: Returns a (results, has_next) tuple, with the results ordered by relevance.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], False
+    rows = search_query(terms, db.engine.dialect.name).offset((page - 1) * per_page).limit(per_page + 1).all()
+    return rows[:per_page], len(rows) > per_page
@@ -0,0 +1,74 @@
+# Purpose of this file: This file contains the startup-time report used to track cold starts. It records how long
+# importing flask and its extensions took, how long each phase of create_app took, including importing the package's
+# own modules, and how long the first request took to serve.
+
+# Importing the required modules.
+import threading
+import time
+
+
+class StartupReport:
+    """
+    This class is used to record the startup timings for one flask app.
+    """
+    def __init__(self, dependency_import_seconds):
+        self.dependency_import_seconds = dependency_import_seconds
+        self.phases = {}
+        self.first_request_seconds = None
+        self.last = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def checkpoint(self, name):
+        """
+        This function is used to record the time spent on a phase of create_app, since the previous checkpoint.
+        :param name: The name of the phase that has just finished.
+        :return: Returns nothing.
+        """
+        now = time.perf_counter()
+        self.phases[name] = now - self.last
+        self.last = now
+
+    def as_dict(self):
+        """
+        This function is used to get the startup timings.
+        :return: Returns the timings, in milliseconds, as a dictionary.
+        """
+        return {'dependency_import_ms': round(self.dependency_import_seconds * 1000, 2),
+                'create_app_ms': {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()},
+                'create_app_total_ms': round(sum(self.phases.values()) * 1000, 2),
+                'first_request_ms': (round(self.first_request_seconds * 1000, 2)
+                                     if self.first_request_seconds is not None else None)}
+
+
+def init_startup_report(app, report):
+    """
+    This function is used to attach the startup report to the flask app and time its first request.
+    :param app: The flask app.
+    :param report: The StartupReport filled in by create_app.
+    :return: Returns the report.
+    """
+    app.extensions['surreylm_startup'] = report
+    state = threading.local()
+
+    @app.before_request
+    def start_first_request():
+        """
+        This function is used to note the start time of the first request.
+        """
+        if report.first_request_seconds is None:
+            state.start = time.perf_counter()
+
+    @app.teardown_request
+    def finish_first_request(error=None):
+        """
+        This function is used to record how long the first request took, once it has been served.
+        """
+        start = getattr(state, 'start', None)
+        if start is not None:
+            state.start = None
+            with report.lock:
+                if report.first_request_seconds is None:
+                    report.first_request_seconds = time.perf_counter() - start
+                    app.logger.info('Startup report: %s', report.as_dict())
+
+    return report
@@ -0,0 +1,384 @@
+# Purpose of this file: This file contains the route benchmark for the License Management System. It seeds a SQLite
+# database with a configurable number of records, drives every route through the flask test client and reports p50/p95
+# latency, queries per request and peak memory per route. Results are saved as JSON so runs can be compared between
+# commits.
+#
+# Run from the directory above 'surreylm', with the same environment variables as the tests (the benchmark uses its own
+# SQLite database file, not db_connection_string):
+#   python -m surreylm.test.benchmark_routes --software 100000 --vendors 5000 --owners 20000 --output bench.json
+#   python -m surreylm.test.benchmark_routes --compare bench.json --output bench_new.json
+
+# Importing the required modules.
+import argparse
+import datetime
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from sqlalchemy import event, insert
+from werkzeug.security import generate_password_hash
+from surreylm import create_app, db
+from surreylm.database_models import User, Software_owner, Vendor, Software, Archived_software
+
+ADMIN_EMAIL = 'bench.admin@surrey.ac.uk'
+ADMIN_PASSWORD = 'Benchmark55'
+SEED_CHUNK_SIZE = 10000  # The number of rows inserted per statement when seeding.
+
+
+class Route:
+    """
+    This class is used to describe one benchmarked request.
+    :param name: The name the result is reported under.
+    :param endpoint: The flask endpoint the request is routed to.
+    :param method: 'GET' or 'POST'.
+    :param path: A function of the benchmark returning the request path.
+    :param data: A function of the benchmark returning the form data, for POST requests.
+    :param setup: A function of the benchmark run, untimed, before each request. Its result is passed to path and data.
+    :param teardown: A function of the benchmark run, untimed, after each request.
+    """
+    def __init__(self, name, endpoint, method, path, data=None, setup=None, teardown=None):
+        self.name = name
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.data = data
+        self.setup = setup
+        self.teardown = teardown
+
+
+def letters(number):
+    """
+    This function is used to turn a number into letters, for names that must only contain letters.
+    :param number: The number.
+    :return: Returns the letters.
+    """
+    text = ''
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        text = chr(ord('a') + remainder) + text
+    return text
+
+
+def insert_chunks(model, rows):
+    """
+    This function is used to insert rows in large multi-row statements.
+    :param model: The model to insert into.
+    :param rows: An iterator of row dictionaries.
+    :return: Returns nothing.
+    """
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, SEED_CHUNK_SIZE)):
+        db.session.execute(insert(model), chunk)
+    db.session.commit()
+
+
+def seed(software, vendors, owners):
+    """
+    This function is used to seed the database. Licenses are spread over two years either side of today, so every
+    license status is represented.
+    :param software: The number of software records.
+    :param vendors: The number of vendor records.
+    :param owners: The number of owner records.
+    :return: Returns nothing.
+    """
+    today = datetime.datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+    insert_chunks(Vendor, ({'name': f'Vendor {number}', 'phone': '01234567890',
+                            'email': f'sales{number}@vendor.com'} for number in range(vendors)))
+    insert_chunks(Software_owner, ({'email': f'owner{number}@surrey.ac.uk', 'first_name': 'Owner',
+                                    'last_name': letters(number).capitalize(), 'phone_extension': '1234'}
+                                   for number in range(owners)))
+    insert_chunks(Software, ({'name': f'Package {number}', 'version': f'{number % 20}.0',
+                              'license_expiry': today + datetime.timedelta(days=number % 730 - 365),
+                              'vendor_id': number % vendors + 1, 'owner_id': number % owners + 1}
+                             for number in range(software)))
+    db.session.add(User(email=ADMIN_EMAIL, first_name='Bench', last_name='Admin', admin=True,
+                        password=generate_password_hash(ADMIN_PASSWORD, method='sha256')))
+    db.session.commit()
+
+
+class Benchmark:
+    """
+    This class is used to run the route benchmark against a seeded database.
+    """
+    def __init__(self, software=100000, vendors=5000, owners=20000, iterations=20, database_path=None):
+        self.volumes = {'software': software, 'vendors': vendors, 'owners': owners}
+        self.iterations = iterations
+        self.database_path = database_path or os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+        self.app = create_app(f'sqlite:///{self.database_path}')
+        self.app.config.update({"TESTING": True})
+        self.client = self.app.test_client()
+        self.counter = itertools.count()
+        self.queries = 0
+        with self.app.app_context():
+            db.create_all()
+            seed(software, vendors, owners)
+            event.listen(db.engine, 'before_cursor_execute', self.count_query)
+
+    def count_query(self, *args):
+        """
+        This function is used to count each SQL statement sent to the database.
+        """
+        self.queries += 1
+
+    def login(self, *args):
+        """
+        This function is used to log the test client in as the admin user.
+        """
+        self.client.post('/login', data={'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD})
+
+    def create(self, model, **values):
+        """
+        This function is used to create a record, untimed, for the delete routes to remove.
+        :param model: The model to create.
+        :param values: The record's column values.
+        :return: Returns the id of the new record.
+        """
+        with self.app.app_context():
+            record = model(**values)
+            db.session.add(record)
+            db.session.commit()
+            return record.id
+
+    def new_vendor(self, *args):
+        """
+        This function is used to create a vendor with no software.
+        """
+        return self.create(Vendor, name=f'Spare Vendor {next(self.counter)}', phone='01234567890',
+                           email='spare@vendor.com')
+
+    def new_owner(self, *args):
+        """
+        This function is used to create an owner with no software.
+        """
+        return self.create(Software_owner, email=f'spare{next(self.counter)}@surrey.ac.uk', first_name='Spare',
+                           last_name='Owner', phone_extension='1234')
+
+    def new_software(self, *args):
+        """
+        This function is used to create a software record.
+        """
+        return self.create(Software, name='Spare', version='1.0', license_expiry=datetime.datetime(2030, 1, 1),
+                           vendor_id=1, owner_id=1)
+
+    def new_archived_software(self, *args):
+        """
+        This function is used to create an archived software record.
+        """
+        return self.create(Archived_software, software_id=0, name='Spare', version='1.0',
+                           license_expiry=datetime.datetime(2010, 1, 1), vendor_id=1, owner_id=1,
+                           archived_at=datetime.datetime(2020, 1, 1))
+
+    def routes(self):
+        """
+        This function is used to list the requests that are benchmarked.
+        :return: Returns a list of Routes.
+        """
+        middle = self.volumes['software'] // 2 or 1
+
+        def vendor_form(*args):
+            return {'name': f'Bench Vendor {next(self.counter)}', 'phone': '01234567890',
+                    'email': 'bench@vendor.com'}
+
+        def owner_form(*args):
+            return {'first_name': 'Bench', 'last_name': letters(next(self.counter)), 'phone_extension': '1234',
+                    'email': f'bench{next(self.counter)}@surrey.ac.uk'}
+
+        def software_form(*args):
+            return {'name': 'Bench', 'version': '1.0', 'expiry_date': '2030-01-01', 'vendor': '1', 'owner': '1'}
+
+        return [
+            Route('home', 'views.home', 'GET', lambda *args: '/'),
+            Route('home sorted by vendor', 'views.home', 'GET', lambda *args: '/?sort=vendor&order=desc'),
+            Route('home filtered by status', 'views.home', 'GET', lambda *args: '/?status=expiring'),
+            Route('edit_software', 'views.edit_software', 'GET', lambda *args: f'/edit_software/{middle}'),
+            Route('edit_software POST', 'views.edit_software', 'POST', lambda *args: f'/edit_software/{middle}',
+                  data=software_form),
+            Route('add_vendor', 'views.add_vendor', 'GET', lambda *args: '/add_vendor'),
+            Route('add_vendor POST', 'views.add_vendor', 'POST', lambda *args: '/add_vendor', data=vendor_form),
+            Route('add_owner', 'views.add_owner', 'GET', lambda *args: '/add_owner'),
+            Route('add_owner POST', 'views.add_owner', 'POST', lambda *args: '/add_owner', data=owner_form),
+            Route('add_software', 'views.add_software', 'GET', lambda *args: '/add_software'),
+            Route('add_software POST', 'views.add_software', 'POST', lambda *args: '/add_software',
+                  data=software_form),
+            Route('search', 'views.search', 'GET', lambda *args: '/search?q=software'),
+            Route('bulk_update extend', 'views.bulk_update', 'POST', lambda *args: '/bulk_update_software',
+                  data=lambda *args: {'action': 'extend', 'months': '12', 'scope': 'filter', 'name': 'Package 1234'}),
+            Route('import_software', 'views.import_software_file', 'GET', lambda *args: '/import_software'),
+            Route('export_software csv', 'views.export_software', 'GET', lambda *args: '/export_software.csv'),
+            Route('delete_software', 'views.delete_software', 'POST', lambda id: f'/delete_software/{id}',
+                  setup=self.new_software),
+            Route('history', 'views.history', 'GET', lambda *args: '/history'),
+            Route('restore_software', 'views.restore', 'POST', lambda id: f'/restore_software/{id}',
+                  setup=self.new_archived_software),
+            Route('view_owner', 'views.view_owner', 'GET', lambda *args: '/view_owner/1'),
+            Route('view_vendor', 'views.view_vendor', 'GET', lambda *args: '/view_vendor/1'),
+            Route('edit_owner', 'views.edit_owner', 'GET', lambda *args: '/edit_owner/1'),
+            Route('edit_owner POST', 'views.edit_owner', 'POST', lambda *args: '/edit_owner/1',
+                  data=lambda *args: {'email': 'owner0@surrey.ac.uk', 'first_name': 'Owner', 'last_name': 'A',
+                                      'phone_extension': '4321'}),
+            Route('edit_vendor', 'views.edit_vendor', 'GET', lambda *args: '/edit_vendor/1'),
+            Route('edit_vendor POST', 'views.edit_vendor', 'POST', lambda *args: '/edit_vendor/1',
+                  data=lambda *args: {'name': 'Vendor 0', 'phone': '09876543210', 'email': 'sales0@vendor.com'}),
+            Route('all_owners', 'views.all_owners', 'GET', lambda *args: '/all_owners'),
+            Route('delete_owner', 'views.delete_owner', 'POST', lambda id: f'/delete_owner/{id}',
+                  setup=self.new_owner),
+            Route('all_vendors', 'views.all_vendors', 'GET', lambda *args: '/all_vendors'),
+            Route('delete_vendor', 'views.delete_vendor', 'POST', lambda id: f'/delete_vendor/{id}',
+                  setup=self.new_vendor),
+            Route('logs', 'views.logs', 'GET', lambda *args: '/logs'),
+            Route('audit', 'views.audit_events', 'GET', lambda *args: '/audit?record_type=software'),
+            Route('db_pool', 'views.db_pool', 'GET', lambda *args: '/db_pool'),
+            Route('startup', 'views.startup', 'GET', lambda *args: '/startup'),
+            Route('metrics', 'views.metrics', 'GET', lambda *args: '/metrics'),
+            Route('api software', 'api.software_list', 'GET', lambda *args: '/api/v1/software'),
+            Route('api software detail', 'api.software_detail', 'GET', lambda *args: f'/api/v1/software/{middle}'),
+            Route('api vendors', 'api.vendor_list', 'GET', lambda *args: '/api/v1/vendors'),
+            Route('api vendor detail', 'api.vendor_detail', 'GET', lambda *args: '/api/v1/vendors/1'),
+            Route('api vendor lookup', 'api.vendor_typeahead', 'GET',
+                  lambda *args: '/api/v1/vendors/lookup?q=vendor 1'),
+            Route('api owners', 'api.owner_list', 'GET', lambda *args: '/api/v1/owners'),
+            Route('api owner detail', 'api.owner_detail', 'GET', lambda *args: '/api/v1/owners/1'),
+            Route('api owner lookup', 'api.owner_typeahead', 'GET',
+                  lambda *args: '/api/v1/owners/lookup?q=owner1'),
+            Route('login', 'auth.login', 'GET', lambda *args: '/login'),
+            Route('login POST', 'auth.login', 'POST', lambda *args: '/login',
+                  data=lambda *args: {'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD}),
+            Route('register', 'auth.sign_up', 'GET', lambda *args: '/register'),
+            Route('register POST', 'auth.sign_up', 'POST', lambda *args: '/register',
+                  data=lambda *args: {'email': f'bench{next(self.counter)}@surrey.ac.uk', 'first_name': 'Bench',
+                                      'last_name': 'User', 'password1': 'Benchmark55',
+                                      'password2': 'Benchmark55'},
+                  teardown=self.login),
+            Route('logout', 'auth.logout', 'GET', lambda *args: '/logout', teardown=self.login),
+        ]
+
+    def request(self, route):
+        """
+        This function is used to make one request, untimed setup and teardown included.
+        :param route: The Route to request.
+        :return: Returns a (seconds, queries) tuple for the request.
+        """
+        prepared = route.setup(self) if route.setup else None
+        path = route.path(prepared)
+        data = route.data(prepared) if route.data else None
+        self.queries = 0
+        start = time.perf_counter()
+        response = self.client.open(path, method=route.method, data=data)
+        response.get_data()  # Reads the whole body, so streamed responses are timed to the end.
+        seconds = time.perf_counter() - start
+        queries = self.queries
+        if response.status_code >= 500:
+            raise RuntimeError(f'{route.name} returned {response.status_code}')
+        if route.teardown:
+            route.teardown(self)
+        return seconds, queries
+
+    def run(self):
+        """
+        This function is used to benchmark every route.
+        :return: Returns the results as a dictionary.
+        """
+        self.login()
+        routes = self.routes()
+        results = {}
+        for route in routes:
+            timings = []
+            queries = []
+            for _ in range(self.iterations):
+                seconds, count = self.request(route)
+                timings.append(seconds * 1000)
+                queries.append(count)
+            tracemalloc.start()  # Memory is measured on a separate request, as tracing slows the timed ones.
+            self.request(route)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[route.name] = {'endpoint': route.endpoint, 'method': route.method,
+                                   'p50_ms': round(percentile(timings, 50), 3),
+                                   'p95_ms': round(percentile(timings, 95), 3),
+                                   'queries': max(queries), 'peak_memory_kb': round(peak / 1024, 1)}
+
+        covered = {route.endpoint for route in routes}
+        missing = sorted(rule.endpoint for rule in self.app.url_map.iter_rules()
+                         if rule.endpoint.split('.')[0] in ('views', 'auth', 'api') and rule.endpoint not in covered)
+        return {'commit': git_commit(), 'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'volumes': self.volumes, 'iterations': self.iterations, 'routes': results,
+                'not_benchmarked': missing}
+
+
+def percentile(values, percent):
+    """
+    This function is used to work out a percentile of a list of values.
+    :param values: The values.
+    :param percent: The percentile, between 1 and 99.
+    :return: Returns the percentile.
+    """
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+def git_commit():
+    """
+    This function is used to get the current git commit, so results can be matched to the code they measured.
+    :return: Returns the commit hash, or None if it is not available.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """
+    This function is used to print how each route has changed since a previous run.
+    :param previous: The previous results.
+    :param current: The current results.
+    :return: Returns nothing.
+    """
+    print(f'Comparing {current["commit"]} with {previous["commit"]}:')
+    for name, result in current['routes'].items():
+        before = previous['routes'].get(name)
+        if before is None:
+            continue
+        change = (result['p95_ms'] / before['p95_ms'] - 1) * 100 if before['p95_ms'] else 0.0
+        print(f'{name:28} p95 {before["p95_ms"]:9.2f} -> {result["p95_ms"]:9.2f} ms ({change:+.0f}%)  '
+              f'queries {before["queries"]} -> {result["queries"]}')
+
+
+def main():
+    """
+    This function is used to run the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the SurreyLM routes against a seeded database.')
+    parser.add_argument('--software', type=int, default=100000)
+    parser.add_argument('--vendors', type=int, default=5000)
+    parser.add_argument('--owners', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--no-cache', action='store_true', help='Disable the list page cache.')
+    parser.add_argument('--output', default='bench.json', help='The file the JSON results are saved to.')
+    parser.add_argument('--compare', help='A previous results file to compare with.')
+    args = parser.parse_args()
+
+    if args.no_cache:
+        os.environ['cache_ttl'] = '0'
+    results = Benchmark(args.software, args.vendors, args.owners, args.iterations).run()
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    for name, result in results['routes'].items():
+        print(f'{name:28} p50 {result["p50_ms"]:9.2f} ms  p95 {result["p95_ms"]:9.2f} ms  '
+              f'queries {result["queries"]:4}  peak {result["peak_memory_kb"]:9.1f} KiB')
+    if results['not_benchmarked']:
+        print(f'Not benchmarked: {", ".join(results["not_benchmarked"])}')
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
+
+
+if __name__ == '__main__':
+    main()
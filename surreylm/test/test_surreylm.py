@@ -1,8 +1,19 @@
+import contextlib
+import datetime
 import pytest
+import sqlalchemy
+from sqlalchemy.dialects import mysql
 from werkzeug.security import generate_password_hash
 from surreylm import create_app
 from surreylm import db
-from surreylm.database_models import User, Software_owner, Vendor, Software
+from surreylm.database_models import User, Software_owner, Vendor, Software, Archived_software, Audit_event
+from surreylm.throttle import lock_user
+from surreylm.queries import cached_owner_summaries
+from surreylm.bulk_update import summarize_ids
+from surreylm.archive import archive_expired
+from surreylm.audit import audit
+from surreylm.search import search_query
+from surreylm.migrations import require_normalized_columns
 
 
 
@@ -13,6 +24,7 @@ def app():
         db.create_all()
     app.config.update({"TESTING": True})
     yield app
+    app.extensions["surreylm_audit_writer"].flush()  # So no flush timer fires during a later test.
 
 
 @pytest.fixture()
@@ -94,6 +106,24 @@ def login(client):
                        follow_redirects=True)
 
 
+@contextlib.contextmanager
+def count_queries(app):
+    """
+    This function is used to collect the SQL statements run inside the with block, to assert a route's query count.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+    sqlalchemy.event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        sqlalchemy.event.remove(engine, "before_cursor_execute", record)
+
+
 def test_add_vendor(client, app):
     register(client)
     login(client)
@@ -410,3 +440,695 @@ def test_logout(client, app):
     assert response.status_code == 200
     assert b"Login" in response.data
     assert response.request.path == "/login"    # should redirect to login page
+
+
+def test_audit_log_fields(client, app):
+    import logging
+    from surreylm import audit
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    audit.audit_logger.addHandler(handler)
+    try:
+        register(client)
+        login(client)
+        add_vendor(client)
+    finally:
+        audit.audit_logger.removeHandler(handler)
+    record = records[-1]
+    assert record.actor == "jane.doe@outlook.com"
+    assert record.action == "add"
+    assert record.record_type == "vendor"
+    assert record.record_id == 1
+    assert len(audit.logger.handlers) == 1  # Creating many apps should not add duplicate handlers.
+
+
+def test_home_keyset_pagination(client, app):
+    import re
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    with app.app_context():
+        for number in range(5):
+            db.session.add(Software(name=f"Package{number}", version="1", vendor_id=1, owner_id=1,
+                                    license_expiry=datetime.datetime(2030, 1, 1)))
+        db.session.commit()
+    response = client.get("/?sort=name&per_page=2")
+    assert b"Package0" in response.data and b"Package1" in response.data
+    assert b"Package2" not in response.data
+    next_url = re.search(rb'href="([^"]*after=[^"]*)"', response.data).group(1).decode().replace("&amp;", "&")
+    response = client.get(next_url)
+    assert b"Package2" in response.data and b"Package3" in response.data
+    assert b"Package1" not in response.data
+    response = client.get("/?sort=name&order=desc&name=Package4")
+    assert b"Package4" in response.data
+    assert b"Package3" not in response.data
+
+
+def test_home_status_filter_and_counts(client, app):
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    today = datetime.datetime.today()
+    with app.app_context():
+        for name, expiry in (("Old", today - datetime.timedelta(days=10)),
+                             ("Soon", today + datetime.timedelta(days=10)),
+                             ("Later", today + datetime.timedelta(days=100))):
+            db.session.add(Software(name=name, version="1", vendor_id=1, owner_id=1, license_expiry=expiry))
+        db.session.commit()
+        assert Software.query.filter(Software.status == "expiring").one().name == "Soon"
+    response = client.get("/?status=expired")
+    assert b"Old" in response.data
+    assert b"Later" not in response.data
+    assert b"Expired: 1" in response.data
+    assert b"Expiring Soon: 1" in response.data
+    assert b"Ok: 1" in response.data
+
+
+def test_logs_read_backwards(client, app, tmp_path):
+    from surreylm.log_reader import read_log_page
+    log_file = tmp_path / "record.log"
+    log_file.write_text("".join(f"2024-01-0{day} 10:00:00,000 {'WARNING' if day % 2 else 'INFO'} surreylm.audit "
+                                f"MainThread : user{day}@example.com - Entry {day}\n" for day in range(1, 8)))
+    page = read_log_page(str(log_file), limit=2)
+    assert [entry.text[-7:] for entry in page.entries] == ["Entry 7", "Entry 6"]
+    page = read_log_page(str(log_file), before=page.next_offset, limit=2)
+    assert [entry.text[-7:] for entry in page.entries] == ["Entry 5", "Entry 4"]
+    page = read_log_page(str(log_file), level="WARNING", start=datetime.datetime(2024, 1, 2), limit=10)
+    assert [entry.text[-7:] for entry in page.entries] == ["Entry 7", "Entry 5", "Entry 3"]
+    assert page.next_offset is None
+    multibyte_file = tmp_path / "multibyte.log"
+    multibyte_file.write_bytes(("\u00e9" * 50 + "\n").encode("utf-8") * 10)  # 101 bytes but 51 characters a line.
+    page = read_log_page(str(multibyte_file), level="ERROR", scan_limit=250)
+    assert page.next_offset == 10 * 101 - 3 * 101  # Stopped after 303 bytes, not 255 characters.
+
+    app.config["AUDIT_LOG_FILE"] = str(log_file)
+    create_admin_user(app)
+    admin_login(client)
+    response = client.get("/logs?email=user6@example.com")
+    assert response.status_code == 200
+    assert b"Entry 6" in response.data
+    assert b"Entry 7" not in response.data
+
+
+def test_import_software_csv(client, app):
+    import io
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    csv_file = ("name,version,license_expiry,vendor,owner\n"
+                "MATLAB,R2023b,2025-01-31,Mathworks,johnp@gmail.co.uk\n"
+                "Simulink,R2023b,2025-01-31,mathworks,John Power\n"
+                "Unknown,1,2025-01-31,Nobody,johnp@gmail.co.uk\n"
+                "Undated,1,,Mathworks,johnp@gmail.co.uk\n")
+    response = client.post("/import_software", data={"file": (io.BytesIO(csv_file.encode()), "licenses.csv")},
+                           content_type="multipart/form-data", follow_redirects=True)
+    assert response.status_code == 200
+    assert b"Imported 2 licenses, 2 rows rejected." in response.data
+    assert b"Vendor &#34;Nobody&#34; does not exist." in response.data
+    with app.app_context():
+        assert Software.query.count() == 2
+        assert Software.query.filter_by(name="Simulink").one().owner.first_name == "John"
+
+
+def test_import_licenses_command(client, app, runner, tmp_path):
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    json_file = tmp_path / "licenses.json"
+    json_file.write_text('[{"name": "MATLAB", "version": "R2023b", "license_expiry": "2025-01-31", '
+                         '"vendor": "Mathworks", "owner": "johnp@gmail.co.uk"},\n'
+                         ' {"name": "", "version": "R2023b", "license_expiry": "2025-01-31", '
+                         '"vendor": "Mathworks", "owner": "johnp@gmail.co.uk"}]')
+    result = runner.invoke(args=["import-licenses", str(json_file)])
+    assert "Imported 1 software records, 1 rows rejected." in result.output
+    with app.app_context():
+        assert Software.query.count() == 1
+
+
+def test_export_software(client, app, runner):
+    import json
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    add_software(client)
+    response = client.get("/export_software.csv")
+    assert response.status_code == 200
+    assert response.data.decode().splitlines() == ["id,name,version,license_expiry,vendor,owner,owner_name",
+                                                   "1,MATLAB,R2020b,2024-12-31,Mathworks,johnp@gmail.co.uk,John Power"]
+    response = client.get("/export_software.jsonl?name=Simulink")
+    assert response.data == b""
+    result = runner.invoke(args=["export-licenses", "--format", "jsonl"])
+    assert json.loads(result.output)["vendor"] == "Mathworks"
+
+
+def test_api_conditional_get(client, app):
+    app.config["CACHE_TTL"] = 3600  # So the ETags cannot roll over to a new ttl window during the test.
+    response = client.get("/api/v1/software")
+    assert response.status_code == 401
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    add_software(client)
+    response = client.get("/api/v1/software?fields=name,vendor")
+    assert response.status_code == 200
+    assert response.json["items"] == [{"name": "MATLAB", "vendor": "Mathworks"}]
+    etag = response.headers["ETag"]
+    with count_queries(app) as statements:
+        response = client.get("/api/v1/software?fields=name,vendor", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert statements == []  # Answered from the table generations, without querying.
+    assert client.get("/api/v1/software?fields=name", headers={"If-None-Match": etag}).status_code == 200
+    client.post("/edit_vendor/1", data={"name": "MathWorks", "email": "support@mathworks.com",
+                                        "phone": "09876827994"})
+    response = client.get("/api/v1/software?fields=name,vendor", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["items"][0]["vendor"] == "MathWorks"
+    assert client.get("/api/v1/owners/1").json["email"] == "johnp@gmail.co.uk"
+    assert client.get("/api/v1/vendors/2").status_code == 404
+
+
+def test_cache_invalidated_on_write(client, app):
+    register(client)
+    login(client)
+    add_vendor(client)
+    assert b"support@mathworks.com" in client.get("/all_vendors").data
+    with app.app_context():
+        Vendor.query.first().email = "changed@mathworks.com"
+        db.session.commit()
+    assert b"changed@mathworks.com" in client.get("/all_vendors").data
+    client.post("/edit_vendor/1", data={"name": "Mathworks", "email": "sales@mathworks.com", "phone": "09876827994"})
+    response = client.get("/all_vendors")
+    assert b"sales@mathworks.com" in response.data
+    assert b"support@mathworks.com" not in response.data
+
+
+def test_lru_cache_eviction_and_ttl():
+    from surreylm.cache import LRUCache, MISSING
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)  # "b" is the least recently used entry.
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    cache.set("d", 4, ttl=-1)
+    assert cache.get("d") is MISSING
+
+
+def test_cache_invalidation_is_shared_through_the_backend():
+    from surreylm.cache import Cache, LRUCache
+    backend = LRUCache(max_entries=10, ttl=60)
+    worker_a, worker_b = Cache(backend), Cache(backend)
+    assert worker_a.get_or_load("vendors", ["vendors"], lambda: "old") == "old"
+    assert worker_b.get_or_load("vendors", ["vendors"], lambda: "unused") == "old"
+    worker_b.invalidate("vendors")  # A write committed in the other worker.
+    assert worker_a.get_or_load("vendors", ["vendors"], lambda: "new") == "new"
+    backend.clear()  # Generations that are evicted start again from a later value.
+    assert worker_a.get_or_load("vendors", ["vendors"], lambda: "newer") == "newer"
+
+
+def test_engine_options_and_pool_metrics(client, app):
+    from surreylm.db_pool import engine_options, TimedQueuePool
+    options = engine_options({**app.config, "SQLALCHEMY_DATABASE_URI": "mysql+mysqlconnector://u:p@host/db"})
+    assert options["poolclass"] is TimedQueuePool
+    assert options["pool_pre_ping"] is True
+    assert options["pool_recycle"] == 230
+    assert engine_options(app.config) == {}  # SQLite keeps its own pooling.
+    create_admin_user(app)
+    admin_login(client)
+    metrics = client.get("/db_pool").json["metrics"]
+    assert metrics["checkouts"] >= 1
+
+
+def test_benchmark_covers_every_route(tmp_path):
+    from surreylm.test.benchmark_routes import Benchmark
+    results = Benchmark(software=30, vendors=3, owners=3, iterations=1,
+                        database_path=str(tmp_path / "benchmark.db")).run()
+    assert results["not_benchmarked"] == []
+    assert results["routes"]["home"]["queries"] >= 1
+
+
+def lock_account(client):
+    for _ in range(3):
+        client.post("/login", data={"email": "jane.doe@outlook.com", "password": "Wrongpass1"})
+
+
+def test_unlock_users_command(client, app, runner):
+    register(client)
+    client.get("/logout")
+    lock_account(client)
+    with app.app_context():
+        assert User.query.first().locked
+        assert User.query.first().locked_at is not None
+    result = runner.invoke(args=["unlock-users"])
+    assert "Unlocked 1 users." in result.output
+    with app.app_context():
+        assert not User.query.first().locked
+        assert User.query.first().failed_login_attempts == 0
+
+
+def test_lockout_cooldown_unlocks_at_login(client, app):
+    register(client)
+    client.get("/logout")
+    lock_account(client)
+    response = login(client)
+    assert b"Account has been locked" in response.data
+    with app.app_context():
+        User.query.first().locked_at = datetime.datetime.utcnow() - datetime.timedelta(minutes=31)
+        db.session.commit()
+    response = login(client)
+    assert response.request.path == "/"
+    with app.app_context():
+        assert not User.query.first().locked
+
+
+def test_expiry_notice_digests(client, app, tmp_path):
+    from surreylm.notifications import FileSender, send_expiry_notices
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    now = datetime.datetime(2024, 1, 1)
+    with app.app_context():
+        for name, days in (("Soon", 5), ("Later", 45), ("Much later", 100)):
+            db.session.add(Software(name=name, version="1", vendor_id=1, owner_id=1,
+                                    license_expiry=now + datetime.timedelta(days=days)))
+        db.session.commit()
+        sender = FileSender(str(tmp_path))
+        assert send_expiry_notices(sender, [60, 30, 7], "surreylm@surrey.ac.uk", now=now) == 1
+        digest = next(tmp_path.iterdir()).read_text()
+        assert "Soon 1 (Mathworks)" in digest and "within 7 days" in digest
+        assert "Later 1 (Mathworks)" in digest and "within 60 days" in digest
+        assert "Much later" not in digest
+        assert send_expiry_notices(sender, [60, 30, 7], "surreylm@surrey.ac.uk", now=now) == 0  # Nothing new.
+        later = now + datetime.timedelta(days=20)
+        assert send_expiry_notices(sender, [60, 30, 7], "surreylm@surrey.ac.uk", now=later) == 1
+        assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_expiry_notices_include_licenses_added_after_a_run(client, app, tmp_path):
+    from surreylm.notifications import FileSender, send_expiry_notices
+    from surreylm.leases import acquire_lease
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    now = datetime.datetime(2024, 1, 1)
+    with app.app_context():
+        sender = FileSender(str(tmp_path))
+        assert send_expiry_notices(sender, [60, 30, 7], "surreylm@surrey.ac.uk", now=now) == 0
+        db.session.add(Software(name="New", version="1", vendor_id=1, owner_id=1,
+                                license_expiry=now + datetime.timedelta(days=5)))
+        db.session.commit()
+        sent = [send_expiry_notices(sender, [60, 30, 7], "surreylm@surrey.ac.uk",
+                                    now=now + datetime.timedelta(days=day)) for day in range(1, 6)]
+        assert sent == [1, 0, 0, 0, 0]
+        assert acquire_lease("expiry-notifier", 60, holder="worker-a", now=now)
+        assert not acquire_lease("expiry-notifier", 60, holder="worker-b", now=now)
+        assert acquire_lease("expiry-notifier", 60, holder="worker-a", now=now + datetime.timedelta(seconds=30))
+        assert acquire_lease("expiry-notifier", 60, holder="worker-b", now=now + datetime.timedelta(seconds=90))
+
+
+def test_search(client, app):
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    add_software(client)
+    client.post("/add_software", data={"name": "Office", "version": "365", "expiry_date": "2024-12-31",
+                                       "vendor": "1", "owner": "1"})
+    response = client.get("/search?q=matl")
+    assert b"MATLAB" in response.data
+    assert b"Office" not in response.data
+    assert b"Office" in client.get("/search?q=john 365").data
+    client.post("/edit_vendor/1", data={"name": "Microsoft", "email": "support@microsoft.com",
+                                        "phone": "09876827994"})
+    assert b"Office" in client.get("/search?q=microsoft").data  # The index follows vendor changes.
+    assert b"No licenses match" in client.get("/search?q=mathworks").data
+    with app.app_context():
+        statement = str(search_query(["john", "365"], "mysql").statement.compile(dialect=mysql.dialect()))
+    # One MATCH over the single search table, so words may match different fields as on SQLite.
+    assert statement.count("MATCH (software_search.name, software_search.version, software_search.vendor, "
+                           "software_search.owner) AGAINST") == 2  # The filter and the relevance order.
+    assert "vendors.name) AGAINST" not in statement
+
+
+def test_user_loader_cached_and_invalidated(client, app):
+    create_admin_user(app)
+    admin_login(client)
+    client.get("/")
+    with count_queries(app) as statements:
+        assert client.get("/db_pool").status_code == 200
+    assert not [statement for statement in statements if "FROM users" in statement]
+    with app.app_context():
+        db.session.get(User, 1).admin = False
+        db.session.commit()
+    assert client.get("/db_pool").status_code == 403  # The snapshot is dropped when admin changes.
+
+
+def test_login_throttled_per_ip(client, app):
+    register(client)
+    client.get("/logout")
+    app.extensions["surreylm_login_throttle"].max_ip_failures = 2
+    for email in ("first@outlook.com", "second@outlook.com"):
+        client.post("/login", data={"email": email, "password": "Wrongpass1"})
+    response = login(client)  # Correct details, rejected before the password is checked.
+    assert response.status_code == 429
+    assert b"Too many failed login attempts" in response.data
+    with app.app_context():
+        assert not User.query.first().locked
+        assert lock_user("jane.doe@outlook.com", 3)
+        assert not lock_user("jane.doe@outlook.com", 3)  # A concurrent lock changes nothing.
+
+
+def test_login_throttle_uses_forwarded_client_ip(monkeypatch):
+    monkeypatch.setenv("trusted_proxy_hops", "1")
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    register(client)
+    client.get("/logout")
+    app.extensions["surreylm_login_throttle"].max_ip_failures = 2
+    for email in ("first@outlook.com", "second@outlook.com"):
+        client.post("/login", data={"email": email, "password": "Wrongpass1"},
+                    headers={"X-Forwarded-For": "203.0.113.1"})
+    response = client.post("/login", data={"email": "jane.doe@outlook.com", "password": "Pandabear55"},
+                           headers={"X-Forwarded-For": "203.0.113.1"})
+    assert response.status_code == 429
+    response = client.post("/login", data={"email": "jane.doe@outlook.com", "password": "Pandabear55"},
+                           headers={"X-Forwarded-For": "198.51.100.7"})
+    assert response.status_code == 302  # Another client behind the same proxy can still log in.
+    app.extensions["surreylm_audit_writer"].flush()
+
+
+def test_vendor_and_owner_uniqueness_ignores_case(client, app):
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    client.post("/add_vendor", data={"name": "Microsoft", "phone": "09876827994", "email": "support@microsoft.com"})
+    response = client.post("/edit_vendor/2", data={"name": " MATHWORKS", "phone": "09876827994",
+                                                   "email": "support@microsoft.com"})
+    assert b"Vendor already exists." in response.data
+    response = client.post("/add_owner", data={"email": "JOHNP@Gmail.co.uk", "first_name": "John",
+                                               "last_name": "Power", "phone_extension": "1234"})
+    assert b"Software owner already exists." in response.data
+    with app.app_context():
+        assert Vendor.query.get(2).name == "Microsoft"
+        assert Vendor.query.get(1).name_normalized == "mathworks"
+        assert Software_owner.query.count() == 1
+
+
+def test_create_app_without_database_io_and_migrate():
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    sqlalchemy.event.listen(sqlalchemy.engine.Engine, "before_cursor_execute", record)
+    try:
+        app = create_app()
+    finally:
+        sqlalchemy.event.remove(sqlalchemy.engine.Engine, "before_cursor_execute", record)
+    assert statements == []
+    report = app.extensions["surreylm_startup"].as_dict()
+    assert "blueprint_registration" in report["create_app_ms"]
+    assert report["dependency_import_ms"] > 0
+
+    with app.app_context():  # A vendors table from before the normalized name column was added.
+        db.session.execute(sqlalchemy.text("CREATE TABLE vendors (id INTEGER PRIMARY KEY, name VARCHAR(50) UNIQUE "
+                                           "NOT NULL, phone VARCHAR(50) NOT NULL, email VARCHAR(50) NOT NULL)"))
+        db.session.execute(sqlalchemy.text("INSERT INTO vendors VALUES (1, 'MathWorks', '01234567890', 'a@b.com')"))
+        db.session.execute(sqlalchemy.text("CREATE TABLE software_owners (id INTEGER PRIMARY KEY, email VARCHAR(50) "
+                                           "UNIQUE NOT NULL, first_name VARCHAR(50) NOT NULL, last_name VARCHAR(50) "
+                                           "NOT NULL, phone_extension VARCHAR(50) NOT NULL)"))
+        db.session.execute(sqlalchemy.text("INSERT INTO software_owners VALUES (1, 'Ann@surrey.ac.uk', 'Ann', 'Smith', "
+                                           "'1234')"))
+        db.session.commit()
+    runner = app.test_cli_runner()
+    assert "Database is up to date (12 migrations applied)." in runner.invoke(args=["migrate"]).output
+    assert "(0 migrations applied)" in runner.invoke(args=["migrate"]).output
+    assert "pending" not in runner.invoke(args=["migrate", "--status"]).output
+    with app.app_context():
+        assert Vendor.query.one().name_normalized == "mathworks"
+        owner = Software_owner.query.one()
+        assert (owner.email_normalized, owner.name_normalized) == ("ann@surrey.ac.uk", "smith ann")
+        db.session.execute(sqlalchemy.text("INSERT INTO vendors (id, name, phone, email) "
+                                           "VALUES (2, ' Oracle', '01234567890', 'b@c.com')"))
+        require_normalized_columns(db.session.connection())
+        assert db.session.get(Vendor, 2).name_normalized == "oracle"
+        assert User.query.count() == 0
+
+
+def test_metrics_endpoint(client, app):
+    create_admin_user(app)
+    register(client)
+    login(client)
+    client.get("/all_vendors")
+    assert client.get("/metrics").status_code == 403
+    client.get("/logout")
+    admin_login(client)
+    response = client.get("/metrics")
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert 'surreylm_request_duration_seconds_count{endpoint="views.all_vendors",method="GET"} 1' in text
+    assert 'le="+Inf"' in text
+    assert 'surreylm_requests_total{endpoint="views.metrics",method="GET",status="403"} 1' in text
+    assert 'surreylm_db_queries_total{endpoint="views.all_vendors"}' in text
+
+
+# The most SQL statements each route may run with several records of each kind. Raise a budget only on purpose.
+ROUTE_QUERY_BUDGETS = {"/": 2, "/?sort=vendor&order=desc": 2, "/edit_software/1": 1, "/add_software": 0,
+                       "/view_owner/1": 1, "/view_vendor/1": 1, "/all_owners": 1, "/all_vendors": 1,
+                       "/search?q=soft": 1, "/api/v1/software": 1, "/api/v1/owners/1": 1}
+
+
+def test_route_query_budgets(client, app, caplog):
+    create_admin_user(app)
+    admin_login(client)
+    for number in range(4):
+        client.post("/add_vendor", data={"name": f"Vendor {number}", "email": f"sales{number}@vendor.com",
+                                         "phone": "09876827994"})
+        client.post("/add_owner", data={"first_name": "John", "last_name": "Power",
+                                        "email": f"owner{number}@surrey.ac.uk", "phone_extension": "1234"})
+    for number in range(8):
+        client.post("/add_software", data={"name": f"Software {number}", "version": "1", "expiry_date": "2030-01-01",
+                                           "vendor": str(number % 4 + 1), "owner": str(number % 4 + 1)})
+    for url, budget in ROUTE_QUERY_BUDGETS.items():
+        app.extensions["surreylm_cache"].backend.clear()
+        with count_queries(app) as statements:
+            assert client.get(url).status_code == 200
+        assert len(statements) <= budget, f"{url} ran {len(statements)} queries: {statements}"
+
+    app.config["QUERY_BUDGET"] = 0
+    app.logger.addHandler(caplog.handler)  # The app logger does not propagate to the root logger.
+    try:
+        client.get("/view_vendor/1")
+    finally:
+        app.logger.removeHandler(caplog.handler)
+    assert "views.view_vendor ran 1 SQL statements, over its budget of 0" in caplog.text
+    assert "WHERE vendors.id = ?" in caplog.text
+
+
+def test_owner_and_vendor_license_aggregates(client, app):
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    client.post("/add_owner", data={"first_name": "Ann", "last_name": "Lee", "email": "ann@surrey.ac.uk",
+                                    "phone_extension": "4321"})
+    soon = (datetime.date.today() + datetime.timedelta(days=10)).isoformat()
+    later = (datetime.date.today() + datetime.timedelta(days=400)).isoformat()
+    for name, expiry in (("Old", "2020-01-01"), ("Soon", soon), ("Later", later)):
+        client.post("/add_software", data={"name": name, "version": "1", "expiry_date": expiry, "vendor": "1",
+                                           "owner": "1"})
+    response = client.get("/view_owner/1")
+    assert b"Licenses: 3 (1 expired, 1 expiring)" in response.data
+    assert f"Next Expiry: {soon} 00:00:00".encode() in response.data
+    assert b"Mathworks" in response.data
+    assert b"Licenses: 0 (0 expired, 0 expiring)" in client.get("/view_owner/2").data
+    assert b"John Power" in client.get("/view_vendor/1").data
+    with app.app_context():
+        owners = {owner["email"]: owner for owner in cached_owner_summaries()}
+    assert (owners["johnp@gmail.co.uk"]["license_count"], owners["johnp@gmail.co.uk"]["expired"]) == (3, 1)
+    assert owners["ann@surrey.ac.uk"]["next_expiry"] is None
+
+
+def test_vendor_and_owner_typeahead(client, app):
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    for name in ("Matrix Labs", "Microsoft", "Oracle"):
+        client.post("/add_vendor", data={"name": name, "phone": "09876827994", "email": "sales@vendor.com"})
+    response = client.get("/api/v1/vendors/lookup?q=MAT")
+    assert response.get_json()["items"] == [{"id": 1, "name": "Mathworks"}, {"id": 2, "name": "Matrix Labs"}]
+    assert len(client.get("/api/v1/vendors/lookup?q=m&limit=1").get_json()["items"]) == 1
+    assert client.get("/api/v1/owners/lookup?q=john").get_json()["items"] == [
+        {"id": 1, "name": "John Power (johnp@gmail.co.uk)"}]
+    client.post("/add_owner", data={"first_name": "Jane", "last_name": "Smith", "email": "jp@surrey.ac.uk",
+                                    "phone_extension": "1234"})
+    assert client.get("/api/v1/owners/lookup?q=Smi").get_json()["items"] == [
+        {"id": 2, "name": "Jane Smith (jp@surrey.ac.uk)"}]
+    assert client.get("/api/v1/owners/lookup?q=smith j").get_json()["items"] == [
+        {"id": 2, "name": "Jane Smith (jp@surrey.ac.uk)"}]
+    assert [owner["id"] for owner in client.get("/api/v1/owners/lookup?q=j").get_json()["items"]] == [1, 2]
+    client.post("/edit_owner/2", data={"first_name": "Jane", "last_name": "Jones", "email": "jp@surrey.ac.uk",
+                                       "phone_extension": "1234"})
+    assert client.get("/api/v1/owners/lookup?q=smi").get_json()["items"] == []
+    assert client.get("/api/v1/owners/lookup?q=JONES").get_json()["items"][0]["id"] == 2
+    assert [owner["id"] for owner in client.get("/api/v1/owners/lookup?q=j").get_json()["items"]] == [2, 1]
+    page = client.get("/add_software").data
+    assert b"Oracle" not in page and b'data-lookup="/api/v1/vendors/lookup"' in page
+    response = client.post("/add_software", data={"name": "MATLAB", "version": "R2023a", "expiry_date": "2030-01-01",
+                                                  "vendor": "", "owner": "1"})
+    assert b"Please select a vendor from the list." in response.data
+    response = client.post("/add_software", data={"name": "MATLAB", "version": "R2023a", "expiry_date": "2030-01-01",
+                                                  "vendor": "1", "owner": "99"})
+    assert b"Please select an owner from the list." in response.data
+    add_software(client)
+    response = client.post("/edit_software/1", data={"name": "MATLAB", "version": "R2023a", "expiry_date": "2030-01-01",
+                                                     "vendor": "", "owner": "1"})
+    assert b"Please select a vendor from the list." in response.data
+    with app.app_context():
+        assert db.session.get(Software, 1).vendor_id == 1
+
+
+def test_bulk_update_software(client, app):
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    client.post("/add_owner", data={"first_name": "Ann", "last_name": "Lee", "email": "ann@surrey.ac.uk",
+                                    "phone_extension": "4321"})
+    for name, expiry in (("Site A", "2024-01-31"), ("Site B", "2024-06-15"), ("Other", "2024-06-15")):
+        client.post("/add_software", data={"name": name, "version": "1", "expiry_date": expiry, "vendor": "1",
+                                           "owner": "1"})
+    with count_queries(app) as statements:
+        response = client.post("/bulk_update_software", data={"action": "extend", "months": "12", "scope": "filter",
+                                                              "name": "Site"}, follow_redirects=True)
+    assert b"2 licenses extended by 12 months." in response.data
+    assert len([statement for statement in statements if statement.startswith("UPDATE software")]) == 1
+    client.post("/bulk_update_software", data={"action": "reassign_owner", "owner": "2", "ids": ["2", "3"]})
+    with app.app_context():
+        software = {record.name: record for record in Software.query}
+        assert software["Site A"].license_expiry == datetime.datetime(2025, 1, 31)
+        assert software["Site B"].license_expiry == datetime.datetime(2025, 6, 15)
+        assert software["Other"].license_expiry == datetime.datetime(2024, 6, 15)
+        assert [software[name].owner_id for name in ("Site A", "Site B", "Other")] == [1, 2, 2]
+    response = client.post("/bulk_update_software", data={"action": "reassign_vendor", "vendor": "99", "ids": ["1"]},
+                           follow_redirects=True)
+    assert b"Please choose a valid number of months" in response.data
+    response = client.post("/bulk_update_software", data={"action": "drop", "ids": ["1"]}, follow_redirects=True)
+    assert b"Please choose a bulk action." in response.data
+    response = client.post("/bulk_update_software", data={"action": "extend", "months": "1", "scope": "filter"},
+                           follow_redirects=True)
+    assert b"Please filter the license list" in response.data
+    client.post("/bulk_update_software", data={"action": "extend", "months": "1", "ids": ["1"]})
+    with app.app_context():
+        assert db.session.get(Software, 1).license_expiry == datetime.datetime(2025, 2, 28)  # Capped at month end.
+        db.session.get(Software, 1).license_expiry = datetime.datetime(2024, 1, 31, 9, 30)
+        db.session.commit()
+    client.post("/bulk_update_software", data={"action": "extend", "months": "1", "ids": ["1"]})
+    with app.app_context():
+        assert db.session.get(Software, 1).license_expiry == datetime.datetime(2024, 2, 29, 9, 30)
+    assert summarize_ids([1, 2, 3, 5, 7, 8]) == "1-3, 5, 7-8"
+
+
+def test_archive_and_restore_software(client, app):
+    create_admin_user(app)
+    admin_login(client)
+    add_vendor(client)
+    add_owner(client)
+    for name, expiry in (("Old One", "2019-03-01"), ("Old Two", "2020-03-01"), ("Current", "2030-03-01")):
+        client.post("/add_software", data={"name": name, "version": "1", "expiry_date": expiry, "vendor": "1",
+                                           "owner": "1"})
+    with app.app_context():
+        assert archive_expired(365, batch_size=1) == 2
+        assert [software.name for software in Software.query] == ["Current"]
+        archived = {record.name: record for record in Archived_software.query}
+        assert archived["Old Two"].software_id == 2
+    response = client.get("/history?name=Old")
+    assert b"Old One" in response.data and b"Old Two" in response.data and b"Current" not in response.data
+    assert b"Old One" not in client.get("/").data
+    response = client.post(f"/restore_software/{archived['Old Two'].id}", follow_redirects=True)
+    assert b"Software restored!" in response.data
+    with app.app_context():
+        assert db.session.get(Software, 2).name == "Old Two"
+        assert [record.name for record in Archived_software.query] == ["Old One"]
+
+
+def test_audit_events_are_batched_and_queryable(client, app):
+    create_admin_user(app)
+    admin_login(client)
+    add_vendor(client)
+    add_owner(client)
+    add_software(client)
+    writer = app.extensions["surreylm_audit_writer"]
+    with app.app_context():
+        assert Audit_event.query.count() == 0  # Still buffered.
+    client.post("/edit_software/1", data={"name": "Matlab", "version": "2", "expiry_date": "2030-01-01",
+                                          "vendor": "1", "owner": "1"})
+    with count_queries(app) as statements:
+        assert writer.flush() == 5  # Login, three adds and the update.
+    assert len(statements) == 1
+    response = client.get("/audit?record_type=software&record_id=1")
+    assert b"Software record 1 has been updated" in response.data
+    assert b"version: R2020b &rarr; 2" in response.data
+    assert b"license_expiry: 2024-12-31 00:00:00 &rarr; 2030-01-01 00:00:00" in response.data
+    assert b"Logged in successfully" not in response.data
+    response = client.get("/audit?actor=sandyt@gmail.com&start=2000-01-01T00:00")
+    assert b"Logged in successfully" in response.data
+    assert b"No audit events match." in client.get("/audit?end=2000-01-01T00:00").data
+
+
+def test_audit_events_are_flushed_by_a_timer(app):
+    writer = app.extensions["surreylm_audit_writer"]
+    writer.flush_seconds = 0.2
+    with app.app_context():
+        audit("archive", "Idle worker event.", "software", actor="scheduler")
+        timer = writer.timer
+        assert timer.daemon
+        timer.join()
+        assert writer.timer is None
+        assert [event.message for event in Audit_event.query] == ["Idle worker event."]
+
+
+def test_concurrent_edits_are_reported_not_overwritten(client, app):
+    register(client)
+    login(client)
+    add_vendor(client)
+    add_owner(client)
+    add_software(client)
+    assert b'name="row_version" value="1"' in client.get("/edit_software/1").data
+    form = {"name": "MATLAB", "version": "R2021a", "expiry_date": "2025-01-31", "vendor": "1", "owner": "1",
+            "row_version": "1"}
+    assert b"Software updated!" in client.post("/edit_software/1", data=form, follow_redirects=True).data
+    response = client.post("/edit_software/1", data={**form, "version": "R2019a"}, follow_redirects=True)
+    assert b"changed by someone else" in response.data
+    assert b"version: R2021a, expiry date: 31/01/2025" in response.data
+    assert b'name="row_version" value="2"' in response.data
+    client.post("/bulk_update_software", data={"action": "extend", "months": "1", "ids": ["1"]})
+    response = client.post("/edit_vendor/1", data={"name": "Mathworks", "email": "sales@mathworks.com",
+                                                   "phone": "01234567890", "row_version": "2"},
+                           follow_redirects=True)
+    assert b"This vendor record was changed by someone else" in response.data
+    with app.app_context():
+        assert db.session.get(Software, 1).version == "R2021a"
+        assert db.session.get(Software, 1).row_version == 3
+        vendor = db.session.get(Vendor, 1)
+        with db.engine.begin() as connection:  # Another request updates the vendor after it was loaded.
+            connection.execute(sqlalchemy.text("UPDATE vendors SET row_version = row_version + 1 WHERE id = 1"))
+        vendor.phone = "09876543210"
+        with pytest.raises(sqlalchemy.orm.exc.StaleDataError):
+            db.session.commit()
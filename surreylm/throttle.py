@@ -0,0 +1,161 @@
+# Purpose of this file: This file contains the login throttling for the License Management System. Failed logins are
+# counted per account and per client IP in sliding windows held in a pluggable store, so a failed login does not write
+# to the database. Clients over the limit are rejected before the password hash is checked, and an account over the
+# limit is locked with a single atomic UPDATE.
+
+# Importing the required modules.
+import datetime
+import threading
+import time
+from collections import OrderedDict, deque
+from flask import current_app
+from . import db
+from surreylm.database_models import User
+
+
+class MemoryStore:
+    """
+    This class is used to hold the failed login times for each key in process memory. Keys with no failures in the
+    window are dropped, and the oldest key is evicted once max_keys is reached.
+
+    Any object with the same hit, count and reset methods can be used as a store instead, for example one backed by a
+    server shared between processes.
+    """
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.failures = OrderedDict()
+        self.lock = threading.Lock()
+
+    def prune(self, key, now, window):
+        """
+        This function is used to drop the failures for a key that are older than the window.
+        :param key: The key.
+        :param now: The current time, in seconds.
+        :param window: The length of the window, in seconds.
+        :return: Returns the failures left in the window.
+        """
+        times = self.failures.get(key)
+        if times is None:
+            return ()
+        while times and times[0] <= now - window:
+            times.popleft()
+        if not times:
+            del self.failures[key]
+        return times
+
+    def hit(self, key, window, now=None):
+        """
+        This function is used to record a failure for a key.
+        :param key: The key.
+        :param window: The length of the window, in seconds.
+        :param now: The current time, in seconds, defaults to now.
+        :return: Returns the number of failures for the key in the window, including this one.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.prune(key, now, window)
+            times = self.failures.setdefault(key, deque())
+            times.append(now)
+            self.failures.move_to_end(key)
+            while len(self.failures) > self.max_keys:
+                self.failures.popitem(last=False)
+            return len(times)
+
+    def count(self, key, window, now=None):
+        """
+        This function is used to count the failures for a key in the window.
+        :param key: The key.
+        :param window: The length of the window, in seconds.
+        :param now: The current time, in seconds, defaults to now.
+        :return: Returns the number of failures.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return len(self.prune(key, now, window))
+
+    def reset(self, key):
+        """
+        This function is used to forget the failures for a key.
+        :param key: The key.
+        :return: Returns nothing.
+        """
+        with self.lock:
+            self.failures.pop(key, None)
+
+
+class LoginThrottle:
+    """
+    This class is used to apply the login limits: max_failures per account and max_ip_failures per client IP within
+    window seconds.
+    """
+    def __init__(self, store, max_failures=3, max_ip_failures=20, window=900):
+        self.store = store
+        self.max_failures = max_failures
+        self.max_ip_failures = max_ip_failures
+        self.window = window
+
+    def ip_blocked(self, ip):
+        """
+        This function is used to check whether a client IP has too many failed logins in the window.
+        :param ip: The client IP.
+        :return: Returns True if logins from the IP should be rejected, else returns False.
+        """
+        return self.store.count(f'ip:{ip}', self.window) >= self.max_ip_failures
+
+    def failed(self, email, ip):
+        """
+        This function is used to record a failed login.
+        :param email: The email the login was for.
+        :param ip: The client IP.
+        :return: Returns True if the account has reached its limit and should be locked, else returns False.
+        """
+        self.store.hit(f'ip:{ip}', self.window)
+        if self.store.hit(f'email:{email.lower()}', self.window) >= self.max_failures:
+            self.store.reset(f'email:{email.lower()}')  # The lock is now held by the users table.
+            return True
+        return False
+
+    def succeeded(self, email):
+        """
+        This function is used to forget the failed logins for an account after a successful login or an unlock.
+        :param email: The email of the account.
+        :return: Returns nothing.
+        """
+        self.store.reset(f'email:{email.lower()}')
+
+
+def init_login_throttle(app, store=None):
+    """
+    This function is used to set up the login throttle for the flask app.
+    :param app: The flask app, used to read the LOGIN_MAX_FAILURES, LOGIN_IP_MAX_FAILURES and LOGIN_WINDOW_SECONDS
+    settings.
+    :param store: The failure store, defaults to an in-process MemoryStore.
+    :return: Returns the login throttle.
+    """
+    app.extensions['surreylm_login_throttle'] = LoginThrottle(
+        store or MemoryStore(), app.config['LOGIN_MAX_FAILURES'], app.config['LOGIN_IP_MAX_FAILURES'],
+        app.config['LOGIN_WINDOW_SECONDS'])
+    return app.extensions['surreylm_login_throttle']
+
+
+def login_throttle():
+    """
+    This function is used to get the current app's login throttle.
+    :return: Returns the login throttle.
+    """
+    return current_app.extensions['surreylm_login_throttle']
+
+
+def lock_user(email, failed_attempts):
+    """
+    This function is used to lock an account with a single UPDATE. Only an unlocked account is changed, so concurrent
+    failed logins lock it once.
+    :param email: The email of the account.
+    :param failed_attempts: The number of failed logins that caused the lock.
+    :return: Returns True if this call locked the account, else returns False.
+    """
+    locked = (User.query.filter(User.email == email, User.locked.isnot(True))
+              .update({User.locked: True, User.locked_at: datetime.datetime.utcnow(),
+                       User.failed_login_attempts: failed_attempts}, synchronize_session=False))
+    db.session.commit()
+    return locked == 1
@@ -1,26 +1,35 @@
-import sys
+# Purpose of this file: This file contains the account unlocking for the License Management System. Locked accounts are
+# unlocked with a single UPDATE, by the 'flask unlock-users' command, or automatically at login once the lockout
+# cooldown has passed.
 
-sys.path.append("/Users/hollysherlock/PycharmProjects/sed-assignment")
-from surreylm import db
+# Importing the required modules.
+import datetime
+from . import db
 from surreylm.database_models import User
-from surreylm import create_app
 
-app = create_app()
 
-
-def unlock_users():
+def unlock_users(email=None):
     """
     This function is used to unlock users who have been locked out of their account.
-    :return: Returns nothing.
+    :param email: Only unlock the user with this email, defaults to every locked user.
+    :return: Returns the number of users unlocked.
     """
-    with app.app_context():
-        users = User.query.all()
-        for user in users:
-            if user.locked:
-                user.locked = False
-                user.failed_login_attempts = 0
-                db.session.commit()
-                print("User " + str(user.email) + " has been unlocked.")
+    query = User.query.filter(User.locked.is_(True))
+    if email:
+        query = query.filter(User.email == email)
+    unlocked = query.update({User.locked: False, User.failed_login_attempts: 0, User.locked_at: None},
+                            synchronize_session=False)
+    db.session.commit()
+    return unlocked
 
 
-unlock_users()
+def cooldown_passed(user, cooldown_minutes):
+    """
+    This function is used to check whether a locked user's lockout cooldown has passed.
+    :param user: The locked user.
+    :param cooldown_minutes: The number of minutes an account stays locked, 0 to only unlock manually.
+    :return: Returns True if the user can be unlocked, else returns False.
+    """
+    if not cooldown_minutes or user.locked_at is None:
+        return False
+    return datetime.datetime.utcnow() - user.locked_at >= datetime.timedelta(minutes=cooldown_minutes)
@@ -0,0 +1,113 @@
+# Purpose of this file: This file contains the cached user loader used by Flask-Login. Each request reloads the
+# logged-in user from the session, so a slim snapshot of the user (id, email, admin and locked) is kept in a
+# per-process cache rather than read from the database on every page view. A commit that changes a user's admin or
+# locked state removes their snapshot; other processes see the change once their snapshot's TTL runs out.
+
+# Importing the required modules.
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from . import db
+from surreylm.cache import LRUCache, MISSING
+from surreylm.database_models import User
+
+ALL_USERS = object()  # Recorded when a bulk statement changes users, so every snapshot is removed.
+
+
+class SessionUser(UserMixin):
+    """
+    This class is used as the logged-in user for a request. It holds only the columns the views and templates read.
+    """
+    def __init__(self, id, email, admin, locked):
+        self.id = id
+        self.email = email
+        self.admin = bool(admin)
+        self.locked = bool(locked)
+
+
+def init_user_cache(app):
+    """
+    This function is used to set up the user cache for the flask app.
+    :param app: The flask app, used to read the CACHE_MAX_ENTRIES and USER_CACHE_TTL settings.
+    :return: Returns the user cache.
+    """
+    app.extensions['surreylm_user_cache'] = LRUCache(app.config['CACHE_MAX_ENTRIES'], app.config['USER_CACHE_TTL'])
+    if not event.contains(db.session, 'after_flush', track_user_changes):
+        event.listen(db.session, 'after_flush', track_user_changes)
+        event.listen(db.session, 'do_orm_execute', track_bulk_user_changes)
+        event.listen(db.session, 'after_commit', invalidate_users)
+        event.listen(db.session, 'after_soft_rollback', discard_user_changes)
+    return app.extensions['surreylm_user_cache']
+
+
+def load_session_user(user_id):
+    """
+    This function is used to load the logged-in user, from the user cache if their snapshot is cached.
+    :param user_id: The user ID stored in the session.
+    :return: Returns the SessionUser, or None if the user does not exist.
+    """
+    users = current_app.extensions['surreylm_user_cache']
+    user = users.get(user_id)
+    if user is MISSING:
+        row = (db.session.query(User.id, User.email, User.admin, User.locked)
+               .filter(User.id == user_id).one_or_none())
+        if row is None:
+            return None
+        user = SessionUser(*row)
+        users.set(user_id, user)
+    return user
+
+
+def track_user_changes(session, flush_context):
+    """
+    This function is used to record the users whose admin or locked state was changed or who were deleted by a flush,
+    so their snapshots can be removed when the transaction commits.
+    :param session: The database session.
+    :param flush_context: The flush context, not used.
+    :return: Returns nothing.
+    """
+    changed = session.info.setdefault('changed_users', set())
+    for instance in session.dirty | session.deleted:
+        if isinstance(instance, User):
+            state = inspect(instance)
+            if instance in session.deleted or any(state.attrs[name].history.has_changes()
+                                                  for name in ('email', 'admin', 'locked')):
+                changed.add(int(instance.id))
+
+
+def track_bulk_user_changes(orm_execute_state):
+    """
+    This function is used to record a bulk UPDATE or DELETE statement on the users table.
+    :param orm_execute_state: The ORM execution state.
+    :return: Returns nothing.
+    """
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.local_table is User.__table__:
+            orm_execute_state.session.info.setdefault('changed_users', set()).add(ALL_USERS)
+
+
+def invalidate_users(session):
+    """
+    This function is used to remove the snapshots of the users changed by a committed transaction.
+    :param session: The database session.
+    :return: Returns nothing.
+    """
+    changed = session.info.pop('changed_users', None)
+    if changed and has_app_context() and 'surreylm_user_cache' in current_app.extensions:
+        users = current_app.extensions['surreylm_user_cache']
+        if ALL_USERS in changed:
+            users.clear()
+        else:
+            for user_id in changed:
+                users.delete(user_id)
+
+
+def discard_user_changes(session, previous_transaction):
+    """
+    This function is used to forget the recorded user changes when a transaction is rolled back.
+    :param session: The database session.
+    :param previous_transaction: The transaction that was rolled back, not used.
+    :return: Returns nothing.
+    """
+    session.info.pop('changed_users', None)
@@ -12,6 +12,15 @@ class Validate:
         self.phone_number = phone_number
         self.phone_ext = phone_ext
 
+    @classmethod
+    def error(cls, message):
+        """
+        This function is used to report a validation error to the user.
+        :param message: The error message.
+        :return: Returns nothing.
+        """
+        flash(message, category='error')
+
     @classmethod
     def password(cls, password1, password2, first_name, last_name):
         """
@@ -24,13 +33,13 @@ class Validate:
         """
         password_valid = False
         if len(password1) < 7:
-            flash('Password must be at least 7 characters.', category='error')
+            cls.error('Password must be at least 7 characters.')
         elif str(password1).lower() == "password":
-            flash('Password cannot be "password".', category='error')
+            cls.error('Password cannot be "password".')
         elif password1 != password2:
-            flash('Passwords don\'t match.', category='error')
+            cls.error('Passwords don\'t match.')
         elif str(password1).lower() == str(first_name).lower() or str(password1).lower() == str(last_name).lower():
-            flash('Password cannot be your first or last name.', category='error')
+            cls.error('Password cannot be your first or last name.')
         else:
             password_valid = True
         return password_valid
@@ -44,7 +53,7 @@ class Validate:
         """
         email_valid = False
         if len(email) < 4:
-            flash('Email must be greater than 3 characters.', category='error')
+            cls.error('Email must be greater than 3 characters.')
         else:
             email_valid = True
         return email_valid
@@ -59,11 +68,11 @@ class Validate:
         """
         people_name_valid = False
         if len(first_name) > 50 or len(first_name) < 1:
-            flash('First name must be less than 50 characters and greater than 0', category='error')
+            cls.error('First name must be less than 50 characters and greater than 0')
         elif len(last_name) > 50 or len(last_name) < 1:
-            flash('Last name must be less than 50 characters and greater than 0.', category='error')
+            cls.error('Last name must be less than 50 characters and greater than 0.')
         elif not first_name.isalpha() or not last_name.isalpha():
-            flash('Names must only contain letters.', category='error')
+            cls.error('Names must only contain letters.')
         else:
             people_name_valid = True
         return people_name_valid
@@ -77,7 +86,7 @@ class Validate:
         """
         generic_entry_valid = False
         if len(entry) < 1 or len(entry) > 50:
-            flash('Entries must be greater than 1 character and less than 50.', category='error')
+            cls.error('Entries must be greater than 1 character and less than 50.')
         else:
             generic_entry_valid = True
         return generic_entry_valid
@@ -91,9 +100,9 @@ class Validate:
         """
         phone_number_valid = False
         if len(phone_number) != 11:
-            flash('Phone number must be 11 digits.', category='error')
+            cls.error('Phone number must be 11 digits.')
         elif not phone_number.isnumeric():
-            flash('Phone number must only contain numbers.', category='error')
+            cls.error('Phone number must only contain numbers.')
         else:
             phone_number_valid = True
         return phone_number_valid
@@ -107,9 +116,9 @@ class Validate:
         """
         phone_ext_valid = False
         if len(phone_ext) != 4:
-            flash('Phone extension must be 4 digits.', category='error')
+            cls.error('Phone extension must be 4 digits.')
         elif not phone_ext.isnumeric():
-            flash('Phone extension must only contain numbers.', category='error')
+            cls.error('Phone extension must only contain numbers.')
         else:
             phone_ext_valid = True
         return phone_ext_valid
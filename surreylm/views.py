@@ -3,51 +3,158 @@ vendors. It also contains the functions that are used to validate user input."""
 
 # Imports the required modules.
 import datetime
-from dateutil import relativedelta
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+import io
+import logging
+from flask import (Blueprint, render_template, request, flash, redirect, url_for, current_app, abort, Response,
+                   stream_with_context, jsonify)
 from flask_login import login_required, current_user
-from sqlalchemy import func, exc
+from sqlalchemy import exc
+from sqlalchemy.orm import exc as orm_exc
 from . import db
-from surreylm.database_models import Vendor, Software_owner, Software
+from surreylm.database_models import Vendor, Software_owner, Software, normalize, version_conflict
 from surreylm.validations import Validate
-from . import create_app
+from surreylm.audit import audit, audit_page, changed_fields
+from surreylm.queries import (cached_software_page, software_query, owner_detail, vendor_detail,
+                              cached_owner_summaries, cached_vendor_summaries)
+from surreylm.pagination import page_size
+from surreylm.log_reader import read_log_page, LOG_LEVELS
+from surreylm.importer import import_software, iter_rows
+from surreylm.exporter import export_lines, EXPORT_FORMATS
+from surreylm.db_pool import pool_stats
+from surreylm.search import search_software
+from surreylm.query_budget import query_budget
+from surreylm.bulk_update import BULK_ACTIONS, add_months, bulk_update_software, summarize_ids
+from surreylm.archive import archive_page, restore_software
 
 views = Blueprint('views', __name__)  # Creates a Blueprint object called 'views'.
 
 
+def parse_datetime(value):
+    """
+    This function is used to parse a date or datetime from a form input.
+    :param value: The date ('YYYY-MM-DD') or datetime ('YYYY-MM-DDTHH:MM') string, may be None.
+    :return: Returns the datetime, or None if the value is empty or not valid.
+    """
+    try:
+        return datetime.datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
 @views.route('/')
 @login_required
 def home():
     """
     This function is used to render the home page.
-    :return: Returns the home page, currently logged-in user, the current date, 1 month from the current date and all
-     software records from the database.
+    :return: Returns the home page, currently logged-in user, one page of software records from the database, sorted
+     and filtered by the request arguments, and the number of records in each license status.
+    """
+    page, sort, order, counts = cached_software_page(request.args)
+    filters = {key: request.args[key] for key in ('name', 'vendor_id', 'owner_id', 'per_page') if request.args.get(key)}
+    return render_template("home.html", user=current_user, software=page.items, page=page, sort=sort, order=order,
+                           filters=filters, status=request.args.get('status'), counts=counts)
+
+
+@views.route('/search')
+@login_required
+def search():
+    """
+    This function is used to search software records by name, version, vendor and owner.
+    :return: Returns the search page, currently logged-in user, the search query, one page of matching software
+    records ordered by relevance and the page number.
+    """
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    results, has_next = search_software(query, page)
+    return render_template("search.html", user=current_user, query=query, software=results, page=page,
+                           has_next=has_next)
+
+
+def selected(model, value):
+    """
+    This function is used to look up the vendor or owner chosen in a typeahead field. The field holds the id of the
+    record chosen from the matches, and is empty if a name was typed without choosing one.
+    :param model: The model of the record, Vendor or Software_owner.
+    :param value: The submitted id.
+    :return: Returns the record, or None if no existing record was chosen.
+    """
+    try:
+        return db.session.get(model, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def render_edit_software(software):
+    """
+    This function is used to render the edit software form for a software record.
+    :param software: The software record, with its vendor and owner loaded.
+    :return: Returns the edit software page, currently logged-in user and the software record to be edited. The current
+    vendor, owner and license expiry date are also passed to the page to be used in the form as the default
+    pre-selected values.
+    """
+    return render_template("edit_software.html", user=current_user, software=software,
+                           current_vendor=software.vendor.name, current_vendor_id=software.vendor.id,
+                           current_date=software.license_expiry.strftime('%Y-%m-%d'),
+                           current_owner=software.owner.first_name + ' ' + software.owner.last_name,
+                           current_owner_id=software.owner.id)
+
+
+def edit_conflict(record_type, id, current):
+    """
+    This function is used to tell the user that the record they were editing was changed by someone else, so their
+    changes were not saved, and what the record holds now.
+    :param record_type: The type of record, e.g. 'software', 'vendor' or 'owner'.
+    :param id: The id of the record.
+    :param current: A dictionary of field label to the record's current value.
+    :return: Returns nothing.
+    """
+    values = ', '.join(f'{label}: {value}' for label, value in current.items())
+    flash(f'This {record_type} record was changed by someone else while you were editing it, so your changes have not '
+          f'been saved. It now reads {values}. Make your changes again below.', category='error')
+    audit('update_conflict', f'{current_user.email} - Update to {record_type} record {id} rejected because it was '
+                             f'changed by another user.', record_type, id, level=logging.WARNING)
+
+
+def software_values(software):
+    """
+    This function is used to list the values of a software record shown in an edit conflict message.
+    :param software: The software record, with its vendor and owner loaded.
+    :return: Returns a dictionary of field label to value.
+    """
+    return {'name': software.name, 'version': software.version,
+            'expiry date': software.license_expiry.strftime('%d/%m/%Y'), 'vendor': software.vendor.name,
+            'owner': f'{software.owner.first_name} {software.owner.last_name}'}
+
+
+def owner_values(owner):
+    """
+    This function is used to list the values of an owner record shown in an edit conflict message.
+    :param owner: The owner record.
+    :return: Returns a dictionary of field label to value.
+    """
+    return {'name': f'{owner.first_name} {owner.last_name}', 'email': owner.email,
+            'phone extension': owner.phone_extension}
+
+
+def vendor_values(vendor):
+    """
+    This function is used to list the values of a vendor record shown in an edit conflict message.
+    :param vendor: The vendor record.
+    :return: Returns a dictionary of field label to value.
     """
-    software = Software.query.all()
-    today = datetime.datetime.today()
-    add_month = today + relativedelta.relativedelta(months=+1)
-    return render_template("home.html", user=current_user, software=software, today=today,
-                           add_month=add_month)
+    return {'name': vendor.name, 'email': vendor.email, 'phone': vendor.phone}
 
 
 @views.route('/edit_software/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_software(id):
     """
-    This function is used to edit software records.
+    This function is used to edit software records. The form carries the row_version it was loaded with, and the
+    UPDATE only matches that version, so an edit made meanwhile by someone else is reported rather than overwritten.
     :param id: The id of the software record to be edited, passed from the home page.
-    :return: The edit software page, currently logged-in user, the software record to be edited and all vendors and
-    owners. The current vendor, owner and license expiry date are also passed to the page to be used in the form as
-    the default pre-selected values.
+    :return: The edit software page, or the home page once the record has been updated.
     """
-    software = Software.query.get_or_404(id)
-    current_vendor = software.vendor.name
-    current_vendor_id = software.vendor.id
-    current_date = software.license_expiry.strftime('%Y-%m-%d')
-    vendors = Vendor.query.all()
-    owners = Software_owner.query.all()
-    current_owner = software.owner.first_name + ' ' + software.owner.last_name
-    current_owner_id = software.owner.id
+    software = software_query().filter(Software.id == id).first_or_404()  # Loads the vendor and owner too.
 
     if request.method == 'POST':
         name = request.form.get('name')
@@ -60,28 +167,42 @@ def edit_software(id):
         software_version_valid = Validate.generic_entry(version)
 
         if not software_name_valid or not software_version_valid:
-            create_app().logger.info(f'{current_user} failed to update software record {software.id} because input '
-                                     f'validation checks failed.')
-            return render_template("edit_software.html", user=current_user, software=software,
-                                   vendors=vendors, owners=owners, current_vendor=current_vendor,
-                                   current_owner=current_owner, current_date=current_date,
-                                   current_vendor_id=current_vendor_id, current_owner_id=current_owner_id)
+            audit('update_failed', f'{current_user.email} failed to update software record {software.id} because '
+                                   f'input validation checks failed.', 'software', software.id)
+            return render_edit_software(software)
+        elif not license_expiry:
+            flash('Please enter a license expiry date.', category='error')
+            return render_edit_software(software)
+        elif selected(Vendor, vendor) is None:
+            flash('Please select a vendor from the list.', category='error')
+            return render_edit_software(software)
+        elif selected(Software_owner, owner) is None:
+            flash('Please select an owner from the list.', category='error')
+            return render_edit_software(software)
+        elif version_conflict(software, request.form.get('row_version', type=int)):
+            edit_conflict('software', id, software_values(software))
+            return render_edit_software(software)
         else:
             year, month, day = license_expiry.split('-')
-            converted_date = datetime.date(int(year), int(month), int(day))
+            converted_date = datetime.datetime(int(year), int(month), int(day))
             software.name = name
             software.version = version
             software.license_expiry = converted_date
-            software.vendor_id = vendor
-            software.owner_id = owner
-            create_app().logger.info(f'Software record {software.id} hs been updated by- {current_user.email}.')
-            db.session.commit()
+            software.vendor_id = int(vendor)
+            software.owner_id = int(owner)
+            changes = changed_fields(software, ('name', 'version', 'license_expiry', 'vendor_id', 'owner_id'))
+            try:
+                db.session.commit()
+            except orm_exc.StaleDataError:  # Another request updated the record after it was loaded above.
+                db.session.rollback()
+                software = software_query().filter(Software.id == id).first_or_404()
+                edit_conflict('software', id, software_values(software))
+                return render_edit_software(software)
+            audit('update', f'Software record {software.id} has been updated by- {current_user.email}.', 'software',
+                  software.id, changes=changes)
             flash('Software updated!', category='success')
             return redirect(url_for('views.home'))
-    return render_template("edit_software.html", user=current_user, software=software,
-                           vendors=vendors, owners=owners, current_vendor=current_vendor, current_owner=current_owner,
-                           current_date=current_date, current_vendor_id=current_vendor_id,
-                           current_owner_id=current_owner_id)
+    return render_edit_software(software)
 
 
 @views.route('/add_vendor', methods=['GET', 'POST'])
@@ -96,7 +217,7 @@ def add_vendor():
         phone = request.form.get('phone')
         email = request.form.get('email')
 
-        vendor = Vendor.query.filter(func.lower(Vendor.name) == func.lower(name)).first()
+        vendor = Vendor.query.filter_by(name_normalized=normalize(name)).first()
         vendor_name_valid = Validate.generic_entry(name)
         vendor_phone_valid = Validate.phone_number(phone)
         vendor_email_valid = Validate.email(email)
@@ -108,8 +229,13 @@ def add_vendor():
         else:
             new_vendor = Vendor(name=name, phone=phone, email=email)
             db.session.add(new_vendor)
-            create_app().logger.info(f'New vendor {name} added by- {current_user.email}.')
-            db.session.commit()
+            try:
+                db.session.commit()
+            except exc.IntegrityError:  # Another request added the same vendor since the check above.
+                db.session.rollback()
+                flash('Vendor already exists.', category='error')
+                return render_template("add_manufacturer.html", user=current_user)
+            audit('add', f'New vendor {name} added by- {current_user.email}.', 'vendor', new_vendor.id)
             flash('Vendor added!', category='success')
             return redirect(url_for('views.home'))
 
@@ -129,7 +255,7 @@ def add_owner():
         last_name = request.form.get('last_name')
         phone_extension = request.form.get('phone_extension')
 
-        owner = Software_owner.query.filter(func.lower(Software_owner.email) == func.lower(email)).first()
+        owner = Software_owner.query.filter_by(email_normalized=normalize(email)).first()
         owner_name_valid = Validate.people_name(first_name, last_name)
         owner_email_valid = Validate.email(email)
         owner_phone_ext_valid = Validate.phone_ext(phone_extension)
@@ -142,8 +268,14 @@ def add_owner():
             new_owner = Software_owner(email=email, first_name=first_name, last_name=last_name,
                                        phone_extension=phone_extension)
             db.session.add(new_owner)
-            create_app().logger.info(f'New owner {first_name} {last_name} added by - {current_user.email}.')
-            db.session.commit()
+            try:
+                db.session.commit()
+            except exc.IntegrityError:  # Another request added the same owner since the check above.
+                db.session.rollback()
+                flash('Software owner already exists.', category='error')
+                return render_template("add_owner.html", user=current_user)
+            audit('add', f'New owner {first_name} {last_name} added by - {current_user.email}.', 'owner',
+                  new_owner.id)
             flash('Owner added!', category='success')
             return redirect(url_for('views.home'))
     return render_template("add_owner.html", user=current_user)
@@ -154,11 +286,9 @@ def add_owner():
 def add_software():
     """
     This function is used to add new software to the database.
-    :return: Returns the add software page, currently logged-in user, all vendors and owner records from the database.
+    :return: Returns the add software page and currently logged-in user. Vendors and owners are chosen through the
+    typeahead lookups, so the page does not list them.
     """
-    vendors = Vendor.query.all()
-    owners = Software_owner.query.all()
-
     if request.method == 'POST':
         name = request.form.get('name')
         version = request.form.get('version')
@@ -170,24 +300,116 @@ def add_software():
         software_version_valid = Validate.generic_entry(version)
 
         if not software_name_valid or not software_version_valid:
-            return render_template("add_license.html", user=current_user, vendors=vendors, owners=owners)
+            return render_template("add_license.html", user=current_user)
         elif license_expiry == '':
             flash('Please enter a license expiry date.', category='error')
-        elif vendor == 'Choose...':
-            flash('Please select a vendor.', category='error')
-        elif owner == 'Choose...':
-            flash('Please select an owner.', category='error')
+        elif selected(Vendor, vendor) is None:
+            flash('Please select a vendor from the list.', category='error')
+        elif selected(Software_owner, owner) is None:
+            flash('Please select an owner from the list.', category='error')
         else:
             year, month, day = license_expiry.split('-')
             converted_date = datetime.date(int(year), int(month), int(day))
-            new_software = Software(name=name, version=version, license_expiry=converted_date, vendor_id=vendor,
-                                    owner_id=owner)
+            new_software = Software(name=name, version=version, license_expiry=converted_date, vendor_id=int(vendor),
+                                    owner_id=int(owner))
             db.session.add(new_software)
-            create_app().logger.info(f'New software {name} added by- {current_user.email}.')
             db.session.commit()
+            audit('add', f'New software {name} added by- {current_user.email}.', 'software', new_software.id)
             flash('Software added!', category='success')
             return redirect(url_for('views.home'))
-    return render_template("add_license.html", user=current_user, vendors=vendors, owners=owners)
+    return render_template("add_license.html", user=current_user)
+
+
+@views.route('/import_software', methods=['GET', 'POST'])
+@login_required
+@query_budget(None)  # An import runs a statement per batch of rows, however large the file.
+def import_software_file():
+    """
+    This function is used to import software records in bulk from an uploaded CSV or JSON file.
+    :return: Returns the import software page, currently logged-in user and the import result, if a file was uploaded.
+    """
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        file_format = upload.filename.rsplit('.', 1)[-1].lower() if upload and upload.filename else ''
+        if file_format not in ('csv', 'json', 'jsonl'):
+            flash('Please choose a .csv or .json file to import.', category='error')
+        else:
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            result = import_software(iter_rows(stream, file_format))
+            audit('import', f'{result.imported} software records imported from {upload.filename} by- '
+                            f'{current_user.email} with {len(result.errors)} rows rejected.', 'software')
+            flash(f'{result.imported} software records imported.', category='success')
+    return render_template("import_software.html", user=current_user, result=result)
+
+
+@views.route('/export_software.<file_format>')
+@login_required
+def export_software(file_format):
+    """
+    This function is used to download the software records as CSV or JSON Lines. The file is streamed as it is read
+    from the database, so the download starts straight away. The home page filters can be passed as arguments.
+    :param file_format: 'csv' or 'jsonl'.
+    :return: Returns the streamed file.
+    """
+    if file_format not in EXPORT_FORMATS:
+        abort(404)
+    audit('export', f'Software records exported as {file_format} by- {current_user.email}.', 'software')
+    return Response(stream_with_context(export_lines(file_format, request.args)),
+                    mimetype=EXPORT_FORMATS[file_format],
+                    headers={'Content-Disposition': f'attachment; filename=licenses.{file_format}'})
+
+
+@views.route('/bulk_update_software', methods=['POST'])
+@login_required
+def bulk_update():
+    """
+    This function is used to extend, set the expiry date of, or reassign the owner or vendor of several software
+    records at once. The records are the ticked ids, or every record matching the home page filters when the scope is
+    'filter', which needs at least one filter set. The change is made with one UPDATE and recorded with one audit entry.
+    :return: Redirects back to the home page.
+    """
+    action = request.form.get('action')
+    months = request.form.get('months', type=int)
+    expiry = parse_datetime(request.form.get('expiry_date'))
+    owner_id = request.form.get('owner', type=int)
+    vendor_id = request.form.get('vendor', type=int)
+    if action not in BULK_ACTIONS:
+        flash('Please choose a bulk action.', category='error')
+        return redirect(request.referrer or url_for('views.home'))
+    elif action == 'extend' and months and 0 < months <= 120:
+        values = {Software.license_expiry: add_months(Software.license_expiry, months)}
+        change = f'extended by {months} months'
+    elif action == 'set_expiry' and expiry:
+        values = {Software.license_expiry: expiry}
+        change = f'set to expire on {expiry:%Y-%m-%d}'
+    elif action == 'reassign_owner' and owner_id and db.session.get(Software_owner, owner_id):
+        values = {Software.owner_id: owner_id}
+        change = f'reassigned to owner {owner_id}'
+    elif action == 'reassign_vendor' and vendor_id and db.session.get(Vendor, vendor_id):
+        values = {Software.vendor_id: vendor_id}
+        change = f'reassigned to vendor {vendor_id}'
+    else:
+        flash('Please choose a valid number of months (1-120), date, owner or vendor.', category='error')
+        return redirect(request.referrer or url_for('views.home'))
+
+    if request.form.get('scope') == 'filter':
+        if not any(request.form.get(key) for key in ('name', 'vendor_id', 'owner_id', 'status')):
+            # Without a filter every license would be changed.
+            flash('Please filter the license list before changing every matching license.', category='error')
+            return redirect(request.referrer or url_for('views.home'))
+        changed = bulk_update_software(values, filters=request.form)
+    else:
+        ids = [int(id) for id in request.form.getlist('ids') if id.isdigit()]
+        if not ids:
+            flash('Please tick the licenses to change.', category='error')
+            return redirect(request.referrer or url_for('views.home'))
+        changed = bulk_update_software(values, ids=ids)
+    if changed:
+        audit('bulk_update', f'{len(changed)} software records {change} by- {current_user.email}. '
+                             f'Records: {summarize_ids(changed)}.', 'software')
+    flash(f'{len(changed)} licenses {change}.', category='success')
+    return redirect(request.referrer or url_for('views.home'))
 
 
 @views.route('/delete_software/<int:id>', methods=['GET', 'POST'])
@@ -201,28 +423,67 @@ def delete_software(id):
     software = Software.query.get_or_404(id)
     if current_user.admin:  # Checks if the current user is an admin.
         db.session.delete(software)
-        create_app().logger.info(f'Software record {software.id} has been deleted by- {current_user.email}.')
         db.session.commit()
+        audit('delete', f'Software record {id} has been deleted by- {current_user.email}.', 'software', id)
         flash('Software deleted!', category='success')
         return redirect(url_for('views.home'))
     else:
         flash('You do not have permission to delete software.', category='error')
-        create_app().logger.warning(f'{current_user.email} - Attempt to delete software record {software.id} failed '
-                                 f'due to insufficient permissions.')
+        audit('delete_denied', f'{current_user.email} - Attempt to delete software record {software.id} failed '
+                               f'due to insufficient permissions.', 'software', software.id, level=logging.WARNING)
         return redirect(url_for('views.home'))
 
 
+@views.route('/history')
+@login_required
+def history():
+    """
+    This function is used to view the archived licenses, which expired long ago and were moved out of the software
+    list.
+    :return: Returns the history page, currently logged-in user, one page of archived licenses, most recently expired
+    first, and the filters applied.
+    """
+    page = archive_page(request.args)
+    filters = {key: request.args[key] for key in ('name', 'vendor_id', 'owner_id', 'per_page') if request.args.get(key)}
+    return render_template("history.html", user=current_user, software=page.items, page=page, filters=filters)
+
+
+@views.route('/restore_software/<int:id>', methods=['POST'])
+@login_required
+def restore(id):
+    """
+    This function is used to move an archived license back into the software list.
+    :param id: The id of the archived record to be restored, passed from the history page.
+    :return: Returns the edit software page for the restored record, so its expiry date can be updated.
+    """
+    if not current_user.admin:
+        flash('You do not have permission to restore software.', category='error')
+        audit('restore_denied', f'{current_user.email} - Attempt to restore archived software record {id} failed '
+                                f'due to insufficient permissions.', 'software', level=logging.WARNING)
+        return redirect(url_for('views.history'))
+    software_id = restore_software(id)
+    if software_id is None:
+        abort(404)
+    audit('restore', f'Archived software record {id} has been restored as software record {software_id} by- '
+                     f'{current_user.email}.', 'software', software_id)
+    flash('Software restored! Update its expiry date, or it will be archived again.', category='success')
+    return redirect(url_for('views.edit_software', id=software_id))
+
+
 @views.route('/view_owner/<int:id>', methods=['GET', 'POST'])
 @login_required
 def view_owner(id):
     """
     This function is used to view owner records.
     :param id: The id of the owner record to be viewed, passed from the home page.
-    :return: Returns the view owner page, currently logged-in user, the owner record to be viewed.
+    :return: Returns the view owner page, currently logged-in user, the owner record to be viewed, their license counts
+    and next expiry date, and their software with its vendors, all read in one query.
     """
-    software = Software.query.filter_by(owner_id=id).all()
-    owner = Software_owner.query.get_or_404(id)
-    return render_template("view_owner.html", user=current_user, owner=owner, software=software)
+    owner = owner_detail(id)
+    if owner is None:
+        abort(404)
+    owner, summary, software = owner
+    return render_template("view_owner.html", user=current_user, owner=owner, summary=summary, software=software)
 
 
 @views.route('/view_vendor/<int:id>', methods=['GET', 'POST'])
@@ -231,18 +492,22 @@ def view_vendor(id):
     """
     This function is used to view vendor records.
     :param id: The id of the vendor record to be viewed, passed from the home page.
-    :return: Returns the view vendor page, currently logged-in user, the vendor record to be viewed.
+    :return: Returns the view vendor page, currently logged-in user, the vendor record to be viewed, its license counts
+    and next expiry date, and its software with its owners, all read in one query.
     """
-    software = Software.query.filter_by(vendor_id=id).all()
-    vendor = Vendor.query.get_or_404(id)
-    return render_template("view_vendor.html", user=current_user, vendor=vendor, software=software)
+    vendor = vendor_detail(id)
+    if vendor is None:
+        abort(404)
+    vendor, summary, software = vendor
+    return render_template("view_vendor.html", user=current_user, vendor=vendor, summary=summary, software=software)
 
 
 @views.route('/edit_owner/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_owner(id):
     """
-    This function is used to edit owner records.
+    This function is used to edit owner records. Edits made meanwhile by someone else are reported rather than
+    overwritten, as for software records.
     :param id: The id of the owner record to be edited, passed from the view owner page.
     :return: Returns the edit owner page, currently logged-in user, the owner record to be edited.
     """
@@ -257,15 +522,35 @@ def edit_owner(id):
         owner_email_valid = Validate.email(email)
         owner_phone_ext_valid = Validate.phone_ext(phone_extension)
 
+        duplicate = Software_owner.query.filter(Software_owner.email_normalized == normalize(email),
+                                                Software_owner.id != id).first()
+        if duplicate:
+            flash('Software owner already exists.', category='error')
+            return render_template("edit_owner.html", user=current_user, owner=owner)
         if not owner_name_valid or not owner_email_valid or not owner_phone_ext_valid:
             return render_template("edit_owner.html", user=current_user, owner=owner)
+        if version_conflict(owner, request.form.get('row_version', type=int)):
+            edit_conflict('owner', id, owner_values(owner))
+            return render_template("edit_owner.html", user=current_user, owner=owner)
 
         owner.email = email
         owner.first_name = first_name
         owner.last_name = last_name
         owner.phone_extension = phone_extension
-        create_app().logger.info(f'Owner record {owner.id} has been updated by- {current_user.email}.')
-        db.session.commit()
+        changes = changed_fields(owner, ('email', 'first_name', 'last_name', 'phone_extension'))
+        try:
+            db.session.commit()
+        except exc.IntegrityError:  # Another request took the email since the check above.
+            db.session.rollback()
+            flash('Software owner already exists.', category='error')
+            return redirect(url_for('views.edit_owner', id=id))
+        except orm_exc.StaleDataError:  # Another request updated the owner after it was loaded above.
+            db.session.rollback()
+            owner = Software_owner.query.filter(Software_owner.id == id).first_or_404()
+            edit_conflict('owner', id, owner_values(owner))
+            return render_template("edit_owner.html", user=current_user, owner=owner)
+        audit('update', f'Owner record {owner.id} has been updated by- {current_user.email}.', 'owner', owner.id,
+              changes=changes)
         flash('Owner updated!', category='success')
         return redirect(url_for('views.view_owner', id=id))
     return render_template("edit_owner.html", user=current_user, owner=owner)
@@ -275,7 +560,8 @@ def edit_owner(id):
 @login_required
 def edit_vendor(id):
     """
-    This function is used to edit vendor records.
+    This function is used to edit vendor records. Edits made meanwhile by someone else are reported rather than
+    overwritten, as for software records.
     :param id: The id of the vendor record to be edited, passed from the view vendor page.
     :return: Returns the edit vendor page, currently logged-in user, the vendor record to be edited.
     """
@@ -289,14 +575,33 @@ def edit_vendor(id):
         vendor_phone_valid = Validate.phone_number(phone)
         vendor_email_valid = Validate.email(email)
 
+        duplicate = Vendor.query.filter(Vendor.name_normalized == normalize(name), Vendor.id != id).first()
+        if duplicate:
+            flash('Vendor already exists.', category='error')
+            return render_template("edit_vendor.html", user=current_user, vendor=vendor)
         if not vendor_name_valid or not vendor_phone_valid or not vendor_email_valid:
             return render_template("edit_vendor.html", user=current_user, vendor=vendor)
+        if version_conflict(vendor, request.form.get('row_version', type=int)):
+            edit_conflict('vendor', id, vendor_values(vendor))
+            return render_template("edit_vendor.html", user=current_user, vendor=vendor)
 
         vendor.name = name
         vendor.phone = phone
         vendor.email = email
-        create_app().logger.info(f'Vendor record {vendor.id} has been updated by- {current_user.email}.')
-        db.session.commit()
+        changes = changed_fields(vendor, ('name', 'phone', 'email'))
+        try:
+            db.session.commit()
+        except exc.IntegrityError:  # Another request took the name since the check above.
+            db.session.rollback()
+            flash('Vendor already exists.', category='error')
+            return redirect(url_for('views.edit_vendor', id=id))
+        except orm_exc.StaleDataError:  # Another request updated the vendor after it was loaded above.
+            db.session.rollback()
+            vendor = Vendor.query.filter(Vendor.id == id).first_or_404()
+            edit_conflict('vendor', id, vendor_values(vendor))
+            return render_template("edit_vendor.html", user=current_user, vendor=vendor)
+        audit('update', f'Vendor record {vendor.id} has been updated by- {current_user.email}.', 'vendor', vendor.id,
+              changes=changes)
         flash('Vendor updated!', category='success')
         return redirect(url_for('views.view_vendor', id=id))
     return render_template("edit_vendor.html", user=current_user, vendor=vendor)
@@ -307,9 +612,10 @@ def edit_vendor(id):
 def all_owners():
     """
     This function is used to view all owner records.
-    :return: Returns the all owners page, currently logged-in user, all owner records from the database.
+    :return: Returns the all owners page, currently logged-in user, all owner records from the database with their
+    license counts and next expiry date.
     """
-    owners = Software_owner.query.all()
+    owners = cached_owner_summaries()
     return render_template("all_owners.html", user=current_user, owners=owners)
 
 
@@ -325,19 +631,20 @@ def delete_owner(id):
     if current_user.admin:  # Checks if the current user is an admin.
         try:
             db.session.delete(owner)
-            create_app().logger.info(f'Owner record {owner.id} has been deleted by- {current_user.email}.')
             db.session.commit()
+            audit('delete', f'Owner record {id} has been deleted by- {current_user.email}.', 'owner', id)
             flash('Owner deleted!', category='success')
             return redirect(url_for('views.all_owners'))
         except exc.IntegrityError:  # Handles the error if the owner is attached to existing software.
+            db.session.rollback()
             flash('Owner cannot be deleted as they own existing software.', category='error')
-            create_app().logger.warning(f'{current_user.email} - Attempt to delete owner record {owner.id} failed due'
-                                        f' to being attached to existing software record.')
+            audit('delete_failed', f'{current_user.email} - Attempt to delete owner record {id} failed due to being '
+                                   f'attached to existing software record.', 'owner', id, level=logging.WARNING)
             return redirect(url_for('views.all_owners'))
     else:
         flash('You do not have permission to delete owners.', category='error')
-        create_app().logger.warning(f'{current_user.email} - Attempt to delete owner record {owner.id} failed due to '
-                                    f'insufficient permissions.')
+        audit('delete_denied', f'{current_user.email} - Attempt to delete owner record {owner.id} failed due to '
+                               f'insufficient permissions.', 'owner', owner.id, level=logging.WARNING)
         return redirect(url_for('views.all_owners'))
 
 
@@ -346,9 +653,10 @@ def delete_owner(id):
 def all_vendors():
     """
     This function is used to view all vendor records.
-    :return: Returns the all vendors page, currently logged-in user, all vendor records from the database.
+    :return: Returns the all vendors page, currently logged-in user, all vendor records from the database with their
+    license counts and next expiry date.
     """
-    vendors = Vendor.query.all()
+    vendors = cached_vendor_summaries()
     return render_template("all_vendors.html", user=current_user, vendors=vendors)
 
 
@@ -364,33 +672,107 @@ def delete_vendor(id):
     if current_user.admin:  # Checks if the current user is an admin.
         try:
             db.session.delete(vendor)
-            create_app().logger.info(f'Vendor record {vendor.id} has been deleted by- {current_user.email}.')
             db.session.commit()
+            audit('delete', f'Vendor record {id} has been deleted by- {current_user.email}.', 'vendor', id)
             flash('Vendor deleted!', category='success')
             return redirect(url_for('views.all_vendors'))
         except exc.IntegrityError:  # Handles the error if the vendor is attached to existing software.
+            db.session.rollback()
             flash('Vendor cannot be deleted because it is attached to existing software.', category='error')
-            create_app().logger.warning(f'{current_user.email} - Attempt to delete vendor record {vendor.id} failed due '
-                                        f'to being attached to existing software record.')
+            audit('delete_failed', f'{current_user.email} - Attempt to delete vendor record {id} failed due to being '
+                                   f'attached to existing software record.', 'vendor', id, level=logging.WARNING)
             return redirect(url_for('views.all_vendors'))
     else:
         flash('You do not have permission to delete vendors.', category='error')
-        create_app().logger.warning(f'{current_user.email} - Attempt to delete vendor record {vendor.id} failed due to '
-                                    f'insufficient permissions.')
+        audit('delete_denied', f'{current_user.email} - Attempt to delete vendor record {vendor.id} failed due to '
+                               f'insufficient permissions.', 'vendor', vendor.id, level=logging.WARNING)
         return redirect(url_for('views.all_vendors'))
 
 @views.route('/logs', methods=['GET', 'POST'])
 @login_required
 def logs():
     """
-    This function is used to view the application logs.
-    :return: Returns the logs page, currently logged-in user.
+    This function is used to view the application logs, newest first. The log file is read backwards from the end, so
+    only enough of the file to fill one page is read.
+    :return: Returns the logs page, currently logged-in user, one page of log entries and the filters applied.
     """
     if current_user.admin:
-        with open('record.log', 'r') as file:
-            logs = file.readlines()
-        return render_template("logs.html", user=current_user, logs=logs)
+        filters = {key: request.args[key] for key in ('level', 'email', 'start', 'end') if request.args.get(key)}
+        start = parse_datetime(filters.get('start'))
+        end = parse_datetime(filters.get('end'))
+        page = read_log_page(current_app.config['AUDIT_LOG_FILE'], before=request.args.get('before', type=int),
+                             limit=page_size(request.args.get('per_page')), level=filters.get('level'),
+                             email=filters.get('email'), start=start, end=end)
+        return render_template("logs.html", user=current_user, logs=page.entries, page=page, filters=filters,
+                               levels=LOG_LEVELS)
     else:
         flash('You do not have permission to view logs.', category='error')
-        create_app().logger.warning(f'{current_user.email} - Attempt to view logs failed due to insufficient permissions.')
+        audit('view_logs_denied', f'{current_user.email} - Attempt to view logs failed due to insufficient '
+                                  f'permissions.', level=logging.WARNING)
         return redirect(url_for('views.home'))
+
+
+@views.route('/audit')
+@login_required
+def audit_events():
+    """
+    This function is used to query the audit events, newest first, by record, actor and date range.
+    :return: Returns the audit page, currently logged-in user, one page of audit events and the filters applied.
+    """
+    if not current_user.admin:
+        abort(403)
+    filters = {key: request.args[key] for key in ('record_type', 'record_id', 'actor', 'start', 'end', 'per_page')
+               if request.args.get(key)}
+    cursor = request.args.get('before') or request.args.get('after')
+    page = audit_page(filters.get('record_type'), request.args.get('record_id', type=int), filters.get('actor'),
+                      parse_datetime(filters.get('start')), parse_datetime(filters.get('end')), cursor=cursor,
+                      before=bool(request.args.get('before')), limit=page_size(filters.get('per_page')))
+    return render_template("audit.html", user=current_user, events=page.items, page=page, filters=filters,
+                           record_types=('software', 'vendor', 'owner', 'user'))
+
+
+@views.route('/metrics')
+@login_required
+def metrics():
+    """
+    This function is used to view the request metrics: per endpoint latency histograms, status codes, SQL query counts
+    and database time, with the connection pool gauges.
+    :return: Returns the metrics in the Prometheus text format.
+    """
+    if not current_user.admin:
+        abort(403)
+    pool = pool_stats.as_dict()
+    gauges = {'surreylm_db_pool_in_use': ('Database connections checked out of the pool.', pool['in_use']),
+              'surreylm_db_pool_wait_seconds': ('Total time spent waiting for a database connection.',
+                                                pool['wait_seconds'])}
+    return Response(current_app.extensions['surreylm_metrics'].render(gauges),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@views.route('/startup')
+@login_required
+def startup():
+    """
+    This function is used to view the startup-time report: package import time, the time spent in each phase of
+    create_app and the first request latency.
+    :return: Returns the startup timings as JSON.
+    """
+    if not current_user.admin:
+        abort(403)
+    return jsonify(current_app.extensions['surreylm_startup'].as_dict())
+
+
+@views.route('/db_pool')
+@login_required
+def db_pool():
+    """
+    This function is used to view the database connection pool metrics: checkouts, connections in use and the time
+    spent waiting for a connection.
+    :return: Returns the pool metrics and settings as JSON.
+    """
+    if not current_user.admin:
+        abort(403)
+    settings = {key.lower(): current_app.config[key] for key in ('DB_POOL_SIZE', 'DB_MAX_OVERFLOW', 'DB_POOL_TIMEOUT',
+                                                               'DB_POOL_RECYCLE', 'DB_POOL_PRE_PING',
+                                                               'DB_STATEMENT_TIMEOUT_MS')}
+    return jsonify({'pool': db.engine.pool.status(), 'metrics': pool_stats.as_dict(), 'settings': settings})